@@ -1,7 +1,8 @@
+from datetime import datetime
 from typing import NotRequired, TypedDict, Callable, Literal
 
 
-type HttpMethod = Literal["GET", "POST", "PUT", "DELETE"]
+type HttpMethod = Literal["GET", "POST", "PUT", "DELETE", "PATCH"]
 
 type NoBody = Literal[""]
 
@@ -33,9 +34,10 @@ class Id(TypedDict):
 type SongId = int
 
 
+# datetimes are sent as ISO 8601 strings
 class IdAndTimestamps(Id):
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
 
 class NoPayload(TypedDict):
@@ -49,6 +51,78 @@ class ApiError(TypedDict):
 
 type ApiErrorResponse = tuple[ApiError, int]
 
+# * Uploads
+
+type UploadKind = Literal["song", "image"]
+
+
+class NewUpload(TypedDict):
+    kind: UploadKind
+    filename: str
+    # of the file about to be uploaded, in bytes
+    size: int
+    # hex digest of the file, so a file that is already stored is not uploaded again
+    sha256: NotRequired[str]
+
+
+class PresignedPost(TypedDict):
+    url: str
+    # form fields to send before the file, which goes last in a field named file
+    fields: dict[str, str]
+
+
+class UploadTicket(TypedDict):
+    # pass to the route creating or updating the record once the file is uploaded
+    upload_token: str
+    # where the file is readable once uploaded
+    file_url: str
+    # missing when the file is already stored, the token can be used right away
+    upload: NotRequired[PresignedPost]
+    # seconds the upload policy is valid for
+    expires_in: int
+
+
+# I want to upload a file straight to S3, and attach it to a song, playlist or profile afterwards
+# the upload is checked when its token is used, as song_upload, thumbnail_upload or profile_image_upload
+endpoint("POST", "/api/uploads", req=NewUpload, res=Created[UploadTicket], auth=True)
+
+
+class StoredUpload(TypedDict):
+    upload_token: str
+    file_url: str
+    size: int
+    # hex digest of the file's content, only known for uploads streamed in one request
+    sha256: NotRequired[str]
+
+
+# I want to upload a file through the server when I cannot reach S3, and attach it the same way
+# the request body is the file itself, :kind is song or image
+endpoint("PUT", "/api/uploads/:kind", req=None, res=Created[StoredUpload], qp=["filename"], auth=True)
+
+
+class UploadSessionInfo(TypedDict):
+    id: str
+    # bytes received so far, the next chunk starts here
+    offset: int
+    # size of the whole file
+    length: int
+    # chunks other than the last must be at least this long, and are stored in whole parts of this size
+    part_size: int
+    expires_at: datetime
+
+
+# I want to upload a large file in chunks, and continue where I left off after losing the connection
+endpoint("POST", "/api/uploads/sessions", req=NewUpload, res=Created[UploadSessionInfo], auth=True)
+# where to continue from, also sent as the Upload-Offset header (HEAD works too)
+endpoint("GET", "/api/uploads/sessions/:session_id", req=None, res=UploadSessionInfo, auth=True)
+# the body is the next chunk of the file, with an Upload-Offset header equal to the session's offset
+# answers 409 when the offset does not match, a trailing partial part is not stored
+endpoint("PATCH", "/api/uploads/sessions/:session_id", req=None, res=UploadSessionInfo, auth=True)
+# once offset reaches length, attach the returned token like any other upload token
+endpoint("POST", "/api/uploads/sessions/:session_id/complete", req=None, res=Created[StoredUpload], auth=True)
+endpoint("DELETE", "/api/uploads/sessions/:session_id", req=None, res=Ok[NoBody], auth=True)
+
+
 # * Songs
 
 
@@ -59,8 +133,10 @@ class Song(TypedDict):
 
 
 # I want to be able to upload a song
+# form data with song_upload and optionally thumbnail_upload tokens from POST /api/uploads
 endpoint("POST", "/api/songs", req=Song, res=Created[IdAndTimestamps], auth=True)
 # I want to be able to update a song
+# form data, with a thumbnail_upload token to replace the thumbnail
 endpoint("PUT", "/api/songs/:song_id", req=Song, res=Ok[NoBody], auth=True)
 # I want to be able to delete a song that I posted
 endpoint("DELETE", "/api/songs/:song_id", req=None, res=Ok[NoBody], auth=True)
@@ -71,26 +147,61 @@ class BareUser(TypedDict):
     display_name: str
 
 
+# the song transcoded for streaming, song_ref is the original as uploaded
+class Rendition(TypedDict):
+    name: str
+    url: str
+    content_type: str
+    # bits per second
+    bitrate: int
+    # bytes
+    size: int
+
+
 class GetSong(Song, IdAndTimestamps):
     num_likes: NotRequired[int]
     song_ref: str
     thumb_url: str
     artist: BareUser
+    # smallest first, empty until the song has been processed
+    renditions: list[Rendition]
+    # read from the original, null until the song has been probed
+    duration_ms: int | None
+    # bits per second, averaged over the original
+    bitrate: int | None
+    sample_rate: int | None
+    channels: int | None
+    # eg. mp3, aac, opus, flac, pcm_s16le
+    codec: str | None
+    # 30 seconds of the loudest part at a low bitrate, null until the song has been processed
+    preview_url: str | None
 
 
 # I want to view a song's total likes
 # I want to get song info
 endpoint("GET", "/api/songs/:song_id", req=None, res=GetSong)
 
+# I want to see the shape of a song before it loads
+# buckets (min, max) int8 pairs, buckets is one of 256, 1024 (the default) or 4096
+# 404 until the song has been processed
+endpoint("GET", "/api/songs/:song_id/waveform", req=None, res=bytes, qp=["buckets"])
+
+# I want to play a song, and seek in it without downloading it again
+# the original, or a rendition by name, honours Range requests with 206 Partial Content
+endpoint("GET", "/api/songs/:song_id/stream", req=None, res=bytes, qp=["rendition"])
+
 
 class GetSongs(TypedDict):
     songs: list[GetSong]
+    # opaque token to pass as the cursor query param to get the next page, absent on the last page
+    next_cursor: NotRequired[str]
 
 
 # I want a landing page of other peoples' songs (showing newest first)
 # I want to see all of my songs # ! filter by current session's user_id
 # I want to see other songs by the same artist on a song's page - # ! filter by artist_id
-endpoint("GET", "/api/songs", req=None, res=GetSongs, qp=["artist_id"])
+# paginated, limit defaults to 50 and may be at most 100
+endpoint("GET", "/api/songs", req=None, res=GetSongs, qp=["artist_id", "limit", "cursor"])
 
 # * Playlists
 
@@ -101,9 +212,11 @@ class BasePlaylist(TypedDict):
 
 
 # I want to be able to make a playlist
+# form data, with a thumbnail_upload token to set a thumbnail
 endpoint("POST", "/api/playlists", req=BasePlaylist, res=Created[IdAndTimestamps], auth=True)
 
 # I want to be able to update a playlist (change its name/thumbnail)
+# form data, with a thumbnail_upload token to replace the thumbnail
 endpoint("PUT", "/api/playlists/:playlistId", req=BasePlaylist, res=Ok[NoBody], auth=True)
 
 
@@ -149,11 +262,28 @@ endpoint("GET", "/api/playlists/current", req=None, res=ListOfPlaylist, auth=Tru
 
 
 # I want to get all of my likes
-endpoint("GET", "/api/likes", req=None, res=GetSongs, auth=True)
+# most recently liked first, paginated like GET /api/songs
+endpoint("GET", "/api/likes", req=None, res=GetSongs, qp=["limit", "cursor"], auth=True)
+
+
+class LikedSongIds(TypedDict):
+    # every liked song, most recently liked first
+    song_ids: list[int]
+
+
+# I want to see which songs I liked without loading all of them
+endpoint("GET", "/api/likes/ids", req=None, res=LikedSongIds, auth=True)
+
+
+class LikeStatus(TypedDict):
+    liked: bool
+    # False if the song was already in the requested state
+    changed: bool
 
 
 # I want to be able to like a song and unlike a song
-endpoint(["POST", "DELETE"], "/api/songs/:song_id/likes", req=None, res=None, auth=True)
+# idempotent, repeating a like or unlike succeeds without changing anything
+endpoint(["POST", "DELETE"], "/api/songs/:song_id/likes", req=None, res=LikeStatus, auth=True)
 
 
 # * Comments
@@ -213,11 +343,12 @@ class PostArtist(BaseArtist):
 
 
 class ReturnPostArtist(PostArtist):
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
 
 # if a user posts a song, they can have an artists page
+# form data, with a profile_image_upload token to replace the profile image
 endpoint("POST", "/api/artists", req=PostArtist, res=Ok[ReturnPostArtist], auth=True)
 
 
@@ -261,9 +392,68 @@ class SearchResultDict(TypedDict):
     artist_name: str | None
 
 
+class SearchPage(TypedDict):
+    # present if there are more results of this type, pass back as <type>_cursor
+    next_cursor: NotRequired[str]
+    # number of matches of this type (of typo tolerant ones at most 100), present if counts=true was passed
+    total: NotRequired[int]
+
+
 class SearchResponse(TypedDict):
+    # best matches first within each type, grouped as songs, then artists, then playlists
     results: list[SearchResultDict]
+    pages: dict[Literal["song", "artist", "playlist"], SearchPage]
 
 
 # I want to be able to search by artist, song, or playlist
-endpoint("GET", "/api/search", req=None, res=SearchResponse, qp=["q"])
+# types is a comma separated subset of song,artist,playlist and defaults to all of them
+# limit (default 5) applies per type and can be overridden with <type>_limit, <type>_cursor continues one type
+endpoint(
+    "GET",
+    "/api/search",
+    req=None,
+    res=SearchResponse,
+    qp=[
+        "q",
+        "types",
+        "limit",
+        "counts",
+        "song_limit",
+        "song_cursor",
+        "artist_limit",
+        "artist_cursor",
+        "playlist_limit",
+        "playlist_cursor",
+    ],
+)
+
+
+class Suggestion(TypedDict):
+    type: Literal["song", "artist", "playlist"]
+    id: int
+    name: str
+
+
+class SuggestResponse(TypedDict):
+    suggestions: list[Suggestion]
+
+
+# I want search suggestions as I type, matching the start of any word in a name
+# limit defaults to 8 and may be at most 20
+endpoint("GET", "/api/search/suggest", req=None, res=SuggestResponse, qp=["q", "limit"])
+
+
+class CacheStats(TypedDict):
+    backend: str
+    hits: int
+    misses: int
+    stores: int
+    invalidations: int
+    # only known for the in process backend
+    entries: NotRequired[int]
+    size_bytes: NotRequired[int]
+    evictions: NotRequired[int]
+
+
+# I want to see how well the response cache of the worker serving this request is doing
+endpoint("GET", "/api/cache/stats", req=None, res=CacheStats)
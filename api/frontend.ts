@@ -1,4 +1,4 @@
-type HttpMethod = "GET" | "POST" | "PUT" | "DELETE";
+type HttpMethod = "GET" | "POST" | "PUT" | "DELETE" | "PATCH";
 
 export const RequireAuth = Symbol("RequireAuth");
 
@@ -29,6 +29,14 @@ export type Song = {
 	genre?: string;
 };
 
+export type Rendition = {
+	name: string;
+	url: string;
+	content_type: string;
+	bitrate: number;
+	size: number;
+};
+
 export type GetSong = Song &
 	Id &
 	Timestamps & {
@@ -36,8 +44,15 @@ export type GetSong = Song &
 		thumb_url: string;
 		num_likes: number;
 		artist: { id: number; display_name: string };
+		renditions: Rendition[];
+		duration_ms: number | null;
+		bitrate: number | null;
+		sample_rate: number | null;
+		channels: number | null;
+		codec: string | null;
+		preview_url: string | null;
 	};
-export type GetSongs = { songs: GetSong[] };
+export type GetSongs = { songs: GetSong[]; next_cursor?: string };
 
 export type BasePlaylist = {
 	name: string;
@@ -116,6 +131,13 @@ export type Login = {
 
 export type Signup = { username: string; email: string; password: string };
 
+export type LikedSongIds = { song_ids: number[] };
+
+export type LikeStatus = {
+	liked: boolean;
+	changed: boolean;
+};
+
 export type SearchResultType = "song" | "artist" | "playlist";
 
 export type SearchResult = {
@@ -126,8 +148,66 @@ export type SearchResult = {
 	artist_name: string | null;
 };
 
+export type SearchPage = {
+	next_cursor?: string;
+	total?: number;
+};
+
 export type SearchResponse = {
 	results: SearchResult[];
+	pages: Partial<Record<SearchResultType, SearchPage>>;
+};
+
+export type SearchOptions = {
+	limit?: number;
+	counts?: boolean;
+	cursor?: string;
+};
+
+export type Suggestion = {
+	type: SearchResultType;
+	id: number;
+	name: string;
+};
+
+export type SuggestResponse = {
+	suggestions: Suggestion[];
+};
+
+export type UploadKind = "song" | "image";
+
+export type NewUpload = {
+	kind: UploadKind;
+	filename: string;
+	size: number;
+	// hex digest, so a file that is already stored is not uploaded again
+	sha256?: string;
+};
+
+export type UploadTicket = {
+	upload_token: string;
+	file_url: string;
+	// POST fields then the file (as "file") to url, missing when the file is already stored
+	upload?: { url: string; fields: Record<string, string> };
+	expires_in: number;
+};
+
+export type StoredUpload = {
+	upload_token: string;
+	file_url: string;
+	size: number;
+	// only known for uploads streamed in one request
+	sha256?: string;
+};
+
+export type UploadSessionInfo = {
+	id: string;
+	// bytes received so far, the next chunk starts here
+	offset: number;
+	length: number;
+	// chunks other than the last must be at least this long
+	part_size: number;
+	expires_at: string;
 };
 
 //endpoint definitions
@@ -135,6 +215,10 @@ endpoint<Song, Id & Timestamps>("POST", "/api/songs", { RequireAuth });
 endpoint<Song, Id & Timestamps>("PUT", "/api/songs/:song_id", { RequireAuth });
 endpoint<void, void>("DELETE", "/api/songs/:song_id", { RequireAuth });
 endpoint<void, GetSong>("GET", "/api/songs/:song_id");
+// (min, max) int8 pairs, one per bucket
+endpoint<void, ArrayBuffer>("GET", "/api/songs/:song_id/waveform");
+// the audio itself, honours Range
+endpoint<void, Blob>("GET", "/api/songs/:song_id/stream");
 endpoint<void, GetSongs>("GET", "/api/songs");
 endpoint<BasePlaylist, Id & Timestamps>("POST", "/api/playlists", {
 	RequireAuth,
@@ -158,6 +242,7 @@ endpoint<void, ListOfPlaylist>("GET", "/api/playlists/current", {
 	RequireAuth,
 });
 endpoint<void, GetSongs>("GET", "/api/likes", { RequireAuth });
+endpoint<void, LikedSongIds>("GET", "/api/likes/ids", { RequireAuth });
 endpoint<Comment, Id & Timestamps>("POST", "/api/songs/:song_id/comments", {
 	RequireAuth,
 });
@@ -166,7 +251,7 @@ endpoint<Comment, Id & Timestamps>("PUT", "/api/comments/:comment_id", {
 });
 endpoint<void, void>("DELETE", "/api/comments/:comment_id", { RequireAuth });
 endpoint<void, GetComments>("GET", "/api/songs/:song_id/comments");
-endpoint<void, void>(["POST", "DELETE"], "/api/songs/:song_id/likes", {
+endpoint<void, LikeStatus>(["POST", "DELETE"], "/api/songs/:song_id/likes", {
 	RequireAuth,
 });
 endpoint<void, Artist>("GET", "/api/artists/:artist_id");
@@ -177,6 +262,29 @@ endpoint<void, User>("GET", "/api/auth");
 endpoint<Login, User>("POST", "/api/auth/login");
 endpoint<Signup, User>("POST", "/api/auth/signup");
 endpoint<void, void>("GET", "/api/auth/logout");
+endpoint<NewUpload, UploadTicket>("POST", "/api/uploads", { RequireAuth });
+// the request body is the file itself
+endpoint<Blob, StoredUpload>("PUT", "/api/uploads/:kind", { RequireAuth });
+endpoint<NewUpload, UploadSessionInfo>("POST", "/api/uploads/sessions", {
+	RequireAuth,
+});
+endpoint<void, UploadSessionInfo>("GET", "/api/uploads/sessions/:session_id", {
+	RequireAuth,
+});
+// the body is the next chunk, with an Upload-Offset header
+endpoint<Blob, UploadSessionInfo>(
+	"PATCH",
+	"/api/uploads/sessions/:session_id",
+	{ RequireAuth },
+);
+endpoint<void, StoredUpload>(
+	"POST",
+	"/api/uploads/sessions/:session_id/complete",
+	{ RequireAuth },
+);
+endpoint<void, void>("DELETE", "/api/uploads/sessions/:session_id", {
+	RequireAuth,
+});
 
 // API Implementation
 const BASE_URL = "/api";
@@ -241,6 +349,37 @@ async function fetchWithErrNoJson<T>(
 	}
 }
 
+// files up to this size are hashed before uploading, see api.uploads.upload
+const HASH_MAX_BYTES = 256 * 1024 * 1024;
+
+async function sha256Hex(file: Blob): Promise<string> {
+	const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+
+	return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+// form fields that may hold a file, and the kind and token field it is uploaded as
+type UploadFields = Record<string, [UploadKind, string]>;
+
+/**
+ * Uploads the files in form straight to storage and replaces them with their upload tokens,
+ * so the request to the api only carries text
+ */
+async function directUploads(
+	form: FormData,
+	fields: UploadFields,
+): Promise<FormData> {
+	for (const [field, [kind, tokenField]] of Object.entries(fields)) {
+		const file = form.get(field);
+		if (!(file instanceof File)) continue;
+
+		form.delete(field);
+		form.set(tokenField, await api.uploads.upload(kind, file));
+	}
+
+	return form;
+}
+
 function notNull<T>(p: Promise<T | null>): Promise<T> {
 	//@ts-expect-error this is intentional
 	return p;
@@ -249,27 +388,67 @@ function notNull<T>(p: Promise<T | null>): Promise<T> {
 //API Methods
 export const api = {
 	songs: {
-		getAll: async (): Promise<GetSongs> => {
-			return notNull(fetchWithError("/songs"));
+		/**
+		 * Returns a single page of the newest songs, pass the previous next_cursor to continue
+		 */
+		getAll: async (cursor?: string): Promise<GetSongs> => {
+			return notNull(
+				fetchWithError(
+					cursor ? `/songs?cursor=${encodeURIComponent(cursor)}` : "/songs",
+				),
+			);
 		},
-		getByArtist: async (artistId: number): Promise<GetSongs> => {
-			return notNull(fetchWithError(`/songs?artist_id=${artistId}`));
+		/**
+		 * Returns a single page of an artist's songs, pass the previous next_cursor to continue
+		 */
+		getByArtist: async (
+			artistId: number,
+			cursor?: string,
+		): Promise<GetSongs> => {
+			return notNull(
+				fetchWithError(
+					cursor
+						? `/songs?artist_id=${artistId}&cursor=${encodeURIComponent(cursor)}`
+						: `/songs?artist_id=${artistId}`,
+				),
+			);
 		},
 		getOne: async (songId: number): Promise<GetSong> => {
 			return notNull(fetchWithError(`/songs/${songId}`));
 		},
+		/**
+		 * Returns the (min, max) peak pairs of a song's waveform, buckets may be 256, 1024 or 4096.
+		 * null until the song has been processed
+		 */
+		waveform: async (
+			songId: number,
+			buckets = 1024,
+		): Promise<Int8Array | null> => {
+			const response = await fetch(
+				`${BASE_URL}/songs/${songId}/waveform?buckets=${buckets}`,
+			);
+
+			if (!response.ok) return null;
+
+			return new Int8Array(await response.arrayBuffer());
+		},
 		create: async (songData: FormData): Promise<Id & Timestamps> => {
 			return notNull(
 				fetchWithErrNoJson("/songs", {
 					method: "POST",
-					body: songData,
+					body: await directUploads(songData, {
+						song_file: ["song", "song_upload"],
+						thumbnail_img: ["image", "thumbnail_upload"],
+					}),
 				}),
 			);
 		},
 		update: async (songId: number, song: FormData): FPromise => {
 			return fetchWithErrNoJson(`/songs/${songId}`, {
 				method: "PUT",
-				body: song,
+				body: await directUploads(song, {
+					thumbnail_img: ["image", "thumbnail_upload"],
+				}),
 			});
 		},
 		delete: async (songId: number): FPromise => {
@@ -286,7 +465,9 @@ export const api = {
 			return notNull(
 				fetchWithErrNoJson("/artists", {
 					method: "POST",
-					body: artist,
+					body: await directUploads(artist, {
+						profile_image: ["image", "profile_image_upload"],
+					}),
 				}),
 			);
 		},
@@ -317,11 +498,27 @@ export const api = {
 		},
 	},
 	likes: {
-		getAll: async (): Promise<GetSongs> => {
-			return notNull(fetchWithError("/likes"));
+		/**
+		 * Returns the ids of every liked song, most recently liked first
+		 */
+		ids: async (): Promise<LikedSongIds> => {
+			return notNull(fetchWithError("/likes/ids"));
 		},
-		toggleLike: async (songId: number, method: "POST" | "DELETE"): FPromise => {
-			return fetchWithError(`/songs/${songId}/likes`, { method });
+		/**
+		 * Returns a single page of liked songs, pass the previous next_cursor to continue
+		 */
+		getPage: async (cursor?: string): Promise<GetSongs> => {
+			return notNull(
+				fetchWithError(
+					cursor ? `/likes?cursor=${encodeURIComponent(cursor)}` : "/likes",
+				),
+			);
+		},
+		toggleLike: async (
+			songId: number,
+			method: "POST" | "DELETE",
+		): Promise<LikeStatus> => {
+			return notNull(fetchWithError(`/songs/${songId}/likes`, { method }));
 		},
 	},
 	comments: {
@@ -370,7 +567,9 @@ export const api = {
 			return notNull(
 				fetchWithErrNoJson("/playlists", {
 					method: "POST",
-					body: playlist,
+					body: await directUploads(playlist, {
+						thumbnail_img: ["image", "thumbnail_upload"],
+					}),
 				}),
 			);
 		},
@@ -381,7 +580,9 @@ export const api = {
 			return notNull(
 				fetchWithErrNoJson(`/playlists/${playlistId}`, {
 					method: "PUT",
-					body: playlist,
+					body: await directUploads(playlist, {
+						thumbnail_img: ["image", "thumbnail_upload"],
+					}),
 				}),
 			);
 		},
@@ -411,5 +612,72 @@ export const api = {
 		query: async (query: string): Promise<SearchResponse> => {
 			return notNull(fetchWithError(`/search?q=${encodeURIComponent(query)}`));
 		},
+
+		// one page of a single type of result, for "see all" views
+		byType: async (
+			query: string,
+			type: SearchResultType,
+			options: SearchOptions = {},
+		): Promise<SearchResponse> => {
+			const params = new URLSearchParams({ q: query, types: type });
+			if (options.limit !== undefined) params.set("limit", String(options.limit));
+			if (options.counts) params.set("counts", "true");
+			if (options.cursor) params.set(`${type}_cursor`, options.cursor);
+
+			return notNull(fetchWithError(`/search?${params}`));
+		},
+
+		suggest: async (prefix: string, limit?: number): Promise<SuggestResponse> => {
+			const params = new URLSearchParams({ q: prefix });
+			if (limit !== undefined) params.set("limit", String(limit));
+
+			return notNull(fetchWithError(`/search/suggest?${params}`));
+		},
+	},
+
+	uploads: {
+		/**
+		 * Uploads a file straight to storage, returning the token to attach it to a record with
+		 */
+		upload: async (kind: UploadKind, file: File): Promise<string> => {
+			const body: NewUpload = { kind, filename: file.name, size: file.size };
+
+			// hashing reads the whole file into memory, so larger files are always uploaded
+			if (file.size <= HASH_MAX_BYTES && crypto.subtle) {
+				body.sha256 = await sha256Hex(file);
+			}
+
+			const ticket: UploadTicket = await notNull(
+				fetchWithError("/uploads", {
+					method: "POST",
+					body: JSON.stringify(body),
+				}),
+			);
+
+			if (!ticket.upload) return ticket.upload_token;
+
+			const form = new FormData();
+			for (const [key, value] of Object.entries(ticket.upload.fields)) {
+				form.append(key, value);
+			}
+			// storage ignores fields after the file
+			form.append("file", file);
+
+			const response = await fetch(ticket.upload.url, {
+				method: "POST",
+				body: form,
+			});
+
+			if (!response.ok) {
+				const e = new Error("Upload Error");
+				e.api = {
+					message: "Upload failed",
+					errors: { [kind]: `Storage responded with ${response.status}` },
+				};
+				throw e;
+			}
+
+			return ticket.upload_token;
+		},
 	},
 };
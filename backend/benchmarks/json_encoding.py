@@ -0,0 +1,138 @@
+"""
+Benchmark JSON encoding of a large GetSongs payload with flask's default provider and the orjson provider.
+
+Each run builds the payload from row tuples the way the handlers do, stringifying datetimes for the default
+provider as the handlers used to, then encodes it into a response. Reports the best time over all runs and
+the peak memory allocated by one run.
+
+    uv run python benchmarks/json_encoding.py [--songs 10000] [--runs 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, cast
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.update(
+    {
+        "FLASK_ENV": "development",
+        "DATABASE_URL": "sqlite://",
+        "SECRET_KEY": "bench",
+        "FLASK_RUN_PORT": "5000",
+        "S3_SOUND_BUCKET": "bench",
+        "S3_IMAGE_BUCKET": "bench",
+        "S3_KEY": "bench",
+        "S3_SECRET": "bench",
+    }
+)
+
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from src.json_provider import OrjsonProvider
+
+type Row = tuple[int, str, int, str, str, str, int, datetime, datetime]
+
+
+def make_rows(n: int) -> list[Row]:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return [
+        (
+            i,
+            f"Song number {i}",
+            i % 500,
+            f"Artist {i % 500}",
+            "Electronic",
+            f"https://bench.s3.us-east-1.amazonaws.com/{i:08x}.jpg",
+            i % 97,
+            start + timedelta(seconds=i),
+            start + timedelta(seconds=i, microseconds=i),
+        )
+        for i in range(n)
+    ]
+
+
+def build(rows: list[Row], stringify: bool) -> dict[str, list[dict[str, object]]]:
+    """The GetSongs payload for rows"""
+    stamp: Callable[[datetime], object] = str if stringify else lambda dt: dt
+
+    return {
+        "songs": [
+            {
+                "id": id,
+                "name": name,
+                "artist_id": artist_id,
+                "artist": {"id": artist_id, "display_name": display_name},
+                "genre": genre,
+                "thumb_url": thumb_url,
+                "song_ref": thumb_url,
+                "num_likes": likes,
+                "created_at": stamp(created_at),
+                "updated_at": stamp(updated_at),
+            }
+            for id, name, artist_id, display_name, genre, thumb_url, likes, created_at, updated_at in rows
+        ]
+    }
+
+
+def measure(encode: Callable[[], bytes], runs: int) -> tuple[float, int, int]:
+    """(best seconds, peak bytes allocated, output size) of encode"""
+    best = float("inf")
+    size = 0
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        size = len(encode())
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    encode()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak, size
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    rows = make_rows(args.songs)
+
+    providers: list[tuple[str, JSONProvider, bool]] = [
+        ("flask default (json)", DefaultJSONProvider(app), True),
+        ("orjson", OrjsonProvider(app), False),
+    ]
+
+    results: list[tuple[str, float, int, int]] = []
+
+    with app.app_context():
+        for name, provider, stringify in providers:
+
+            def encode() -> bytes:
+                return cast(Response, provider.response(build(rows, stringify))).get_data()
+
+            results.append((name, *measure(encode, args.runs)))
+
+    print(f"GetSongs with {args.songs} songs, best of {args.runs} runs")
+    for name, seconds, peak, size in results:
+        print(f"  {name:<22} {seconds * 1000:8.1f}ms  peak alloc {peak / 2**20:6.1f}MiB  body {size / 2**20:.1f}MiB")
+
+    baseline = results[0]
+    for name, seconds, peak, _ in results[1:]:
+        print(f"{name}: {baseline[1] / seconds:.1f}x faster, {baseline[2] / peak:.1f}x less peak allocation")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark the in process trigram index used for typo tolerant search.
+
+Builds an index over a synthetic catalog of names the way a worker does, renames a tenth of them and
+compacts the index, then times searches for misspelled names. Fails if the build takes longer than its
+budget or the p99 search latency exceeds the search budget.
+
+    uv run python benchmarks/trigram_search.py [--names 1000000] [--budget-ms 50] [--build-budget-s 60]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.update(
+    {
+        "FLASK_ENV": "development",
+        "DATABASE_URL": "sqlite://",
+        "SECRET_KEY": "bench",
+        "FLASK_RUN_PORT": "5000",
+        "S3_SOUND_BUCKET": "bench",
+        "S3_IMAGE_BUCKET": "bench",
+        "S3_KEY": "bench",
+        "S3_SECRET": "bench",
+    }
+)
+
+from src.search.trigram import TrigramIndex
+
+CONSONANTS = "bcdfghjklmnprstvwz"
+VOWELS = "aeiou"
+
+
+def make_vocabulary(rng: random.Random, size: int) -> list[str]:
+    def syllable() -> str:
+        return rng.choice(CONSONANTS) + rng.choice(VOWELS) + (rng.choice(CONSONANTS) if rng.random() < 0.5 else "")
+
+    return ["".join(syllable() for _ in range(rng.randint(1, 3))) for _ in range(size)]
+
+
+def misspell(rng: random.Random, name: str) -> str:
+    chars = list(name)
+    op = rng.randrange(3)
+    i = rng.randrange(len(chars))
+
+    if op == 0 and len(chars) > 3:
+        del chars[i]
+    elif op == 1:
+        chars.insert(i, rng.choice(VOWELS))
+    else:
+        chars[i] = rng.choice(CONSONANTS)
+
+    return "".join(chars)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    parser.add_argument("--build-budget-s", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, 50_000)
+    names = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 4))) for _ in range(args.names)]
+
+    start = time.perf_counter()
+    index = TrigramIndex((id, [name]) for id, name in enumerate(names))
+    build_s = time.perf_counter() - start
+    print(f"built index over {len(index)} names in {build_s:.1f}s")
+
+    # renames between rebuilds tombstone the old slots, compacting drops them
+    renamed = rng.sample(range(len(names)), len(names) // 10)
+    start = time.perf_counter()
+    for id in renamed:
+        names[id] = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 4)))
+        index.add(id, names[id])
+    churn_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.compact()
+    print(f"renamed {len(renamed)} names in {churn_s:.1f}s, compacted in {time.perf_counter() - start:.1f}s")
+
+    targets = [rng.randrange(len(names)) for _ in range(args.queries)]
+    latencies: list[float] = []
+    found = 0
+
+    for target in targets:
+        query = misspell(rng, names[target])
+
+        start = time.perf_counter()
+        results = index.search(query, args.threshold, 5)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        found += any(names[id] == names[target] for id, _ in results)
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    print(f"p50 {pct(0.5):.1f}ms  p95 {pct(0.95):.1f}ms  p99 {pct(0.99):.1f}ms  max {latencies[-1]:.1f}ms")
+    print(f"intended name in top 5 for {found}/{len(targets)} misspelled queries")
+
+    failed = False
+
+    if build_s > args.build_budget_s:
+        print(f"FAIL: building exceeds the {args.build_budget_s}s budget")
+        failed = True
+    if pct(0.99) > args.budget_ms:
+        print(f"FAIL: p99 exceeds the {args.budget_ms}ms budget")
+        failed = True
+
+    if failed:
+        return 1
+
+    print(f"OK: build within the {args.build_budget_s}s budget, p99 within the {args.budget_ms}ms budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+"""add song pagination indexes
+
+Revision ID: 3c1f5e2a9b47
+Revises: 9e783a43326a
+Create Date: 2026-10-18 20:31:07.114203
+
+"""
+from alembic import op
+import sqlalchemy as _
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f5e2a9b47'
+down_revision = '9e783a43326a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.create_index('ix_songs_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_songs_artist_id_created_at_id', ['artist_id', 'created_at', 'id'], unique=False)
+        # covered by the leading column of ix_songs_artist_id_created_at_id
+        batch_op.drop_index(batch_op.f('ix_songs_artist_id'))
+
+
+def downgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_songs_artist_id'), ['artist_id'], unique=False)
+        batch_op.drop_index('ix_songs_artist_id_created_at_id')
+        batch_op.drop_index('ix_songs_created_at_id')
@@ -0,0 +1,38 @@
+"""add created_at to likes_join
+
+Revision ID: 5a0c9d6e1b82
+Revises: b8e4d07c2f13
+Create Date: 2026-10-18 21:24:10.802417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a0c9d6e1b82'
+down_revision = 'b8e4d07c2f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sqlite cannot add a column with a non constant default, so add it nullable and backfill first
+    with op.batch_alter_table('likes_join', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # match the text format sqlalchemy stores datetimes as, so keyset comparisons order correctly
+        op.execute("UPDATE likes_join SET created_at = strftime('%Y-%m-%d %H:%M:%S.000000', 'now')")
+    else:
+        op.execute('UPDATE likes_join SET created_at = CURRENT_TIMESTAMP')
+
+    with op.batch_alter_table('likes_join', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False, server_default=sa.func.now())
+        batch_op.create_index('ix_likes_join_user_id_created_at', ['user_id', 'created_at', 'song_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('likes_join', schema=None) as batch_op:
+        batch_op.drop_index('ix_likes_join_user_id_created_at')
+        batch_op.drop_column('created_at')
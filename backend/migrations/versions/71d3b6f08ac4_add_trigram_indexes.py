@@ -0,0 +1,44 @@
+"""add trigram indexes
+
+Revision ID: 71d3b6f08ac4
+Revises: e27a4c91d5f0
+Create Date: 2026-10-18 22:48:51.390124
+
+"""
+from alembic import op
+import sqlalchemy as _
+
+
+# revision identifiers, used by Alembic.
+revision = '71d3b6f08ac4'
+down_revision = 'e27a4c91d5f0'
+branch_labels = None
+depends_on = None
+
+# kept in sync with src/search/fuzzy.py
+TRIGRAM_COLUMNS = {
+    'songs': ['name'],
+    'users': ['username', 'stage_name'],
+    'playlists': ['name'],
+}
+
+
+def upgrade():
+    # sqlite uses the in process trigram index instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table, columns in TRIGRAM_COLUMNS.items():
+        for column in columns:
+            op.execute(f'CREATE INDEX ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table, columns in TRIGRAM_COLUMNS.items():
+        for column in columns:
+            op.execute(f'DROP INDEX ix_{table}_{column}_trgm')
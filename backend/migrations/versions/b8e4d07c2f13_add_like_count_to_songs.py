@@ -0,0 +1,31 @@
+"""add like_count to songs
+
+Revision ID: b8e4d07c2f13
+Revises: 3c1f5e2a9b47
+Create Date: 2026-10-18 21:02:44.530981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4d07c2f13'
+down_revision = '3c1f5e2a9b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill from the existing likes
+    op.execute(
+        'UPDATE songs SET like_count = (SELECT count(*) FROM likes_join WHERE likes_join.song_id = songs.id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.drop_column('like_count')
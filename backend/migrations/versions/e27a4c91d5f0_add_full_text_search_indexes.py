@@ -0,0 +1,75 @@
+"""add full text search indexes
+
+Revision ID: e27a4c91d5f0
+Revises: 5a0c9d6e1b82
+Create Date: 2026-10-18 22:05:39.216655
+
+"""
+from alembic import op
+import sqlalchemy as _
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27a4c91d5f0'
+down_revision = '5a0c9d6e1b82'
+branch_labels = None
+depends_on = None
+
+# kept in sync with src/search/fulltext.py
+FULLTEXT_COLUMNS = {
+    'songs': ['name'],
+    'users': ['username', 'stage_name'],
+    'playlists': ['name'],
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table, columns in FULLTEXT_COLUMNS.items():
+        cols = ', '.join(columns)
+
+        if dialect == 'postgresql':
+            document = " || ' ' || ".join(f"coalesce({c}, '')" for c in columns)
+            # generated columns are computed for existing rows when added
+            op.execute(
+                f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED"
+            )
+            op.execute(f'CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)')
+        elif dialect == 'sqlite':
+            new = ', '.join(f'new.{c}' for c in columns)
+            old = ', '.join(f'old.{c}' for c in columns)
+
+            op.execute(
+                f"CREATE VIRTUAL TABLE {table}_fts USING fts5("
+                f"{cols}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {table}_fts(rowid, {cols}) VALUES (new.id, {new}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {table}_fts({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_fts_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                f"INSERT INTO {table}_fts({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {table}_fts(rowid, {cols}) VALUES (new.id, {new}); END"
+            )
+            # build the index for existing rows
+            op.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table in FULLTEXT_COLUMNS:
+        if dialect == 'postgresql':
+            op.execute(f'DROP INDEX ix_{table}_search_vector')
+            op.execute(f'ALTER TABLE {table} DROP COLUMN search_vector')
+        elif dialect == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            op.execute(f'DROP TABLE {table}_fts')
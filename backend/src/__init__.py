@@ -12,11 +12,25 @@ from .api.comments_routes import comment_routes
 from .api.song_routes import song_routes
 from .api.likes_routes import bp as likes_routes
 from .seeds import seed_commands
+from .cli import job_commands, likes_commands, media_commands, run_worker, storage_commands, upload_commands
 from .config import Config
+from .json_provider import OrjsonProvider
+from .response_cache import response_cache
+from .conditional import add_validators
+from .cdn import edge_cache, is_edge_cacheable
+from .compression import compression
+from .static_files import static_files
+from . import resumable
+from .media import media_pool
+from .song_cache import song_cache
+from .search.catalog import catalog_indexes
+from .backend_api import CacheStats
 from typing import List, Dict, Union
 from .api.search_routes import search_routes
+from .api.upload_routes import upload_routes
 
 app = Flask(__name__, static_folder="../../frontend/dist", static_url_path="/")
+app.json = OrjsonProvider(app)
 
 # Setup login manager
 login = LoginManager(app)
@@ -30,6 +44,12 @@ def load_user(id: str) -> User | None:
 
 # Tell flask about our seed commands
 app.cli.add_command(seed_commands)
+app.cli.add_command(likes_commands)
+app.cli.add_command(upload_commands)
+app.cli.add_command(storage_commands)
+app.cli.add_command(job_commands)
+app.cli.add_command(run_worker)
+app.cli.add_command(media_commands)
 
 # Configure app
 app.config.from_object(Config)
@@ -54,11 +74,21 @@ app.register_blueprint(likes_routes, url_prefix="/api")
 app.register_blueprint(song_routes, url_prefix="/api/songs")
 app.register_blueprint(artist_routes)
 app.register_blueprint(search_routes)
+app.register_blueprint(upload_routes)
 
 
 # Initialize database
 db.init_app(app)
 Migrate(app, db)
+# compression is registered first so its after_request hook runs last, on the finished response
+compression.init_app(app)
+response_cache.init_app(app)
+edge_cache.init_app(app)
+static_files.init_app(app)
+resumable.init_app(app)
+media_pool.init_app(app)
+song_cache.init_app(app)
+catalog_indexes.init_app(app)
 
 # Application Security
 CORS(app)
@@ -74,9 +104,15 @@ def https_redirect():
             return redirect(url, code=code)
 
 
+app.after_request(add_validators)
+
+
 @app.after_request
 def inject_csrf_token(response: Response) -> Response:
-    """Inject CSRF token into response"""
+    """Inject CSRF token into response, unless the CDN may cache it"""
+    if is_edge_cacheable(response):
+        return response
+
     response.set_cookie(
         "csrf_token",
         generate_csrf(),
@@ -102,6 +138,12 @@ def api_help() -> Dict[str, List[Union[List[str], str | None]]]:  # pyright: ign
     return route_list
 
 
+@app.route("/api/cache/stats")
+def cache_stats() -> CacheStats:
+    """Response cache hit/miss counters for this worker"""
+    return response_cache.stats()
+
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def react_root(path: str) -> Response:  # pyright: ignore
@@ -111,10 +153,10 @@ def react_root(path: str) -> Response:  # pyright: ignore
     """
     if path == "favicon.ico":
         return app.send_from_directory("public", "favicon.ico")  # pyright: ignore
-    return app.send_static_file("index.html")
+    return static_files.index()
 
 
 @app.errorhandler(404)
 def not_found(_e: object) -> Response:
     """Handle 404 errors by returning the React app"""
-    return app.send_static_file("index.html")
+    return static_files.index()
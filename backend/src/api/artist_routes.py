@@ -1,6 +1,7 @@
-from flask import Blueprint, request
+from flask import Blueprint, Response, request
 from flask_login import current_user  # pyright: ignore
-from ..models import User, db
+from sqlalchemy import func, select
+from ..models import Song, User, db
 from typing import cast, Union, Tuple
 from datetime import datetime, timezone
 from ..backend_api import (
@@ -9,28 +10,50 @@ from ..backend_api import (
     ReturnPostArtist,
 )
 from ..forms.artist_form import ArtistForm
-from .song_routes import create_resource_on_aws
+from .song_routes import attached_file, delete_resource_from_aws
+from ..search.catalog import names_changed
+from ..response_cache import cache_tags, response_cache
+from ..conditional import check_validators
+from ..cdn import edge_cached
 
 
 artist_routes = Blueprint("artists", __name__, url_prefix="/api/artists")
 
 
 @artist_routes.get("/<int:artist_id>")
-def get_artist(artist_id: int) -> Union[Artist, Tuple[ApiError, int]]:
+@edge_cached
+@response_cache.cached
+def get_artist(artist_id: int) -> Union[Artist, Tuple[ApiError, int], Response]:
     """
     Get an artist's details by ID.
     Returns (ApiError, 404) if artist not found or if user exists but isn't an artist.
     """
-    artist = db.session.query(User).filter_by(id=artist_id).one_or_none()
+    version = db.session.execute(
+        select(User.updated_at, select(func.count(Song.id)).where(Song.artist_id == artist_id).scalar_subquery()).where(
+            User.id == artist_id
+        )
+    ).one_or_none()
 
-    if not artist:
+    if version is None:
         return (ApiError(message="Artist not found", errors={"artist_id": f"No user found with id {artist_id}"}), 404)
 
+    updated_at, num_songs = version
+
+    # num_songs_by_artist changes with uploads and deletes, which do not touch the artist itself. Tagged before
+    # validating, so a 304 carries the tags to the CDN too
+    cache_tags(f"artist-{artist_id}", f"artist-songs-{artist_id}")
+
+    unchanged = check_validators("artist", artist_id, updated_at, num_songs)
+    if unchanged is not None:
+        return unchanged
+
+    artist = db.session.query(User).filter_by(id=artist_id).one()
+
     # Build artist response
     result: Artist = {
         "id": artist.id,
         "stage_name": artist.stage_name or artist.username,
-        "num_songs_by_artist": len(artist.songs),
+        "num_songs_by_artist": num_songs,
     }
 
     # Add optional fields if they exist
@@ -80,8 +103,8 @@ def post_artist() -> Union[ReturnPostArtist, Tuple[ApiError, int]]:
         try:
             # Create PostArtist response structure
             response: ReturnPostArtist = {
-                "created_at": str(user.created_at),
-                "updated_at": str(user.updated_at),
+                "created_at": user.created_at,
+                "updated_at": user.updated_at,
                 "num_songs_by_artist": len(user.songs),
             }
 
@@ -90,8 +113,14 @@ def post_artist() -> Union[ReturnPostArtist, Tuple[ApiError, int]]:
                 response["stage_name"] = form.data["stage_name"]
 
             # handle thumbnail if user provided
-            if form.data["profile_image"] is not None:
-                profile_image = create_resource_on_aws(form.data["profile_image"], "image")
+            profile_image = attached_file(
+                form.data["profile_image_upload"], form.data["profile_image"], "image", "profile_image_upload"
+            )
+            if isinstance(profile_image, tuple):
+                return profile_image
+            if profile_image is not None:
+                if user.profile_image:
+                    delete_resource_from_aws(user.profile_image, "image")
                 user.profile_image = profile_image
 
             if form.data["first_release"] is not None:
@@ -120,8 +149,10 @@ def post_artist() -> Union[ReturnPostArtist, Tuple[ApiError, int]]:
                 response["homepage"] = form.data["homepage"]
 
             user.updated_at = datetime.now(timezone.utc)
-            response["updated_at"] = str(user.updated_at)
+            response["updated_at"] = user.updated_at
             db.session.commit()
+            names_changed("artist", user.id, user.stage_name or user.username, user.username, user.stage_name)
+            response_cache.invalidate(f"artist-{user.id}")
 
             return response
 
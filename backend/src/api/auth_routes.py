@@ -4,15 +4,12 @@ from werkzeug.datastructures import FileStorage
 from ..models import User, db
 from ..forms.login_form import LoginForm
 from ..forms.signup_form import SignUpForm
+from ..search.catalog import names_changed
+from ..response_cache import response_cache
+from ..storage import release
+from ..uploads import claim_upload, store_file
 from datetime import datetime, timezone
-from ..api.aws_integration import (
-    ImageFile,
-    get_unique_filename,
-    remove_file_from_s3,
-    ALLOWED_IMAGE_EXTENSIONS,
-    IMAGE_CONTENT_EXT_MAP,
-    IMAGE_BUCKET_NAME,
-)
+from ..api.aws_integration import ALLOWED_IMAGE_EXTENSIONS, IMAGE_BUCKET_NAME
 
 __all__ = ["auth_routes", "update_user_profile"]
 
@@ -74,6 +71,7 @@ def sign_up():
         )
         db.session.add(user)
         db.session.commit()
+        names_changed("artist", user.id, user.username, user.username)
         login_user(user)
         return user.to_dict()
     return form.errors, 401
@@ -87,29 +85,33 @@ def update_user_profile():
         profile_image: FileStorage | None = request.files.get("profile_image")
         user = current_user
 
-        if profile_image and profile_image.filename:
+        profile_image_upload = request.form.get("profile_image_upload")
+
+        if profile_image_upload:
+            image_url = claim_upload(profile_image_upload, "image", user.id, "profile_image_upload")
+            if isinstance(image_url, tuple):
+                return image_url
+
+            if user.profile_image:
+                release(user.profile_image, IMAGE_BUCKET_NAME)
+
+            user.profile_image = image_url
+        elif profile_image and profile_image.filename:
             if profile_image.filename.split(".")[-1].lower() not in ALLOWED_IMAGE_EXTENSIONS:
                 return {"errors": "Invalid image format"}, 400
 
-            filename = get_unique_filename(profile_image.filename)
-            image_file = ImageFile(
-                filename=filename,
-                content_type=f"image/{IMAGE_CONTENT_EXT_MAP[filename.rsplit('.', 1)[1].lower()]}",
-                content=profile_image,  # type: ignore
-            )
-
-            upload_result = image_file.upload()
-            if "errors" in upload_result:
+            image_url = store_file("image", profile_image.filename, profile_image.stream)
+            if isinstance(image_url, tuple):
                 return {"errors": "Failed to upload image"}, 400
 
             if user.profile_image:
-                old_filename = user.profile_image.split("/")[-1]
-                remove_file_from_s3(old_filename, IMAGE_BUCKET_NAME)
+                release(user.profile_image, IMAGE_BUCKET_NAME)
 
-            user.profile_image = upload_result["url"]
+            user.profile_image = image_url
 
         user.updated_at = dt_now()
         db.session.commit()
+        response_cache.invalidate(f"artist-{user.id}")
 
         return user.to_dict()
 
@@ -145,29 +147,34 @@ def update_artist_profile():
         if "homepage" in form_data:
             user.homepage = form_data["homepage"]
 
-        if profile_image and profile_image.filename:
+        profile_image_upload = request.form.get("profile_image_upload")
+
+        if profile_image_upload:
+            image_url = claim_upload(profile_image_upload, "image", user.id, "profile_image_upload")
+            if isinstance(image_url, tuple):
+                return image_url
+
+            if user.profile_image:
+                release(user.profile_image, IMAGE_BUCKET_NAME)
+
+            user.profile_image = image_url
+        elif profile_image and profile_image.filename:
             if profile_image.filename.split(".")[-1].lower() not in ALLOWED_IMAGE_EXTENSIONS:
                 return {"errors": "Invalid image format"}, 400
 
-            filename = get_unique_filename(profile_image.filename)
-            image_file = ImageFile(
-                filename=filename,
-                content_type=f"image/{IMAGE_CONTENT_EXT_MAP[filename.rsplit('.', 1)[1].lower()]}",
-                content=profile_image,  # type: ignore
-            )
-
-            upload_result = image_file.upload()
-            if "errors" in upload_result:
+            image_url = store_file("image", profile_image.filename, profile_image.stream)
+            if isinstance(image_url, tuple):
                 return {"errors": "Failed to upload image"}, 400
 
             if user.profile_image:
-                old_filename = user.profile_image.split("/")[-1]
-                remove_file_from_s3(old_filename, IMAGE_BUCKET_NAME)
+                release(user.profile_image, IMAGE_BUCKET_NAME)
 
-            user.profile_image = upload_result["url"]
+            user.profile_image = image_url
 
         user.updated_at = dt_now()
         db.session.commit()
+        names_changed("artist", user.id, user.stage_name or user.username, user.username, user.stage_name)
+        response_cache.invalidate(f"artist-{user.id}")
 
         return user.to_dict()
 
@@ -1,13 +1,26 @@
 from dataclasses import dataclass
 from typing import BinaryIO
 import boto3
+from botocore.config import Config as BotoConfig
 import os
 import uuid
 
 SOUND_BUCKET_NAME = os.environ["S3_SOUND_BUCKET"]
 IMAGE_BUCKET_NAME = os.environ["S3_IMAGE_BUCKET"]
-S3_SOUND_LOCATION = f"https://{SOUND_BUCKET_NAME}.s3.us-east-1.amazonaws.com/"
-S3_IMAGE_LOCATION = f"https://{IMAGE_BUCKET_NAME}.s3.us-east-1.amazonaws.com/"
+# a local S3 compatible server (minio, moto_server, ...) to use instead of AWS, eg. http://127.0.0.1:9000
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+
+
+def bucket_location(bucket: str) -> str:
+    """The public url prefix of objects in bucket"""
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{bucket}/"
+
+    return f"https://{bucket}.s3.us-east-1.amazonaws.com/"
+
+
+S3_SOUND_LOCATION = bucket_location(SOUND_BUCKET_NAME)
+S3_IMAGE_LOCATION = bucket_location(IMAGE_BUCKET_NAME)
 ALLOWED_SOUND_EXTENSIONS = {"mp3", "aac", "m4a", "opus", "wav", "flac", "ogg"}
 ALLOWED_IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 AUDIO_CONTENT_EXT_MAP = {
@@ -30,7 +43,13 @@ DEFAULT_THUMBNAIL_IMAGE = S3_IMAGE_LOCATION + "generic-album-art.png"
 
 s3_session = boto3.Session(aws_access_key_id=os.environ["S3_KEY"], aws_secret_access_key=os.environ["S3_SECRET"])
 
-s3_client = s3_session.client("s3")  # pyright: ignore
+# local servers are addressed by path, as they do not have a DNS name per bucket
+s3_client = s3_session.client(  # pyright: ignore
+    "s3",
+    region_name="us-east-1",
+    endpoint_url=S3_ENDPOINT_URL,
+    config=BotoConfig(s3={"addressing_style": "path"} if S3_ENDPOINT_URL else {}),
+)
 
 
 class HasFileName(BinaryIO):
@@ -1,12 +1,24 @@
 from typing import cast
 from datetime import datetime, timezone
 
-from flask import Blueprint, request
+from flask import Blueprint, Response, request
 from flask_login import current_user, login_required  # pyright: ignore
-from sqlalchemy import desc
-
-from ..backend_api import ApiErrorResponse, Created, GetComments, Comment as ApiComment, IdAndTimestamps, NoPayload, Ok
+from sqlalchemy import Row, desc, func, select
+
+from ..backend_api import (
+    ApiErrorResponse,
+    Created,
+    Comment as ApiComment,
+    IdAndTimestamps,
+    NoPayload,
+    Ok,
+    UserComment,
+)
 from ..models import db, Comment, User as DbUser, Song as DbSong
+from ..response_cache import cache_tags, response_cache
+from ..conditional import check_validators
+from ..streaming import json_list_response, stream_rows
+from ..cdn import edge_cached
 
 
 comment_routes = Blueprint("comment", __name__)
@@ -17,26 +29,65 @@ def dt_now() -> datetime:
 
 
 @comment_routes.get("/songs/<int:song_id>/comments")
-def get_comments(song_id: int) -> GetComments | ApiErrorResponse:
+@edge_cached
+@response_cache.cached
+def get_comments(song_id: int) -> ApiErrorResponse | Response:
     song_exists = db.session.query(DbSong).filter(DbSong.id == song_id).one_or_none()
 
     if song_exists is None:
         return {"message": "Song does not exist", "errors": {}}, 404
 
-    comments = db.session.query(Comment).filter(Comment.song_id == song_id).order_by(desc(Comment.created_at)).all()
-
-    return {
-        "comments": [
-            {
-                "id": c.id,
-                "text": c.comment_text,
-                "user": {"id": c.author_id, "display_name": c.author.stage_name or c.author.username},
-                "created_at": str(c.created_at),
-                "updated_at": str(c.updated_at),
-            }
-            for c in comments
-        ]
-    }
+    # count and id sum catch deletes, authors are included for their display names
+    count, id_sum, comments_updated_at, authors_updated_at = db.session.execute(
+        select(func.count(Comment.id), func.sum(Comment.id), func.max(Comment.updated_at), func.max(DbUser.updated_at))
+        .join(DbUser, Comment.author_id == DbUser.id)
+        .where(Comment.song_id == song_id)
+    ).one()
+
+    # authors are tagged for their display names. Tags are sent before the body, and with a 304, so look them up
+    # before validating
+    authors = db.session.scalars(select(Comment.author_id).distinct().where(Comment.song_id == song_id))
+    cache_tags(f"comments-{song_id}", *(f"artist-{author_id}" for author_id in authors))
+
+    unchanged = check_validators(
+        "comments",
+        song_id,
+        count,
+        id_sum,
+        comments_updated_at,
+        authors_updated_at,
+    )
+    if unchanged is not None:
+        return unchanged
+
+    rows = stream_rows(
+        select(
+            Comment.id,
+            Comment.comment_text,
+            Comment.author_id,
+            DbUser.stage_name,
+            DbUser.username,
+            Comment.created_at,
+            Comment.updated_at,
+        )
+        .join(DbUser, Comment.author_id == DbUser.id)
+        .where(Comment.song_id == song_id)
+        .order_by(desc(Comment.created_at))
+    )
+
+    def to_api(row: Row[tuple[int, str, int, str | None, str, datetime, datetime]]) -> UserComment:
+        id, text, author_id, stage_name, username, created_at, updated_at = row.tuple()
+
+        return {
+            "id": id,
+            "text": text,
+            "user": {"id": author_id, "display_name": stage_name or username},
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    # same body as GetComments
+    return json_list_response("comments", rows, to_api)
 
 
 @comment_routes.post("/songs/<int:song_id>/comments")
@@ -62,8 +113,9 @@ def post_new_comment(song_id: int) -> Created[IdAndTimestamps] | ApiErrorRespons
 
     db.session.add(c)
     db.session.commit()
+    response_cache.invalidate(f"comments-{song_id}")
 
-    return {"id": c.id, "created_at": str(cu), "updated_at": str(cu)}, 201
+    return {"id": c.id, "created_at": cu, "updated_at": cu}, 201
 
 
 @comment_routes.put("/comments/<int:comment_id>")
@@ -90,8 +142,9 @@ def edit_comment(comment_id: int) -> Ok[IdAndTimestamps] | ApiErrorResponse:
     comment.updated_at = dt_now()
 
     db.session.commit()
+    response_cache.invalidate(f"comments-{comment.song_id}")
 
-    return {"id": comment.id, "created_at": str(comment.created_at), "updated_at": str(comment.updated_at)}
+    return {"id": comment.id, "created_at": comment.created_at, "updated_at": comment.updated_at}
 
 
 @comment_routes.delete("/comments/<int:comment_id>")
@@ -109,5 +162,6 @@ def delete_comment(comment_id: int) -> ApiErrorResponse | NoPayload:
 
     db.session.delete(comment)
     db.session.commit()
+    response_cache.invalidate(f"comments-{comment.song_id}")
 
     return {}
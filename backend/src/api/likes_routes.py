@@ -1,75 +1,140 @@
-import os
-import traceback
-
 from typing import cast
-from flask import Blueprint
+from flask import Blueprint, request
 from flask_login import current_user, login_required  # pyright: ignore
-from ..backend_api import ApiErrorResponse, GetSongs, GetSong, NoBody, Ok
+from sqlalchemy import delete, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from ..backend_api import ApiErrorResponse, GetSongs, LikedSongIds, LikeStatus, Ok
 from ..models import db, likes_join, User, Song
-from ..db_to_api import db_song_to_api_song
+from ..db_to_api import api_song_query, db_song_to_api_song
+from ..response_cache import response_cache
+from ..pagination import decode_cursor, encode_cursor, parse_limit, invalid_cursor_error, invalid_limit_error
 
 bp = Blueprint("likes", __name__)
 
 
 @bp.get("/likes")
 @login_required
-def get_likes() -> GetSongs:
+def get_likes() -> GetSongs | ApiErrorResponse:
+    """
+    Query one page of the current user's liked songs (most recently liked first) in a single joined query,
+    along with a cursor to fetch the next page if there is one.
+    """
     user = cast(User, current_user)
+    cursor: str | None = request.args.get("cursor")
 
-    vals = db.session.query(likes_join).where(likes_join.user_id == user.id).all()
+    limit = parse_limit(request.args.get("limit"))
 
-    out: list[GetSong] = []
+    if limit is None:
+        return invalid_limit_error
 
-    # FIXME this sucks
-    for like in vals:
-        song = db.session.query(Song).where(Song.id == like.song_id).one()
+    query = api_song_query(
+        select(Song).join(likes_join, likes_join.song_id == Song.id).where(likes_join.user_id == user.id)
+    ).add_columns(likes_join.created_at)
 
-        out.append(db_song_to_api_song(song))
+    if cursor is not None:
+        position = decode_cursor(cursor)
 
-    return {"songs": out}
+        if position is None:
+            return invalid_cursor_error
 
+        liked_at, last_id = position
 
-@bp.post("/songs/<int:song_id>/likes")
+        # keyset pagination, served by the user_id, created_at, song_id index
+        query = query.where(
+            tuple_(likes_join.created_at, likes_join.song_id) < tuple_(literal(liked_at), literal(last_id))
+        )
+
+    # fetch one extra row to find out if there is another page
+    rows = db.session.execute(
+        query.order_by(likes_join.created_at.desc(), likes_join.song_id.desc()).limit(limit + 1)
+    ).all()
+
+    out: GetSongs = {
+        "songs": [db_song_to_api_song(song, stage_name or username) for song, stage_name, username, _ in rows[:limit]]
+    }
+
+    if len(rows) > limit:
+        last, _, _, liked_at = rows[limit - 1]
+        out["next_cursor"] = encode_cursor(liked_at, last.id)
+
+    return out
+
+
+@bp.get("/likes/ids")
 @login_required
-def post_like(song_id: int) -> Ok[NoBody] | ApiErrorResponse:
+def get_liked_song_ids() -> LikedSongIds:
+    """
+    Ids of every song the current user likes (most recently liked first), so clients can mark liked songs without
+    fetching them. Read from the user_id, created_at, song_id index alone.
+    """
     user = cast(User, current_user)
 
-    song = db.session.query(Song).where(Song.id == song_id).one_or_none()
+    song_ids = db.session.scalars(
+        select(likes_join.song_id)
+        .where(likes_join.user_id == user.id)
+        .order_by(likes_join.created_at.desc(), likes_join.song_id.desc())
+    ).all()
+
+    return {"song_ids": list(song_ids)}
+
+
+def insert_like(user_id: int, song_id: int) -> bool:
+    """Insert a likes_join row, ignoring it if it already exists. Returns True if a row was inserted"""
+    insert = postgresql_insert if db.session.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+    result = db.session.execute(insert(likes_join).values(user_id=user_id, song_id=song_id).on_conflict_do_nothing())
+
+    return result.rowcount > 0
 
-    if song is None:
+
+def delete_like_row(user_id: int, song_id: int) -> bool:
+    """Delete a likes_join row if it exists. Returns True if a row was deleted"""
+    result = db.session.execute(delete(likes_join).where(likes_join.user_id == user_id, likes_join.song_id == song_id))
+
+    return result.rowcount > 0
+
+
+@bp.post("/songs/<int:song_id>/likes")
+@login_required
+def post_like(song_id: int) -> Ok[LikeStatus] | ApiErrorResponse:
+    """Like a song, liking an already liked song is a no-op"""
+    user = cast(User, current_user)
+
+    if db.session.get(Song, song_id) is None:
         return {"message": "Could not find song", "errors": {}}, 404
 
-    try:
-        user.liked_songs.append(song)
-        db.session.commit()
-    except Exception as e:
-        # do not error on unset
-        if os.environ.get("FLASK_ENV") == "development":
-            traceback.print_exception(e)
+    changed = insert_like(user.id, song_id)
+
+    if changed:
+        # counter is updated in the same transaction as the join row
+        db.session.execute(update(Song).where(Song.id == song_id).values(like_count=Song.like_count + 1))
+
+    db.session.commit()
 
-        return {"message": "song already liked", "errors": {}}, 403
+    if changed:
+        response_cache.invalidate(f"song-{song_id}")
 
-    return ""
+    return {"liked": True, "changed": changed}
 
 
 @bp.delete("/songs/<int:song_id>/likes")
 @login_required
-def delete_like(song_id: int) -> Ok[NoBody] | ApiErrorResponse:
+def delete_like(song_id: int) -> Ok[LikeStatus] | ApiErrorResponse:
+    """Unlike a song, unliking a song that is not liked is a no-op"""
     user = cast(User, current_user)
 
-    song = db.session.query(Song).where(Song.id == song_id).one_or_none()
-
-    if song is None:
+    if db.session.get(Song, song_id) is None:
         return {"message": "Could not find song", "errors": {}}, 404
 
-    try:
-        user.liked_songs.remove(song)
-        db.session.commit()
-    except Exception as e:
-        # do not error on unset
-        if os.environ.get("FLASK_ENV") == "development":
-            traceback.print_exception(e)
+    changed = delete_like_row(user.id, song_id)
+
+    if changed:
+        db.session.execute(update(Song).where(Song.id == song_id).values(like_count=Song.like_count - 1))
+
+    db.session.commit()
 
-        return {"message": "song already liked", "errors": {}}, 403
+    if changed:
+        response_cache.invalidate(f"song-{song_id}")
 
-    return ""
+    return {"liked": False, "changed": changed}
@@ -1,10 +1,11 @@
 # backend/src/api/playlist_routes.py
 
-from flask import Blueprint, request
+from flask import Blueprint, Response, request
 from flask_login import login_required, current_user  # pyright: ignore
 from typing import Union, Tuple
 from datetime import datetime, timezone
-from ..models import db, Playlist, Song
+from sqlalchemy import select
+from ..models import db, Playlist, Song, playlists_join
 from ..backend_api import (
     ApiErrorResponse,
     IdAndTimestamps,
@@ -12,15 +13,16 @@ from ..backend_api import (
     NoBody,
     Ok,
     PlaylistInfo,
-    GetSongs,
-    ListOfPlaylist,
     PopulatePlaylist,
     ApiError,
     Created,
 )
-from ..db_to_api import db_playlist_to_api, db_song_to_api_song
-from .song_routes import create_resource_on_aws, delete_resource_from_aws
+from ..db_to_api import db_playlist_to_api, stream_api_songs
+from ..streaming import json_list_response, stream_rows
+from .song_routes import attached_file, delete_resource_from_aws
 from ..forms.playlist_form import PlaylistForm
+from ..search.catalog import names_changed, names_removed
+from ..conditional import check_validators
 
 playlist_routes = Blueprint("playlists", __name__, url_prefix="/api/playlists")
 
@@ -38,9 +40,11 @@ def create_playlist() -> Union[Created[IdAndTimestamps], Tuple[ApiError, int]]:
             return ApiError(message="Name is required", errors={"name": "Playlist name cannot be empty"}), 400
 
         # handle set thumbnail to None or user provided file
-        thumbnail_url_or_none = None
-        if form.data["thumbnail_img"] is not None:
-            thumbnail_url_or_none = create_resource_on_aws(form.data["thumbnail_img"], "image")
+        thumbnail_url_or_none = attached_file(
+            form.data["thumbnail_upload"], form.data["thumbnail_img"], "image", "thumbnail_upload"
+        )
+        if isinstance(thumbnail_url_or_none, tuple):
+            return thumbnail_url_or_none
 
         # construct the playlist
         new_playlist = Playlist(
@@ -53,11 +57,12 @@ def create_playlist() -> Union[Created[IdAndTimestamps], Tuple[ApiError, int]]:
 
         db.session.add(new_playlist)
         db.session.commit()
+        names_changed("playlist", new_playlist.id, new_playlist.name, new_playlist.name)
 
         response: IdAndTimestamps = {
             "id": new_playlist.id,
-            "created_at": str(new_playlist.created_at),
-            "updated_at": str(new_playlist.updated_at),
+            "created_at": new_playlist.created_at,
+            "updated_at": new_playlist.updated_at,
         }
         return response, 201
 
@@ -73,7 +78,6 @@ def update_playlist(playlist_id: int) -> Ok[BasePlaylist] | ApiErrorResponse:
 
     if data.validate_on_submit():
         name = data.data["name"]
-        thumb = data.data["thumbnail_img"]
 
         playlist = db.session.query(Playlist).filter_by(id=playlist_id, user_id=current_user.id).first()
         if not playlist:
@@ -81,18 +85,23 @@ def update_playlist(playlist_id: int) -> Ok[BasePlaylist] | ApiErrorResponse:
                 message="Playlist not found", errors={"playlist_id": f"No playlist found with id {playlist_id}"}
             ), 404
 
+        thumb_url = attached_file(
+            data.data["thumbnail_upload"], data.data["thumbnail_img"], "image", "thumbnail_upload"
+        )
+        if isinstance(thumb_url, tuple):
+            return thumb_url
+
         if name:
             playlist.name = name
-        if thumb:
+        if thumb_url is not None:
             if playlist.thumbnail:
                 delete_resource_from_aws(playlist.thumbnail, "image")
 
-            thumb_url = create_resource_on_aws(thumb, "image")
-
             playlist.thumbnail = thumb_url
 
         playlist.updated_at = datetime.now(timezone.utc)
         db.session.commit()
+        names_changed("playlist", playlist.id, playlist.name, playlist.name)
 
         o: BasePlaylist = {"name": playlist.name}
 
@@ -119,17 +128,23 @@ def delete_playlist(playlist_id: int) -> Ok[NoBody] | ApiErrorResponse:
 
     db.session.delete(playlist)
     db.session.commit()
+    names_removed("playlist", playlist_id)
     return ""
 
 
 @playlist_routes.get("/<int:playlist_id>")
 @login_required
-def get_playlist(playlist_id: int) -> Ok[PlaylistInfo] | ApiErrorResponse:
+def get_playlist(playlist_id: int) -> Ok[PlaylistInfo] | ApiErrorResponse | Response:
     playlist = db.session.query(Playlist).filter_by(id=playlist_id, user_id=current_user.id).one_or_none()
 
     if playlist is None:
         return {"message": "Playlist not found", "errors": {}}, 404
 
+    # every change to a playlist, including adding and removing songs, bumps updated_at
+    unchanged = check_validators("playlist", playlist_id, playlist.updated_at, last_modified=playlist.updated_at)
+    if unchanged is not None:
+        return unchanged
+
     return db_playlist_to_api(playlist)
 
 
@@ -165,24 +180,25 @@ def modify_playlist_songs(playlist_id: int) -> PopulatePlaylist | ApiErrorRespon
 # 5. get all the songs from a playlist
 @playlist_routes.route("/<int:playlist_id>/songs", methods=["GET"])
 @login_required
-def get_playlist_songs(playlist_id: int) -> Union[GetSongs, Tuple[ApiError, int]]:
+def get_playlist_songs(playlist_id: int) -> Union[Response, Tuple[ApiError, int]]:
     playlist = db.session.query(Playlist).filter_by(id=playlist_id, user_id=current_user.id).first()
     if not playlist:
         return ApiError(
             message="Playlist not found", errors={"playlist_id": f"No playlist found with id {playlist_id}"}
         ), 404
 
-    songs: GetSongs = {"songs": [db_song_to_api_song(song) for song in playlist.songs]}
-
-    return songs
+    return stream_api_songs(
+        select(Song)
+        .join(playlists_join, playlists_join.song_id == Song.id)
+        .where(playlists_join.playlist_id == playlist.id)
+    )
 
 
 # 6. get all of my playlist of a user
 @playlist_routes.route("/current", methods=["GET"])
 @login_required
-def get_user_playlists() -> Tuple[ListOfPlaylist, int]:
-    playlists = db.session.query(Playlist).filter_by(user_id=current_user.id).all()
-    playlist_data: list[PlaylistInfo] = [db_playlist_to_api(playlist) for playlist in playlists]
+def get_user_playlists() -> Response:
+    """Streamed ListOfPlaylist"""
+    playlists = stream_rows(select(Playlist).where(Playlist.user_id == current_user.id))
 
-    response: ListOfPlaylist = {"playlists": playlist_data}
-    return response, 200
+    return json_list_response("playlists", playlists, lambda row: db_playlist_to_api(row[0]))
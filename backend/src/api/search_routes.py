@@ -1,81 +1,235 @@
 from flask import Blueprint, request
-from sqlalchemy import or_
+from sqlalchemy import (
+    BigInteger,
+    ColumnElement,
+    Float,
+    Integer,
+    String,
+    Subquery,
+    case,
+    cast,
+    func,
+    literal,
+    null,
+    select,
+    tuple_,
+    union_all,
+)
 from ..models import db, Song, User, Playlist
-from typing import TypedDict
+from ..search.fulltext import SearchKind, query_terms, ranked_matches
+from ..search.fuzzy import fuzzy_matches
+from ..search.catalog import KINDS, catalog_indexes
+from ..backend_api import ApiErrorResponse, SearchPage, SearchResponse, SearchResultDict, SuggestResponse
+from ..pagination import decode_rank_cursor, encode_rank_cursor, parse_limit, invalid_cursor_error, invalid_limit_error
 
 search_routes = Blueprint("search", __name__)
 
+DEFAULT_SEARCH_LIMIT = 5
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+# most typo tolerant matches found per type, they are paged like full text matches
+MAX_FUZZY_MATCHES = 100
+# ranks are compared as integers of this many steps per unit, float4 ranks (ts_rank, similarity) do not round trip
+# through a cursor exactly, which would skip or repeat rows tied with the last row of a page
+RANK_SCALE = 1_000_000
 
-class SearchResultDict(TypedDict):
-    type: str
-    id: int
-    name: str
-    thumb_url: str | None
-    artist_name: str | None
+invalid_types_error: ApiErrorResponse = (
+    {"message": "Invalid types", "errors": {"types": "types must be a comma separated list of song, artist, playlist"}},
+    400,
+)
 
+# (type, id, name, thumb_url, artist_name, rank, total), total is only set on a CountRow
+type SearchRow = tuple[str, int, str, str | None, str | None, int, None]
+type CountRow = tuple[str, None, None, None, None, None, int]
 
-class SearchResponse(TypedDict):
-    results: list[SearchResultDict]
 
+def search_branch(kind: SearchKind, matches: Subquery, limit: int, cursor: tuple[int, int] | None) -> Subquery:
+    """
+    One page of results of a kind as SearchRows, given a subquery of matching (id, rank).
+    Fetches limit + 1 rows so the caller can tell whether there is a next page.
+    """
+    rank: ColumnElement[int] = cast(func.round(cast(matches.c.rank, Float) * RANK_SCALE), BigInteger)
+    match_id: ColumnElement[int] = matches.c.id
+    # typed, postgres resolves a bare NULL in a subquery to text, which does not union with a count
+    total = cast(null(), BigInteger).label("total")
 
-@search_routes.route("/api/search")
-def search() -> SearchResponse:
-    query = request.args.get("q", "")
-    if not query or len(query) < 2:
-        return SearchResponse(results=[])
-
-    # Search songs
-    songs = (
-        db.session.query(Song, User.username)
-        .join(User, Song.artist_id == User.id)
-        .filter(
-            or_(
-                Song.name.ilike(f"%{query}%"),
-            )
+    if kind == "song":
+        stmt = (
+            select(literal("song"), Song.id, Song.name, Song.thumb_url, User.username, rank, total)
+            .join_from(matches, Song, Song.id == match_id)
+            .join(User, Song.artist_id == User.id)
+        )
+    elif kind == "artist":
+        stmt = select(
+            literal("artist"),
+            User.id,
+            func.coalesce(User.stage_name, User.username),
+            User.profile_image,
+            null(),
+            rank,
+            total,
+        ).join_from(matches, User, User.id == match_id)
+    else:
+        stmt = (
+            select(literal("playlist"), Playlist.id, Playlist.name, Playlist.thumbnail, User.username, rank, total)
+            .join_from(matches, Playlist, Playlist.id == match_id)
+            .join(User, Playlist.user_id == User.id)
         )
-        .limit(5)
-        .all()
-    )
 
-    song_results = [
-        SearchResultDict(type="song", id=song.id, name=song.name, thumb_url=song.thumb_url, artist_name=username)
-        for song, username in songs
-    ]
-
-    # Search artists
-    artists = (
-        db.session.query(User)
-        .filter(or_(User.username.ilike(f"%{query}%"), User.stage_name.ilike(f"%{query}%")))
-        .limit(5)
-        .all()
-    )
+    if cursor is not None:
+        stmt = stmt.where(tuple_(rank, match_id) < tuple_(literal(cursor[0]), literal(cursor[1])))
+
+    # wrapped in a subquery, sqlite does not allow ORDER BY or LIMIT on compound select members
+    return stmt.order_by(rank.desc(), match_id.desc()).limit(limit + 1).subquery()
 
-    artist_results = [
-        SearchResultDict(
-            type="artist",
-            id=artist.id,
-            name=artist.stage_name or artist.username,
-            thumb_url=artist.profile_image,
-            artist_name=None,
+
+def count_branch(kind: SearchKind, matches: Subquery) -> Subquery:
+    """
+    The number of matches of a kind as a CountRow, counted over every match rather than the rows of a page,
+    so a page past the last match still gets its total
+    """
+    return (
+        select(
+            literal(kind),
+            cast(null(), Integer).label("id"),
+            cast(null(), String).label("name"),
+            cast(null(), String).label("thumb_url"),
+            cast(null(), String).label("artist_name"),
+            cast(null(), BigInteger).label("rank"),
+            func.count().label("total"),
         )
-        for artist in artists
-    ]
-
-    # Search playlists
-    playlists = (
-        db.session.query(Playlist, User.username)
-        .join(User, Playlist.user_id == User.id)
-        .filter(Playlist.name.ilike(f"%{query}%"))
-        .limit(5)
-        .all()
+        .select_from(matches)
+        .subquery()
     )
 
-    playlist_results = [
-        SearchResultDict(
-            type="playlist", id=playlist.id, name=playlist.name, thumb_url=playlist.thumbnail, artist_name=username
+
+def run_branches(branches: list[Subquery]) -> list[SearchRow | CountRow]:
+    """Run every branch in one UNION ALL statement"""
+    rows = db.session.execute(union_all(*(select(branch) for branch in branches))).all()
+
+    return [row.tuple() for row in rows]
+
+
+def fuzzy_subquery(kind: SearchKind, ranks: dict[int, float]) -> Subquery:
+    """(id, rank) of trigram matches found outside the database, in the shape ranked_matches returns"""
+    id_column = {"song": Song.id, "artist": User.id, "playlist": Playlist.id}[kind]
+
+    return (
+        select(id_column.label("id"), case(ranks, value=id_column).label("rank")).where(id_column.in_(ranks)).subquery()
+    )
+
+
+@search_routes.route("/api/search")
+def search() -> SearchResponse | ApiErrorResponse:
+    """
+    Search songs, artists and playlists by name, best matches first.
+
+    Every requested type is fetched in a single UNION ALL query, each type with its own limit and cursor.
+    Types without a full text match on their first page fall back to typo tolerant trigram matching,
+    which costs a second query only when it is needed. Up to MAX_FUZZY_MATCHES of those are paged like full
+    text matches, their cursors go straight to the fallback.
+    """
+    query = request.args.get("q", "")
+    terms = query_terms(query)
+
+    kinds: list[SearchKind] = KINDS
+    if "types" in request.args:
+        requested = request.args["types"].split(",")
+        if not requested or any(t not in KINDS for t in requested):
+            return invalid_types_error
+        kinds = [kind for kind in KINDS if kind in requested]
+
+    counts = request.args.get("counts", "").lower() in ("1", "true")
+
+    limits: dict[SearchKind, int] = {}
+    cursors: dict[SearchKind, tuple[int, int, bool] | None] = {}
+
+    for kind in kinds:
+        limit = parse_limit(request.args.get(f"{kind}_limit", request.args.get("limit")), DEFAULT_SEARCH_LIMIT)
+        if limit is None:
+            return invalid_limit_error
+        limits[kind] = limit
+
+        cursor = request.args.get(f"{kind}_cursor")
+        cursors[kind] = decode_rank_cursor(cursor) if cursor is not None else None
+        if cursor is not None and cursors[kind] is None:
+            return invalid_cursor_error
+
+    if len(query) < 2 or not terms:
+        return SearchResponse(results=[], pages={kind: SearchPage() for kind in kinds})
+
+    def position(kind: SearchKind) -> tuple[int, int] | None:
+        position = cursors[kind]
+        return position[:2] if position is not None else None
+
+    def continues_fuzzy(kind: SearchKind) -> bool:
+        position = cursors[kind]
+        return position is not None and position[2]
+
+    # later pages of typo tolerant matches skip the full text query, which found nothing
+    fulltext: list[SearchKind] = [kind for kind in kinds if not continues_fuzzy(kind)]
+    by_kind: dict[str, list[SearchRow]] = {kind: [] for kind in kinds}
+    totals: dict[str, int] = {}
+
+    def collect(branches: list[tuple[SearchKind, Subquery]]):
+        """Run a page branch, and a count branch if counts were asked for, per (kind, matches)"""
+        pages = [search_branch(kind, matches, limits[kind], position(kind)) for kind, matches in branches]
+        if counts:
+            pages += [count_branch(kind, matches) for kind, matches in branches]
+
+        for row in run_branches(pages):
+            if row[1] is None:
+                totals[row[0]] = row[6]
+            else:
+                by_kind[row[0]].append(row)
+
+    if fulltext:
+        collect([(kind, ranked_matches(kind, terms).subquery()) for kind in fulltext])
+
+    # nothing matched on a first page, so the query is probably misspelled
+    fuzzy: dict[SearchKind, dict[int, float]] = {}
+    for kind in kinds:
+        if (cursors[kind] is None and not by_kind[kind]) or continues_fuzzy(kind):
+            ranks = dict(fuzzy_matches(kind, query, MAX_FUZZY_MATCHES))
+            if ranks:
+                fuzzy[kind] = ranks
+
+    if fuzzy:
+        # typo tolerant totals replace the empty full text ones
+        collect([(kind, fuzzy_subquery(kind, ranks)) for kind, ranks in fuzzy.items()])
+
+    results: list[SearchResultDict] = []
+    pages: dict[SearchKind, SearchPage] = {}
+
+    for kind in kinds:
+        page_rows = sorted(by_kind[kind], key=lambda row: (row[5], row[1]), reverse=True)
+        page = pages[kind] = SearchPage()
+
+        if len(page_rows) > limits[kind]:
+            page_rows = page_rows[: limits[kind]]
+            page["next_cursor"] = encode_rank_cursor(page_rows[-1][5], page_rows[-1][1], kind in fuzzy)
+
+        if counts:
+            page["total"] = totals.get(kind, 0)
+
+        results.extend(
+            SearchResultDict(type=kind, id=id, name=name, thumb_url=thumb_url, artist_name=artist_name)
+            for _, id, name, thumb_url, artist_name, _, _ in page_rows
         )
-        for playlist, username in playlists
-    ]
 
-    all_results = song_results + artist_results + playlist_results
-    return SearchResponse(results=all_results)
+    return SearchResponse(results=results, pages=pages)
+
+
+@search_routes.route("/api/search/suggest")
+def suggest() -> SuggestResponse:
+    """Autocomplete song, artist and playlist names by prefix, served from memory"""
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", "")
+
+    n = min(int(limit), MAX_SUGGESTIONS) if limit.isdigit() else DEFAULT_SUGGESTIONS
+
+    return {
+        "suggestions": [
+            {"type": kind, "id": id, "name": name} for kind, id, name in catalog_indexes.prefix_index().search(query, n)
+        ]
+    }
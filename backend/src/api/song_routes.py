@@ -1,31 +1,42 @@
-from flask import Blueprint, request
+from typing import cast
+from flask import Blueprint, Response, request
 from flask_login import login_required, current_user  # pyright: ignore
-from sqlalchemy import select
-from ..models import Song, db
-from ..backend_api import GetSongs, ApiErrorResponse, IdAndTimestamps, GetSong, NoBody, Ok, Created
+from sqlalchemy import func, literal, select, tuple_
+from ..models import Song, SongWaveform, User, db
+from ..backend_api import GetSongs, ApiErrorResponse, IdAndTimestamps, GetSong, NoBody, Ok, Created, UploadKind
 from ..forms.song_form import SongForm, NewSongForm
-from .aws_integration import (
-    get_unique_filename,
-    SongFile,
-    ImageFile,
-    remove_file_from_s3,
-    HasFileName,
-    SOUND_BUCKET_NAME,
-    IMAGE_BUCKET_NAME,
-    AUDIO_CONTENT_EXT_MAP,
-    IMAGE_CONTENT_EXT_MAP,
-    DEFAULT_THUMBNAIL_IMAGE,
-)
-from ..db_to_api import db_song_to_api_song
+from .aws_integration import HasFileName, SOUND_BUCKET_NAME, IMAGE_BUCKET_NAME
+from ..db_to_api import load_api_songs
+from ..search.catalog import names_changed, names_removed
+from ..response_cache import cache_tags, response_cache
+from ..conditional import check_validators, validate
+from ..cdn import edge_cached
+from ..storage import release
+from ..jobs import enqueue
+from ..media import DEFAULT_WAVEFORM_BUCKETS, WAVEFORM_BUCKETS, queue_processing
+from ..static_files import IMMUTABLE_MAX_AGE
+from ..song_cache import ranged_file_response, song_cache
+from ..uploads import SPECS, claim_upload, store_file
+from ..pagination import decode_cursor, encode_cursor, parse_limit, invalid_cursor_error, invalid_limit_error
 from datetime import datetime, timezone
-import os
 
 song_routes = Blueprint("songs", __name__)
 
+# seconds clients and the CDN may keep a streamed song
+STREAM_MAX_AGE = 24 * 60 * 60
+
 song_not_found_error: ApiErrorResponse = (
     {"message": "Song Not Found", "errors": {"song_not_found_error": "This song could not be found"}},
     404,
 )
+waveform_not_ready_error: ApiErrorResponse = (
+    {"message": "Waveform Not Ready", "errors": {"waveform": "This song has not been processed yet"}},
+    404,
+)
+rendition_not_found_error: ApiErrorResponse = (
+    {"message": "Rendition Not Found", "errors": {"rendition": "This song has no rendition with that name"}},
+    404,
+)
 not_authorized_error: ApiErrorResponse = (
     {
         "message": "Not Authorized",
@@ -35,72 +46,227 @@ not_authorized_error: ApiErrorResponse = (
 )
 
 
-def create_resource_on_aws(resource: HasFileName, file_type: str):
-    ## prepare and upload the file
-    unique_filename = get_unique_filename(resource.filename)
-    file_ext = os.path.splitext(unique_filename)[1]
-    if file_type == "song":
-        file_content_type = f"audio/{AUDIO_CONTENT_EXT_MAP[file_ext[1:]]}"
-        file = SongFile(unique_filename, file_content_type, resource)
-        file_reference = file.upload()
-        return file_reference["url"]
-    else:
-        file_content_type = f"image/{IMAGE_CONTENT_EXT_MAP[file_ext[1:]]}"
-        file = ImageFile(unique_filename, file_content_type, resource)
-        file_reference = file.upload()
-        return file_reference["url"]
+def create_resource_on_aws(resource: HasFileName, file_type: UploadKind) -> str | ApiErrorResponse:
+    """Store a file uploaded through this server, or reuse the stored file with the same content"""
+    return store_file(file_type, resource.filename, resource)
 
 
-def delete_resource_from_aws(filename: str, file_type: str):
-    if file_type == "song":
-        resource_name = filename.rsplit("/", 1)[1]
-        bucket_name = SOUND_BUCKET_NAME
-    else:
-        resource_name = filename.rsplit("/", 1)[1]
-        bucket_name = IMAGE_BUCKET_NAME
+def attached_file(
+    token: str | None, resource: HasFileName | None, file_type: UploadKind, field: str
+) -> str | ApiErrorResponse | None:
+    """
+    The url of a file attached to a form, either as an upload token from POST /api/uploads
+    or uploaded through this server as resource. None if neither was given.
+    """
+    if token:
+        return claim_upload(token, file_type, current_user.id, field)
+
+    if resource is not None:
+        return create_resource_on_aws(resource, file_type)
+
+    return None
+
+
+def discard_stored(url: str, file_type: UploadKind) -> None:
+    """
+    Give up on a record that will not be saved, after a file was stored through this server for it.
+    The file is deleted unless it is used by something else (see ..storage.delete_object).
+    """
+    db.session.rollback()
+    enqueue("delete_object", bucket=SPECS[file_type].bucket, key=url.rsplit("/", 1)[1])
+    db.session.commit()
+
 
-    remove_file_from_s3(resource_name, bucket_name)
+def delete_resource_from_aws(filename: str, file_type: str):
+    """Release a record's reference to a stored file, which is deleted once nothing uses it"""
+    release(filename, SOUND_BUCKET_NAME if file_type == "song" else IMAGE_BUCKET_NAME)
 
 
 @song_routes.get("")
-def get_all_songs() -> GetSongs:
+@edge_cached
+@response_cache.cached
+def get_all_songs() -> GetSongs | ApiErrorResponse | Response:
     """
     Check for query params first to see if we need to filter by an artist_id.
-    Query for all songs and return them in a list of song dictionaries.
+    Query one page of songs (newest first) and return them in a list of song dictionaries,
+    along with a cursor to fetch the next page if there is one.
     """
     artist_id: str | None = request.args.get("artist_id")
+    cursor: str | None = request.args.get("cursor")
+
+    limit = parse_limit(request.args.get("limit"))
+
+    if limit is None:
+        return invalid_limit_error
+
+    query = select(Song)
 
     if artist_id and artist_id.isdigit():
-        id: int = int(artist_id)
+        query = query.where(Song.artist_id == int(artist_id))
 
-        songs = db.session.execute(select(Song).filter(Song.artist_id == id).order_by(Song.created_at.desc()))
+    if cursor is not None:
+        position = decode_cursor(cursor)
 
-        return {"songs": [db_song_to_api_song(song) for (song,) in songs]}
+        if position is None:
+            return invalid_cursor_error
 
-    else:
-        songs = db.session.execute(select(Song).order_by(Song.created_at.desc()))
+        created_at, last_id = position
+
+        # keyset pagination, served by the (artist_id,) created_at, id indexes
+        query = query.where(tuple_(Song.created_at, Song.id) < tuple_(literal(created_at), literal(last_id)))
+
+    # fetch one extra row to find out if there is another page
+    query = query.order_by(Song.created_at.desc(), Song.id.desc()).limit(limit + 1)
+
+    # the ids on the page for its cache tags, with everything else shown for them aggregated over the page, without
+    # building the page. like count sums weighted by id catch likes, which do not bump updated_at
+    page = (
+        query.with_only_columns(
+            Song.id, Song.artist_id, Song.updated_at, Song.like_count, User.updated_at.label("artist_updated_at")
+        )
+        .join(User, Song.artist_id == User.id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(
+            page.c.id,
+            page.c.artist_id,
+            func.max(page.c.updated_at).over(),
+            func.max(page.c.artist_updated_at).over(),
+            func.sum(page.c.like_count).over(),
+            func.sum(page.c.like_count * page.c.id).over(),
+        )
+    ).all()
+
+    # a new song changes every list, other changes only the lists showing that song or artist. Tagged before
+    # validating, so a 304 carries the tags to the CDN too
+    cache_tags("songs-list", *(f"song-{row[0]}" for row in rows[:limit]), *(f"artist-{row[1]}" for row in rows[:limit]))
+
+    # no Last-Modified, likes and deletes change the page without changing any timestamp
+    unchanged = check_validators("songs", [row[:2] for row in rows], rows[0][2:] if rows else None)
+    if unchanged is not None:
+        return unchanged
+
+    songs = load_api_songs(query)
+
+    out: GetSongs = {"songs": songs[:limit]}
+
+    if len(songs) > limit:
+        last = songs[limit - 1]
+        out["next_cursor"] = encode_cursor(last["created_at"], last["id"])
 
-        return {"songs": [db_song_to_api_song(song) for (song,) in songs]}
+    return out
 
 
 @song_routes.get("/<int:song_id>")
+@edge_cached
+@response_cache.cached
 def get_song(
     song_id: int,
-) -> ApiErrorResponse | GetSong:
+) -> ApiErrorResponse | GetSong | Response:
     """
     Query for single song where song_id matches and associate any likes with that song through likes_join table
     """
 
-    song = db.session.execute(select(Song).where(Song.id == song_id)).one_or_none()
+    version = db.session.execute(
+        select(Song.updated_at, Song.like_count, User.id, User.updated_at)
+        .join(User, Song.artist_id == User.id)
+        .where(Song.id == song_id)
+    ).one_or_none()
 
-    if not song:
+    if version is None:
         return song_not_found_error
 
-    s: Song = song[0]
+    song_updated_at, like_count, artist_id, artist_updated_at = version
 
-    song_details: GetSong = db_song_to_api_song(s)
+    # before validating, so a 304 carries the tags to the CDN too
+    cache_tags(f"song-{song_id}", f"artist-{artist_id}")
 
-    return song_details
+    unchanged = check_validators(
+        "song",
+        song_id,
+        song_updated_at,
+        like_count,
+        artist_updated_at,
+    )
+    if unchanged is not None:
+        return unchanged
+
+    songs = load_api_songs(select(Song).where(Song.id == song_id))
+
+    if not songs:
+        return song_not_found_error
+
+    return songs[0]
+
+
+@song_routes.get("/<int:song_id>/waveform")
+def get_waveform(song_id: int) -> ApiErrorResponse | Response:
+    """
+    Peaks of a song's waveform as int8 (min, max) pairs, at the resolution given by the buckets query param.
+    A song's peaks never change, so clients and the CDN keep them for as long as they like.
+    """
+    buckets = request.args.get("buckets", DEFAULT_WAVEFORM_BUCKETS, type=int)
+
+    if buckets not in WAVEFORM_BUCKETS:
+        return {
+            "message": "Invalid Resolution",
+            "errors": {"buckets": f"buckets must be one of {', '.join(map(str, WAVEFORM_BUCKETS))}"},
+        }, 400
+
+    peaks = db.session.scalar(
+        select(SongWaveform.peaks).where(SongWaveform.song_id == song_id, SongWaveform.buckets == buckets)
+    )
+
+    if peaks is None:
+        return song_not_found_error if db.session.get(Song, song_id) is None else waveform_not_ready_error
+
+    response = Response(peaks, mimetype="application/octet-stream")
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+
+    return response
+
+
+@song_routes.get("/<int:song_id>/stream")
+def stream_song(song_id: int) -> ApiErrorResponse | Response:
+    """
+    The song's original, or the rendition named by the rendition query param, with support for Range requests.
+    Served from a local disk cache of stored files, see src/song_cache.py.
+    """
+    song = db.session.get(Song, song_id)
+
+    if song is None:
+        return song_not_found_error
+
+    name = request.args.get("rendition")
+
+    if name is None:
+        url = song.song_ref
+        content_type = SPECS["song"].content_types.get(url.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+    else:
+        rendition = next((r for r in song.renditions if r.name == name), None)
+        if rendition is None:
+            return rendition_not_found_error
+
+        url, content_type = rendition.url, rendition.content_type
+
+    # stored files never change under the same key
+    key = url.rsplit("/", 1)[1]
+
+    unchanged = validate(key, None)
+    if unchanged is not None:
+        return unchanged
+
+    response = ranged_file_response(song_cache.open(SOUND_BUCKET_NAME, key), content_type, key)
+
+    # the song may be deleted, so not for as long as a waveform. A 416 is not worth keeping
+    if response.status_code in (200, 206):
+        response.cache_control.public = True
+        response.cache_control.max_age = STREAM_MAX_AGE
+
+    return response
 
 
 @song_routes.post("")
@@ -111,12 +277,19 @@ def upload_song() -> ApiErrorResponse | Created[IdAndTimestamps]:
     form["csrf_token"].data = request.cookies["csrf_token"]
 
     if form.validate_on_submit():
-        song_url = create_resource_on_aws(form.data["song_file"], "song")
+        song_url = attached_file(form.data["song_upload"], form.data["song_file"], "song", "song_upload")
+        if isinstance(song_url, tuple):
+            return song_url
 
         # handle set thumbnail to None or user provided file
-        thumbnail_url_or_none = None
-        if form.data["thumbnail_img"] is not None:
-            thumbnail_url_or_none = create_resource_on_aws(form.data["thumbnail_img"], "image")
+        thumbnail_url_or_none = attached_file(
+            form.data["thumbnail_upload"], form.data["thumbnail_img"], "image", "thumbnail_upload"
+        )
+        if isinstance(thumbnail_url_or_none, tuple):
+            # a song uploaded through this server is already in S3, a claimed one stays the client's
+            if not form.data["song_upload"] and song_url is not None:
+                discard_stored(song_url, "song")
+            return thumbnail_url_or_none
 
         ## create a song instance on the db
         new_song = Song(
@@ -124,17 +297,21 @@ def upload_song() -> ApiErrorResponse | Created[IdAndTimestamps]:
             artist_id=current_user.id,
             genre=form.data["genre"],
             thumb_url=thumbnail_url_or_none,
-            song_ref=song_url,
+            song_ref=cast(str, song_url),
             created_at=datetime.now(timezone.utc),
             updated_at=datetime.now(timezone.utc),
         )
         db.session.add(new_song)
+        # transcoded by the worker once the upload is saved
+        queue_processing(new_song)
         db.session.commit()
+        names_changed("song", new_song.id, new_song.name, new_song.name)
+        response_cache.invalidate("songs-list", f"artist-songs-{new_song.artist_id}")
 
         return {
             "id": int(new_song.id),
-            "created_at": str(new_song.created_at),
-            "updated_at": str(new_song.updated_at),
+            "created_at": new_song.created_at,
+            "updated_at": new_song.updated_at,
         }, 201
 
     return form.errors, 400
@@ -159,17 +336,26 @@ def update_song(song_id: int) -> ApiErrorResponse | IdAndTimestamps:
         song_to_update.name = form.data["name"]
         song_to_update.genre = form.data["genre"]
         song_to_update.updated_at = datetime.now(timezone.utc)
-        if form.data["thumbnail_img"] is not None:
-            delete_resource_from_aws(song_to_update.thumb_url or DEFAULT_THUMBNAIL_IMAGE, "image")
-            thumbnail_url = create_resource_on_aws(form.data["thumbnail_img"], "image")
+
+        thumbnail_url = attached_file(
+            form.data["thumbnail_upload"], form.data["thumbnail_img"], "image", "thumbnail_upload"
+        )
+        if isinstance(thumbnail_url, tuple):
+            return thumbnail_url
+
+        if thumbnail_url is not None:
+            if song_to_update.thumb_url:
+                delete_resource_from_aws(song_to_update.thumb_url, "image")
             song_to_update.thumb_url = thumbnail_url
 
         db.session.commit()
+        names_changed("song", song_to_update.id, song_to_update.name, song_to_update.name)
+        response_cache.invalidate(f"song-{song_id}")
 
         return {
             "id": song_to_update.id,
-            "created_at": str(song_to_update.created_at),
-            "updated_at": str(song_to_update.updated_at),
+            "created_at": song_to_update.created_at,
+            "updated_at": song_to_update.updated_at,
         }
 
     return form.errors, 400
@@ -187,10 +373,18 @@ def delete_song(song_id: int) -> Ok[NoBody] | ApiErrorResponse:
     if song_to_delete.artist_id != current_user.id:
         return not_authorized_error
 
-    # delete the resource from AWS s3
+    # delete the resources from AWS s3 unless other records use them
     delete_resource_from_aws(song_to_delete.song_ref, "song")
+    if song_to_delete.thumb_url:
+        delete_resource_from_aws(song_to_delete.thumb_url, "image")
+    for rendition in song_to_delete.renditions:
+        delete_resource_from_aws(rendition.url, "song")
+    if song_to_delete.preview_url:
+        delete_resource_from_aws(song_to_delete.preview_url, "song")
 
     db.session.delete(song_to_delete)
     db.session.commit()
+    names_removed("song", song_id)
+    response_cache.invalidate(f"song-{song_id}", f"comments-{song_id}", f"artist-songs-{song_to_delete.artist_id}")
 
     return "", 200
@@ -0,0 +1,174 @@
+from typing import cast
+from flask import Blueprint, Response, current_app, request
+from flask_login import current_user, login_required  # pyright: ignore
+from ..backend_api import (
+    ApiErrorResponse,
+    Created,
+    NewUpload,
+    NoBody,
+    Ok,
+    StoredUpload,
+    UploadSessionInfo,
+    UploadTicket,
+)
+from ..models import User
+from ..resumable import (
+    abort_session,
+    complete_session,
+    create_session,
+    find_session,
+    receive_chunk,
+    session_info,
+    session_not_found_error,
+)
+from ..uploads import presign_upload, receive_upload, upload_error
+
+upload_routes = Blueprint("uploads", __name__, url_prefix="/api/uploads")
+
+
+def new_upload_body() -> NewUpload | ApiErrorResponse:
+    body = request.get_json(silent=True)
+
+    if not isinstance(body, dict):
+        return upload_error("body", "body must be a JSON object")
+
+    body = cast(dict[str, object], body)
+
+    if (
+        not isinstance(body.get("kind"), str)
+        or not isinstance(body.get("filename"), str)
+        or not isinstance(body.get("size"), int)
+    ):
+        return upload_error("body", "kind, filename and size are required")
+
+    return cast(NewUpload, body)
+
+
+@upload_routes.post("")
+@login_required
+def new_upload() -> Created[UploadTicket] | ApiErrorResponse:
+    """Sign a direct upload to S3 for a song or image, to be attached to a record with the returned upload token"""
+    body = new_upload_body()
+    if isinstance(body, tuple):
+        return body
+
+    ticket = presign_upload(body, cast(User, current_user).id)
+
+    if isinstance(ticket, tuple):
+        return ticket
+
+    return ticket, 201
+
+
+@upload_routes.put("/<kind>")
+@login_required
+def stream_upload(kind: str) -> Created[StoredUpload] | ApiErrorResponse:
+    """
+    Upload a song or image through the server, sent as the raw request body with its name in the filename query
+    parameter. Returns an upload token like a direct upload to S3.
+    """
+    filename = request.args.get("filename")
+
+    if kind != "song" and kind != "image":
+        return upload_error("kind", "kind must be song or image")
+
+    if not filename:
+        return upload_error("filename", "filename is required")
+
+    stored = receive_upload(kind, filename, cast(User, current_user).id)
+
+    if isinstance(stored, tuple):
+        return stored
+
+    return stored, 201
+
+
+def session_response(info: UploadSessionInfo, status: int = 200) -> Response:
+    """Session info, with the offset and length also in tus style headers"""
+    response = current_app.make_response((info, status))
+    response.headers["Upload-Offset"] = str(info["offset"])
+    response.headers["Upload-Length"] = str(info["length"])
+    response.cache_control.no_store = True
+    return response
+
+
+@upload_routes.post("/sessions")
+@login_required
+def new_upload_session() -> Response | ApiErrorResponse:
+    """Start a resumable upload of a song or image, sent in chunks with PATCH"""
+    body = new_upload_body()
+    if isinstance(body, tuple):
+        return body
+
+    session = create_session(body, cast(User, current_user).id)
+
+    if isinstance(session, tuple):
+        return session
+
+    return session_response(session_info(session), 201)
+
+
+@upload_routes.get("/sessions/<session_id>")
+@login_required
+def get_upload_session(session_id: str) -> Response | ApiErrorResponse:
+    """How much of the file has been received, so an interrupted upload knows where to continue"""
+    session = find_session(session_id, cast(User, current_user).id)
+
+    if session is None:
+        return session_not_found_error
+
+    return session_response(session_info(session))
+
+
+@upload_routes.patch("/sessions/<session_id>")
+@login_required
+def patch_upload_session(session_id: str) -> Response | ApiErrorResponse:
+    """Receive the next chunk of the file, starting at the Upload-Offset header"""
+    offset = request.headers.get("Upload-Offset", type=int)
+
+    if offset is None:
+        return upload_error("Upload-Offset", "Upload-Offset header is required")
+
+    # receive_chunk leases the session instead of holding a row lock across its commits
+    session = find_session(session_id, cast(User, current_user).id)
+
+    if session is None:
+        return session_not_found_error
+
+    session = receive_chunk(session, offset)
+
+    if isinstance(session, tuple):
+        return session
+
+    return session_response(session_info(session))
+
+
+@upload_routes.post("/sessions/<session_id>/complete")
+@login_required
+def complete_upload_session(session_id: str) -> Created[StoredUpload] | ApiErrorResponse:
+    """Assemble a fully received file, returning an upload token like the other kinds of upload"""
+    session = find_session(session_id, cast(User, current_user).id, lock=True)
+
+    if session is None:
+        return session_not_found_error
+
+    stored = complete_session(session)
+
+    if isinstance(stored, tuple):
+        return stored
+
+    return stored, 201
+
+
+@upload_routes.delete("/sessions/<session_id>")
+@login_required
+def delete_upload_session(session_id: str) -> Ok[NoBody] | ApiErrorResponse:
+    """Give up on an upload, discarding the parts received so far"""
+    session = find_session(session_id, cast(User, current_user).id, lock=True)
+
+    if session is None:
+        return session_not_found_error
+
+    abort_session(session)
+
+    return ""
@@ -0,0 +1,135 @@
+"""
+Caching at the CDN in front of the API (cloudflare in production).
+
+Routes wrapped in edge_cached send Cache-Control headers that let the edge keep their responses for
+CDN_S_MAXAGE seconds and serve stale copies while it revalidates. They also send the route's cache tags
+(see .response_cache.cache_tags) as Surrogate-Key and Cache-Tag headers, and get no csrf cookie, because
+the edge will not cache a response that sets one.
+
+When a handler invalidates tags, the tags are collected and queued as a single cdn_purge job once the response
+is built, so a write never waits on the CDN's API, and a failed purge is retried by the job queue.
+"""
+
+import json
+import urllib.request
+from functools import wraps
+from typing import Any, Callable, Protocol, cast
+from flask import Flask, Response, current_app, g, has_request_context
+from .jobs import enqueue_now, handler
+
+
+class Purger(Protocol):
+    def purge(self, tags: set[str]) -> None: ...
+
+
+class NullPurger:
+    """For deployments without a CDN"""
+
+    def purge(self, tags: set[str]) -> None:
+        pass
+
+
+class CloudflarePurger:
+    """Purges by Cache-Tag through the cloudflare API"""
+
+    API = "https://api.cloudflare.com/client/v4/zones/{zone}/purge_cache"
+    # cloudflare accepts at most this many tags per purge request
+    BATCH = 30
+
+    def __init__(self, zone_id: str, api_token: str) -> None:
+        self.url = self.API.format(zone=zone_id)
+        self.api_token = api_token
+
+    def purge(self, tags: set[str]) -> None:
+        ordered = sorted(tags)
+
+        for i in range(0, len(ordered), self.BATCH):
+            request = urllib.request.Request(
+                self.url,
+                data=json.dumps({"tags": ordered[i : i + self.BATCH]}).encode(),
+                headers={"Authorization": f"Bearer {self.api_token}", "Content-Type": "application/json"},
+                method="POST",
+            )
+
+            # a failure fails the job, which retries every batch, purging a tag twice is harmless
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+
+
+class EdgeCache:
+    def __init__(self) -> None:
+        self.purger: Purger = NullPurger()
+        self.s_maxage = 60
+        self.stale_while_revalidate = 300
+
+    def init_app(self, app: Flask) -> None:
+        self.s_maxage = cast(int, app.config["CDN_S_MAXAGE"])
+        self.stale_while_revalidate = cast(int, app.config["CDN_STALE_WHILE_REVALIDATE"])
+
+        match cast(str, app.config["CDN_PURGER"]):
+            case "cloudflare":
+                self.purger = CloudflarePurger(
+                    cast(str, app.config["CLOUDFLARE_ZONE_ID"]), cast(str, app.config["CLOUDFLARE_API_TOKEN"])
+                )
+            case _:
+                self.purger = NullPurger()
+
+        app.after_request(send_purges)
+
+
+edge_cache = EdgeCache()
+
+
+def edge_cached[**P](view: Callable[P, Any]) -> Callable[P, Any]:
+    """Mark a public GET route as cacheable by the CDN, tagged with its cache tags"""
+
+    @wraps(view)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> Any:
+        response = current_app.make_response(view(*args, **kwargs))
+
+        if response.status_code in (200, 304):
+            response.cache_control.public = True
+            # browsers revalidate every time, which is cheap with the ETag
+            response.cache_control.max_age = 0
+            response.cache_control.s_maxage = edge_cache.s_maxage
+            response.cache_control.stale_while_revalidate = edge_cache.stale_while_revalidate
+
+            tags = sorted(cast(set[str], g.get("cache_tags", set[str]())))
+            if tags:
+                response.headers["Surrogate-Key"] = " ".join(tags)
+                response.headers["Cache-Tag"] = ",".join(tags)
+
+        return response
+
+    return wrapper
+
+
+def is_edge_cacheable(response: Response) -> bool:
+    """Whether a response may be stored by the CDN, in which case it must not set cookies"""
+    return bool(response.cache_control.public)
+
+
+@handler("cdn_purge")
+def purge_cdn(tags: list[str]) -> None:
+    edge_cache.purger.purge(set(tags))
+
+
+def queue_purge(*tags: str) -> None:
+    """Purge tags from the CDN, from a job queued after the current request, or right away outside of a request"""
+    if isinstance(edge_cache.purger, NullPurger) or not tags:
+        return
+
+    if has_request_context():
+        cast(set[str], g.setdefault("purge_tags", set())).update(tags)
+    else:
+        enqueue_now("cdn_purge", tags=sorted(tags))
+
+
+def send_purges(response: Response) -> Response:
+    """after_request hook queueing one job to purge the tags collected during the request"""
+    tags: set[str] | None = g.get("purge_tags")
+
+    if tags:
+        enqueue_now("cdn_purge", tags=sorted(tags))
+
+    return response
@@ -0,0 +1,93 @@
+import signal
+from typing import cast
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import func, select, update
+from .models import db, likes_join, Song
+from .jobs import Worker, retry_failed
+from .media import media_pool, queue_backfill
+from .resumable import cleanup_expired
+from .storage import rebuild_ref_counts
+from .uploads import forget_expired_claims
+
+# Maintenance commands for denormalized data
+# So we can type `flask likes --help`
+likes_commands = AppGroup("likes")
+
+
+# Creates the `flask likes rebuild-counts` command
+@likes_commands.command("rebuild-counts")
+def rebuild_like_counts():
+    """Recompute songs.like_count from likes_join, repairing any drift"""
+    actual = select(func.count()).select_from(likes_join).where(likes_join.song_id == Song.id).scalar_subquery()
+
+    result = db.session.execute(update(Song).where(Song.like_count != actual).values(like_count=actual))
+    db.session.commit()
+
+    click.echo(f"Repaired like counts on {result.rowcount} songs")
+
+
+# `flask uploads --help`
+upload_commands = AppGroup("uploads")
+
+
+@upload_commands.command("cleanup")
+def cleanup_upload_sessions():
+    """Abort expired resumable upload sessions, discarding their parts, and forget expired upload tokens"""
+    click.echo(f"Aborted {cleanup_expired()} expired upload sessions")
+    click.echo(f"Forgot {forget_expired_claims()} expired upload tokens")
+
+
+# `flask storage --help`
+storage_commands = AppGroup("storage")
+
+
+@storage_commands.command("rebuild-refs")
+def rebuild_refs():
+    """Recount the records using each stored file, adding files stored before reference counting"""
+    click.echo(f"Updated {rebuild_ref_counts()} stored objects")
+
+
+# Creates the `flask worker` command
+@click.command("worker")
+@click.option("--concurrency", type=int, help="Jobs to run at once, JOB_CONCURRENCY by default")
+@click.option("--once", is_flag=True, help="Exit once no jobs are ready instead of waiting for more")
+@with_appcontext
+def run_worker(concurrency: int | None, once: bool):
+    """Run background jobs until stopped, finishing running jobs on SIGTERM or ctrl-c"""
+    worker = Worker(cast(Flask, current_app._get_current_object()), concurrency)  # pyright: ignore
+
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+
+    succeeded, failed = worker.run(once=once)
+    click.echo(f"Ran {succeeded + failed} jobs, {failed} failed")
+
+
+# `flask jobs --help`
+job_commands = AppGroup("jobs")
+
+
+@job_commands.command("retry-failed")
+def retry_failed_jobs():
+    """Queue jobs that ran out of attempts again"""
+    click.echo(f"Queued {retry_failed()} failed jobs")
+
+
+# `flask media --help`
+media_commands = AppGroup("media")
+
+
+@media_commands.command("backfill")
+@click.option("--enqueue-only", is_flag=True, help="Only queue the jobs, for workers that are already running")
+def backfill_media(enqueue_only: bool):
+    """Probe and derive renditions, waveforms and previews for songs missing any, a job per media process at a time"""
+    click.echo(f"Queued {queue_backfill()} jobs")
+
+    if enqueue_only:
+        return
+
+    worker = Worker(cast(Flask, current_app._get_current_object()), media_pool.processes)  # pyright: ignore
+    succeeded, failed = worker.run(once=True)
+    click.echo(f"Ran {succeeded + failed} jobs, {failed} failed")
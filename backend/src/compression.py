@@ -0,0 +1,172 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Dynamic responses (JSON, and anything else text like) of at least COMPRESS_MIN_SIZE bytes are compressed on the fly
+at COMPRESS_GZIP_LEVEL or COMPRESS_BROTLI_QUALITY, which are kept moderate because every response pays for them.
+Streamed responses are compressed chunk by chunk, flushing after each one so the client still gets rows as they
+are encoded. Static files are not compressed here, see .static_files for their precompressed siblings.
+
+Brotli is used when the optional brotli package is installed, gzip otherwise.
+"""
+
+import gzip
+import importlib
+import zlib
+from typing import Any, Iterable, Iterator, Protocol, cast
+from flask import Flask, Request, Response, request
+
+COMPRESSIBLE_MIMETYPES = frozenset(
+    {
+        "application/json",
+        "application/javascript",
+        "image/svg+xml",
+        "text/css",
+        "text/html",
+        "text/javascript",
+        "text/plain",
+    }
+)
+
+
+def load_brotli() -> Any | None:
+    """The brotli module, if installed"""
+    try:
+        return importlib.import_module("brotli")
+    except ImportError:
+        return None
+
+
+brotli = load_brotli()
+
+
+def negotiate(req: Request, available: Iterable[str]) -> str | None:
+    """
+    The encoding out of available (br, gzip) the client prefers, or None for identity.
+    Ties in quality go to the earlier encoding in available.
+    """
+    best: str | None = None
+    best_quality = 0.0
+
+    for encoding in available:
+        quality = req.accept_encodings.quality(encoding)
+
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+class StreamCompressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """Compress data and flush it, so everything so far can be decoded"""
+        ...
+
+    def finish(self) -> bytes: ...
+
+
+class GzipStream:
+    def __init__(self, level: int) -> None:
+        # wbits 16 + max window writes a gzip header and trailer
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class BrotliStream:
+    def __init__(self, quality: int) -> None:
+        assert brotli is not None
+        self._c: Any = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return cast(bytes, self._c.process(data)) + cast(bytes, self._c.flush())
+
+    def finish(self) -> bytes:
+        return cast(bytes, self._c.finish())
+
+
+class Compression:
+    def __init__(self) -> None:
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+
+    def init_app(self, app: Flask) -> None:
+        self.min_size = cast(int, app.config["COMPRESS_MIN_SIZE"])
+        # clamped to what each format accepts
+        self.gzip_level = min(max(cast(int, app.config["COMPRESS_GZIP_LEVEL"]), 1), 9)
+        self.brotli_quality = min(max(cast(int, app.config["COMPRESS_BROTLI_QUALITY"]), 0), 11)
+
+        app.after_request(self.compress_response)
+
+    @property
+    def encodings(self) -> tuple[str, ...]:
+        """Encodings available for dynamic responses, in order of preference"""
+        return ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def compress(self, encoding: str, data: bytes) -> bytes:
+        if encoding == "br":
+            assert brotli is not None
+            return cast(bytes, brotli.compress(data, quality=self.brotli_quality))
+
+        return gzip.compress(data, self.gzip_level, mtime=0)
+
+    def stream(self, encoding: str) -> StreamCompressor:
+        return BrotliStream(self.brotli_quality) if encoding == "br" else GzipStream(self.gzip_level)
+
+    def _compress_stream(self, body: Iterable[str] | Iterable[bytes], compressor: StreamCompressor) -> Iterator[bytes]:
+        try:
+            for chunk in body:
+                data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+                if data:
+                    yield data
+
+            yield compressor.finish()
+        finally:
+            # the wrapped body may hold the request context open until it is closed
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+
+    def compress_response(self, response: Response) -> Response:
+        """after_request hook compressing responses the client accepts compressed"""
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or request.method == "HEAD"
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "Content-Encoding" in response.headers
+            # files sent with send_file, which serves precompressed siblings itself
+            or response.direct_passthrough
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        if not response.is_streamed and (response.content_length or 0) < self.min_size:
+            return response
+
+        encoding = negotiate(request, self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, self.stream(encoding))
+            response.headers.pop("Content-Length", None)
+        else:
+            response.set_data(self.compress(encoding, response.get_data()))
+
+        response.headers["Content-Encoding"] = encoding
+
+        # the compressed body is a different representation, but still equivalent for If-None-Match
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+
+compression = Compression()
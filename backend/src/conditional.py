@@ -0,0 +1,63 @@
+"""
+Conditional GET support (ETag / If-None-Match and Last-Modified / If-Modified-Since).
+
+Read routes call check_validators with values from a small query (updated_at timestamps, counts, like counters)
+before they load and serialize their body. If the client's copy is current it gets a bodyless 304 right away,
+otherwise add_validators attaches the ETag and Last-Modified headers to the full response.
+
+ETags cover everything a response shows. Last-Modified is only sent where a timestamp does too, responses that
+also show like counts or lists of rows change without any timestamp changing, and a client sending only
+If-Modified-Since would be told a stale copy is current. Clients that send If-None-Match are answered by the ETag
+alone, which is what browsers and the CDN do once they have seen one.
+"""
+
+from datetime import datetime
+from hashlib import blake2b
+from flask import Response, g, request
+from werkzeug.http import is_resource_modified
+
+
+def make_etag(*parts: object) -> str:
+    return blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def set_validators(response: Response, etag: str, last_modified: datetime | None) -> None:
+    response.set_etag(etag)
+
+    # assigning None would stamp the current time
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+
+def not_modified(etag: str, last_modified: datetime | None) -> Response:
+    response = Response(status=304)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def validate(etag: str, last_modified: datetime | None) -> Response | None:
+    """
+    Set the validators of the response being built.
+    Returns a 304 response to send instead if the client already has this version.
+    """
+    g.validators = (etag, last_modified)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return not_modified(etag, last_modified)
+
+    return None
+
+
+def check_validators(*parts: object, last_modified: datetime | None = None) -> Response | None:
+    """validate, with an ETag hashed from parts"""
+    return validate(make_etag(*parts), last_modified)
+
+
+def add_validators(response: Response) -> Response:
+    """after_request hook adding the validators set by check_validators to successful responses"""
+    validators: tuple[str, datetime | None] | None = g.get("validators")
+
+    if validators is not None and response.status_code == 200:
+        set_validators(response, *validators)
+
+    return response
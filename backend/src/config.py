@@ -5,7 +5,65 @@ def env(s: str) -> str:
     return os.environ[s]
 
 
+def env_or(s: str, default: str) -> str:
+    return os.environ.get(s, default)
+
+
 class Config:
     SQLALCHEMY_DATABASE_URI = env("DATABASE_URL")
     SECRET_KEY = env("SECRET_KEY")
     FLASK_RUN_PORT = env("FLASK_RUN_PORT")
+    # minimum trigram similarity (0-1) for typo tolerant search results
+    SEARCH_SIMILARITY_THRESHOLD = float(env_or("SEARCH_SIMILARITY_THRESHOLD", "0.3"))
+    # response cache for public GET endpoints, see src/response_cache.py
+    RESPONSE_CACHE_ENABLED = env_or("RESPONSE_CACHE_ENABLED", "1") == "1"
+    RESPONSE_CACHE_TTL = float(env_or("RESPONSE_CACHE_TTL", "30"))
+    RESPONSE_CACHE_MAX_ENTRIES = int(env_or("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+    RESPONSE_CACHE_MAX_BYTES = int(env_or("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    # larger responses (eg. long streamed lists) are sent without being stored
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = int(env_or("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+    # share the cache between workers through redis (requires the redis package)
+    RESPONSE_CACHE_REDIS_URL = os.environ.get("RESPONSE_CACHE_REDIS_URL")
+    # edge caching of public GET endpoints, see src/cdn.py
+    CDN_S_MAXAGE = int(env_or("CDN_S_MAXAGE", "60"))
+    CDN_STALE_WHILE_REVALIDATE = int(env_or("CDN_STALE_WHILE_REVALIDATE", "300"))
+    # one of none or cloudflare, purges are sent by `flask worker` (see src/jobs.py)
+    CDN_PURGER = env_or("CDN_PURGER", "none")
+    CLOUDFLARE_ZONE_ID = os.environ.get("CLOUDFLARE_ZONE_ID")
+    CLOUDFLARE_API_TOKEN = os.environ.get("CLOUDFLARE_API_TOKEN")
+    # on the fly compression of dynamic responses, see src/compression.py
+    COMPRESS_MIN_SIZE = int(env_or("COMPRESS_MIN_SIZE", "1024"))
+    COMPRESS_GZIP_LEVEL = int(env_or("COMPRESS_GZIP_LEVEL", "6"))
+    COMPRESS_BROTLI_QUALITY = int(env_or("COMPRESS_BROTLI_QUALITY", "4"))
+    # direct uploads to S3, see src/uploads.py
+    UPLOAD_MAX_SONG_BYTES = int(env_or("UPLOAD_MAX_SONG_BYTES", str(1024 * 1024 * 1024)))
+    UPLOAD_MAX_IMAGE_BYTES = int(env_or("UPLOAD_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+    # how long a signed upload policy can be used, and how long its token can then be attached to a record
+    UPLOAD_URL_EXPIRES = int(env_or("UPLOAD_URL_EXPIRES", "3600"))
+    UPLOAD_TOKEN_MAX_AGE = int(env_or("UPLOAD_TOKEN_MAX_AGE", str(24 * 60 * 60)))
+    # uploads streamed through the server, see src/ingest.py. A worker holds up to concurrency + 1 parts in memory
+    UPLOAD_PART_SIZE = int(env_or("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+    UPLOAD_CONCURRENCY = int(env_or("UPLOAD_CONCURRENCY", "4"))
+    # resumable upload sessions, see src/resumable.py. Parts are kept in S3 (s3) or under UPLOAD_SESSION_DIR (local)
+    UPLOAD_SESSION_STORE = env_or("UPLOAD_SESSION_STORE", "s3")
+    UPLOAD_SESSION_DIR = os.environ.get("UPLOAD_SESSION_DIR")
+    # seconds since a session was last written to before it expires
+    UPLOAD_SESSION_TTL = int(env_or("UPLOAD_SESSION_TTL", str(24 * 60 * 60)))
+    # seconds a chunk may take per part before another request may take over its session
+    UPLOAD_CHUNK_LEASE = int(env_or("UPLOAD_CHUNK_LEASE", "300"))
+    # background jobs, see src/jobs.py. A job that failed n times is retried after JOB_BACKOFF_BASE * 2^(n - 1)
+    # seconds, capped at JOB_BACKOFF_MAX, then scaled by a random 0.5 to 1 for jitter
+    JOB_CONCURRENCY = int(env_or("JOB_CONCURRENCY", "4"))
+    JOB_POLL_INTERVAL = float(env_or("JOB_POLL_INTERVAL", "1"))
+    JOB_MAX_ATTEMPTS = int(env_or("JOB_MAX_ATTEMPTS", "8"))
+    JOB_BACKOFF_BASE = float(env_or("JOB_BACKOFF_BASE", "5"))
+    JOB_BACKOFF_MAX = float(env_or("JOB_BACKOFF_MAX", str(60 * 60)))
+    # seconds a worker has to finish a job before another worker may take it over
+    JOB_LEASE = int(env_or("JOB_LEASE", "300"))
+    # processes decoding and encoding songs in the worker, see src/media.py. 0 for one per cpu
+    MEDIA_PROCESSES = int(env_or("MEDIA_PROCESSES", "0"))
+    # local cache of songs for GET /api/songs/<id>/stream, see src/song_cache.py
+    SONG_CACHE_DIR = os.environ.get("SONG_CACHE_DIR")
+    SONG_CACHE_MAX_BYTES = int(env_or("SONG_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+    SONG_CACHE_CHUNK_SIZE = int(env_or("SONG_CACHE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    SONG_CACHE_CONCURRENCY = int(env_or("SONG_CACHE_CONCURRENCY", "4"))
@@ -1,19 +1,39 @@
-from .models import Song, Playlist
+from flask import Response
+from sqlalchemy import Select
+from sqlalchemy.orm import selectinload
+from .models import Song, Playlist, User, db
 from .backend_api import GetSong, PlaylistInfo
 from .api.aws_integration import DEFAULT_THUMBNAIL_IMAGE
+from .streaming import json_list_response, stream_rows
 
 
-def db_song_to_api_song(song: Song) -> GetSong:
+def db_song_to_api_song(song: Song, display_name: str) -> GetSong:
     api_song: GetSong = {
         "id": song.id,
         "name": song.name,
         "artist_id": song.artist_id,
         "song_ref": song.song_ref,
-        "created_at": str(song.created_at),
-        "updated_at": str(song.updated_at),
-        "num_likes": len(song.liking_users),
+        "created_at": song.created_at,
+        "updated_at": song.updated_at,
+        "num_likes": song.like_count,
         "thumb_url": song.thumb_url or DEFAULT_THUMBNAIL_IMAGE,
-        "artist": {"id": song.artist.id, "display_name": song.artist.stage_name or song.artist.username},
+        "duration_ms": song.duration_ms,
+        "bitrate": song.bitrate,
+        "sample_rate": song.sample_rate,
+        "channels": song.channels,
+        "codec": song.codec,
+        "preview_url": song.preview_url,
+        "artist": {"id": song.artist_id, "display_name": display_name},
+        "renditions": [
+            {
+                "name": rendition.name,
+                "url": rendition.url,
+                "content_type": rendition.content_type,
+                "bitrate": rendition.bitrate,
+                "size": rendition.size,
+            }
+            for rendition in song.renditions
+        ],
     }
 
     if song.genre is not None:
@@ -22,12 +42,49 @@ def db_song_to_api_song(song: Song) -> GetSong:
     return api_song
 
 
+def api_song_query(query: Select[tuple[Song]]) -> Select[tuple[Song, str | None, str]]:
+    """
+    Join the artist onto a query selecting songs, adding the columns db_song_to_api_song needs.
+    Callers may add further columns after these.
+    """
+    return (
+        query.join(User, Song.artist_id == User.id)
+        .add_columns(User.stage_name, User.username)
+        # one more query for the renditions of every song loaded (or every batch of a streamed query)
+        .options(selectinload(Song.renditions))
+    )
+
+
+def load_api_songs(query: Select[tuple[Song]]) -> list[GetSong]:
+    """
+    Run a query selecting songs and project every row into a GetSong.
+    Artist display names are fetched by joining onto the query and like counts are read from the
+    denormalized like_count column, and renditions are loaded in one more query, so this costs two queries no matter
+    how many songs are returned.
+    """
+    rows = db.session.execute(api_song_query(query)).all()
+
+    return [db_song_to_api_song(song, stage_name or username) for song, stage_name, username in rows]
+
+
+def stream_api_songs(query: Select[tuple[Song]]) -> Response:
+    """
+    Like load_api_songs, but as a streamed GetSongs response.
+    For lists without a page size, where building the whole list up front would not be bounded.
+    """
+    return json_list_response(
+        "songs",
+        stream_rows(api_song_query(query)),
+        lambda row: db_song_to_api_song(row[0], row[1] or row[2]),
+    )
+
+
 def db_playlist_to_api(playlist: Playlist) -> PlaylistInfo:
     pinfo: PlaylistInfo = {
         "id": playlist.id,
         "name": playlist.name,
-        "created_at": str(playlist.created_at),
-        "updated_at": str(playlist.updated_at),
+        "created_at": playlist.created_at,
+        "updated_at": playlist.updated_at,
         "thumbnail": playlist.thumbnail or DEFAULT_THUMBNAIL_IMAGE,
     }
 
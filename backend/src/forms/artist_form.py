@@ -8,6 +8,8 @@ class ArtistForm(FlaskForm):
     stage_name = StringField("stage_name")
     first_release = StringField("first_release")
     profile_image = FileField("profile_image", validators=[FileAllowed(list(ALLOWED_IMAGE_EXTENSIONS))])
+    # token from POST /api/uploads, instead of profile_image
+    profile_image_upload = StringField("profile_image_upload")
     biography = StringField("biography")
     location = StringField("location")
     homepage = StringField("homepage")
@@ -8,3 +8,5 @@ from ..api.aws_integration import ALLOWED_IMAGE_EXTENSIONS
 class PlaylistForm(FlaskForm):
     name = StringField("name", validators=[DataRequired()])
     thumbnail_img = FileField("thumbnail_img", validators=[FileAllowed(list(ALLOWED_IMAGE_EXTENSIONS))])
+    # token from POST /api/uploads, instead of thumbnail_img
+    thumbnail_upload = StringField("thumbnail_upload")
@@ -1,7 +1,8 @@
+from typing import Any
 from flask_wtf import FlaskForm  # pyright: ignore
-from flask_wtf.file import FileField, FileAllowed, FileRequired  # pyright: ignore
+from flask_wtf.file import FileField, FileAllowed  # pyright: ignore
 from wtforms import StringField
-from wtforms.validators import DataRequired
+from wtforms.validators import DataRequired, ValidationError
 from ..api.aws_integration import ALLOWED_SOUND_EXTENSIONS, ALLOWED_IMAGE_EXTENSIONS
 
 
@@ -9,7 +10,16 @@ class SongForm(FlaskForm):
     name = StringField("song-name", validators=[DataRequired()])
     genre = StringField("genre")
     thumbnail_img = FileField("thumbnail-file", validators=[FileAllowed(list(ALLOWED_IMAGE_EXTENSIONS))])
+    # token from POST /api/uploads, instead of thumbnail_img
+    thumbnail_upload = StringField("thumbnail_upload")
+
+
+def file_or_upload(form: "NewSongForm", field: Any):
+    # the song is either uploaded to S3 directly or sent as a file
+    if not field.data and not form.data["song_upload"]:
+        raise ValidationError("A song file or song upload is required.")
 
 
 class NewSongForm(SongForm):
-    song_file = FileField("song-file", validators=[FileRequired(), FileAllowed(list(ALLOWED_SOUND_EXTENSIONS))])
+    song_file = FileField("song-file", validators=[file_or_upload, FileAllowed(list(ALLOWED_SOUND_EXTENSIONS))])
+    song_upload = StringField("song_upload")
@@ -0,0 +1,150 @@
+"""
+Streaming uploads through the server, for clients that cannot post to S3 themselves.
+
+The request body is the raw file. It is read in CHUNK_SIZE pieces and hashed as it arrives. The pieces are
+gathered into parts of UPLOAD_PART_SIZE bytes, and each part is sent to an S3 multipart upload while the
+next one is read. At most UPLOAD_CONCURRENCY parts are in flight at once, so a worker holds at most
+concurrency + 1 parts in memory and nothing is written to disk. Files smaller than one part are sent with a
+single put_object.
+
+If the client disconnects, the file grows past its size limit, or a part fails, the multipart upload is
+aborted so S3 does not keep the parts.
+"""
+
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import BoundedSemaphore
+from typing import IO
+from .api.aws_integration import s3_client
+
+# bytes read from the request at a time
+CHUNK_SIZE = 1024 * 1024
+# S3 rejects smaller parts, other than the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class TooLarge(Exception):
+    pass
+
+
+class EmptyFile(Exception):
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class Ingested:
+    size: int
+    sha256: str
+
+
+@dataclass(slots=True)
+class MultipartUpload:
+    """A multipart upload of one object, sending parts from a thread pool"""
+
+    bucket: str
+    key: str
+    upload_id: str
+    pool: ThreadPoolExecutor
+    in_flight: BoundedSemaphore
+    _parts: list[Future[dict[str, str | int]]] = field(default_factory=list[Future[dict[str, str | int]]], init=False)
+
+    def _send(self, number: int, body: bytes) -> dict[str, str | int]:
+        try:
+            response = s3_client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        finally:
+            self.in_flight.release()
+
+    def add_part(self, body: bytes) -> None:
+        # waits while the pool is busy, which stops reading from the client until a part is sent
+        self.in_flight.acquire()
+
+        # give up on the first failed part instead of reading the rest of the file
+        for sent in self._parts:
+            if sent.done() and sent.exception() is not None:
+                self.in_flight.release()
+                sent.result()
+
+        self._parts.append(self.pool.submit(self._send, len(self._parts) + 1, body))
+
+    def complete(self) -> None:
+        parts = [part.result() for part in self._parts]
+
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},  # pyright: ignore[reportArgumentType]
+        )
+
+    def abort(self) -> None:
+        for part in self._parts:
+            part.cancel()
+        # parts still being sent would be stored after the abort
+        for part in self._parts:
+            if not part.cancelled():
+                part.exception()
+
+        s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+def ingest(
+    stream: IO[bytes],
+    bucket: str,
+    key: str,
+    content_type: str,
+    max_bytes: int,
+    part_size: int,
+    concurrency: int,
+) -> Ingested:
+    """
+    Upload everything read from stream to bucket/key as a public object.
+    Raises TooLarge past max_bytes and EmptyFile for an empty stream, and passes on errors reading the stream
+    (eg. ClientDisconnected) or from S3, in all cases leaving nothing behind.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    digest = hashlib.sha256()
+    size = 0
+    part = bytearray()
+    upload: MultipartUpload | None = None
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest") as pool:
+        try:
+            while chunk := stream.read(min(CHUNK_SIZE, part_size - len(part))):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise TooLarge()
+
+                digest.update(chunk)
+                part += chunk
+
+                if len(part) == part_size:
+                    if upload is None:
+                        created = s3_client.create_multipart_upload(
+                            Bucket=bucket, Key=key, ContentType=content_type, ACL="public-read"
+                        )
+                        upload = MultipartUpload(bucket, key, created["UploadId"], pool, BoundedSemaphore(concurrency))
+
+                    upload.add_part(bytes(part))
+                    part.clear()
+
+            if size == 0:
+                raise EmptyFile()
+
+            if upload is None:
+                s3_client.put_object(
+                    Bucket=bucket, Key=key, Body=bytes(part), ContentType=content_type, ACL="public-read"
+                )
+            else:
+                if part:
+                    upload.add_part(bytes(part))
+                upload.complete()
+        except BaseException:
+            if upload is not None:
+                upload.abort()
+            raise
+
+    return Ingested(size, digest.hexdigest())
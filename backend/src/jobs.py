@@ -0,0 +1,260 @@
+"""
+A job queue in the database, for side effects too slow (or too unreliable) to wait for in a request.
+
+enqueue adds a job to the current session, so it is committed (or rolled back) together with the change that
+needs it, and the response does not wait for it to run. `flask worker` claims ready jobs and runs their handlers
+on JOB_CONCURRENCY threads. A job that raises is retried after an exponential backoff (with jitter), and marked
+failed after JOB_MAX_ATTEMPTS attempts, keeping its last error. Jobs are deleted once they succeed.
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so any number of them can share the
+queue. SQLite ignores the row locks, but serializes writes, and a claim only succeeds if the job was still
+unclaimed when its row is updated. A claimed job is leased for JOB_LEASE seconds, and the worker renews the lease
+of every job it is running each third of that, so a long job (eg. transcoding) keeps it. Only a crashed worker's
+jobs are picked up again once their lease runs out, and handlers must be safe to run more than once for that.
+
+Handlers are registered with the handler decorator, by modules the app imports, and take the job's payload as
+keyword arguments.
+"""
+
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, cast
+from flask import Flask, current_app
+from sqlalchemy import insert, or_, select, update
+from .models import Job, db
+
+type Handler = Callable[..., None]
+
+handlers: dict[str, Handler] = {}
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register a function as the handler of jobs of this kind"""
+
+    def register(f: Handler) -> Handler:
+        handlers[kind] = f
+        return f
+
+    return register
+
+
+def enqueue(kind: str, **payload: Any) -> Job:
+    """Queue a job, committed with the current session"""
+    assert kind in handlers, f"no handler for {kind} jobs"
+
+    job = Job(kind=kind, payload=payload, status="queued", attempts=0, run_at=now(), created_at=now())
+    db.session.add(job)
+
+    return job
+
+
+def enqueue_now(kind: str, **payload: Any) -> None:
+    """Queue a job in a transaction of its own, for callers with nothing else to commit"""
+    assert kind in handlers, f"no handler for {kind} jobs"
+
+    with db.engine.begin() as connection:
+        connection.execute(
+            insert(Job).values(kind=kind, payload=payload, status="queued", attempts=0, run_at=now(), created_at=now())
+        )
+
+
+def backoff(attempts: int) -> float:
+    """Seconds to wait before retrying a job that failed attempts times"""
+    base = cast(float, current_app.config["JOB_BACKOFF_BASE"])
+    ceiling = cast(float, current_app.config["JOB_BACKOFF_MAX"])
+
+    # jitter spreads out retries of jobs that failed together
+    return min(base * 2 ** (attempts - 1), ceiling) * random.uniform(0.5, 1)
+
+
+@dataclass(slots=True, frozen=True)
+class ClaimedJob:
+    id: int
+    kind: str
+    payload: dict[str, Any]
+
+
+def lease() -> timedelta:
+    return timedelta(seconds=cast(int, current_app.config["JOB_LEASE"]))
+
+
+def renew(job_ids: list[int]) -> None:
+    """Extend the leases of jobs this worker is still running"""
+    db.session.execute(
+        update(Job)
+        # a job that just failed has given up its lease
+        .where(Job.id.in_(job_ids), Job.locked_until.is_not(None))
+        .values(locked_until=now() + lease())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def claim(limit: int) -> list[ClaimedJob]:
+    """Lease up to limit ready jobs to this worker"""
+    start = now()
+    ready = (
+        Job.status == "queued",
+        Job.run_at <= start,
+        or_(Job.locked_until.is_(None), Job.locked_until <= start),
+    )
+
+    candidates = db.session.scalars(
+        select(Job).where(*ready).order_by(Job.run_at).limit(limit).with_for_update(skip_locked=True)
+    ).all()
+
+    lease_end = start + lease()
+    claimed: list[ClaimedJob] = []
+
+    for job in candidates:
+        # always true on postgres, which holds the row lock, on sqlite another worker may have been first
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, *ready)
+            .values(locked_until=lease_end)
+            .execution_options(synchronize_session=False)
+        )
+
+        if result.rowcount == 1:
+            claimed.append(ClaimedJob(job.id, job.kind, dict(job.payload)))
+
+    db.session.commit()
+
+    return claimed
+
+
+def run(job: ClaimedJob) -> bool:
+    """Run a claimed job and record the outcome, returns whether it succeeded"""
+    try:
+        handlers[job.kind](**job.payload)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+    else:
+        db.session.execute(db.delete(Job).where(Job.id == job.id))
+        db.session.commit()
+        return True
+
+    stored = db.session.get(Job, job.id)
+    if stored is None:
+        return False
+
+    stored.attempts += 1
+    stored.last_error = error
+    stored.locked_until = None
+
+    if stored.attempts >= cast(int, current_app.config["JOB_MAX_ATTEMPTS"]):
+        stored.status = "failed"
+        current_app.logger.error("job %s (%s) failed for good: %s", job.id, job.kind, error)
+    else:
+        stored.run_at = now() + timedelta(seconds=backoff(stored.attempts))
+        current_app.logger.warning("job %s (%s) failed, retrying at %s: %s", job.id, job.kind, stored.run_at, error)
+
+    db.session.commit()
+    return False
+
+
+class Worker:
+    """Runs queued jobs on a thread pool until stopped, see `flask worker`"""
+
+    def __init__(self, app: Flask, concurrency: int | None = None) -> None:
+        self.app = app
+        self.concurrency = concurrency or cast(int, app.config["JOB_CONCURRENCY"])
+        self.poll_interval = cast(float, app.config["JOB_POLL_INTERVAL"])
+        self.stopping = threading.Event()
+
+    def _run(self, job: ClaimedJob) -> bool:
+        # each thread has its own app context, and so its own database session
+        with self.app.app_context():
+            return run(job)
+
+    def stop(self, *_: object) -> None:
+        """Finish the running jobs, then return from run"""
+        self.stopping.set()
+
+    def run(self, once: bool = False) -> tuple[int, int]:
+        """
+        Claim and run jobs until stopped (or when once is set, until none are ready).
+        Returns how many jobs succeeded and failed.
+        """
+        succeeded = failed = 0
+        running: set[Future[bool]] = set()
+        # future -> id of the job it runs
+        job_ids: dict[Future[bool], int] = {}
+        renew_every = cast(int, self.app.config["JOB_LEASE"]) / 3
+        renewed = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job") as pool:
+            while not self.stopping.is_set():
+                claimed: list[ClaimedJob] = []
+
+                if len(running) < self.concurrency:
+                    with self.app.app_context():
+                        claimed = claim(self.concurrency - len(running))
+
+                for job in claimed:
+                    future = pool.submit(self._run, job)
+                    running.add(future)
+                    job_ids[future] = job.id
+
+                if running and time.monotonic() - renewed >= renew_every:
+                    with self.app.app_context():
+                        renew([job_ids[future] for future in running])
+                    renewed = time.monotonic()
+
+                if once and not running:
+                    break
+
+                if running:
+                    # wake as soon as a slot frees up, or to look for new jobs
+                    done, running = wait(
+                        running, timeout=0 if claimed else self.poll_interval, return_when=FIRST_COMPLETED
+                    )
+
+                    for future in done:
+                        del job_ids[future]
+
+                        if future.result():
+                            succeeded += 1
+                        else:
+                            failed += 1
+                elif not claimed:
+                    self.stopping.wait(self.poll_interval)
+
+            # finish the running jobs, still renewing their leases
+            while running:
+                done, running = wait(running, timeout=renew_every)
+
+                for future in done:
+                    del job_ids[future]
+
+                    if future.result():
+                        succeeded += 1
+                    else:
+                        failed += 1
+
+                if running:
+                    with self.app.app_context():
+                        renew([job_ids[future] for future in running])
+
+        return succeeded, failed
+
+
+def retry_failed() -> int:
+    """Queue every failed job again with a fresh set of attempts, returns how many there were"""
+    result = db.session.execute(
+        update(Job).where(Job.status == "failed").values(status="queued", attempts=0, run_at=now())
+    )
+    db.session.commit()
+
+    return result.rowcount
@@ -0,0 +1,419 @@
+"""
+Processing of uploaded songs, done by the worker after the upload is saved (see .jobs).
+
+upload_song queues a process_song job. The job downloads the original to a temporary directory, and a process
+from a pool of MEDIA_PROCESSES decodes it once and derives everything the song is missing from the decoded audio:
+
+- renditions: the song transcoded for streaming (see RENDITIONS), a fraction of the size of a lossless original
+- waveforms: the min and max sample of each slice of the song at the resolutions in WAVEFORM_BUCKETS, as int8,
+  for the player to draw before it has any audio (GET /api/songs/<id>/waveform)
+- preview: a low bitrate clip of the loudest PREVIEW_MS of the song (see loudest_start), a few hundred KB to
+  play when browsing instead of the whole original
+
+Derived files are stored like uploads, by content and counted per song (see .storage), waveforms in the database.
+Songs sharing an original share what was derived from it. `flask media backfill` processes every song that is
+missing something, running a job per core.
+
+A probe_song job queued alongside reads the song's duration and format from the original's headers (see .probe),
+with a few ranged reads instead of a download, so they are known long before the song is transcoded.
+
+Decoding and encoding are done by ffmpeg, which (with ffprobe) must be on the PATH of the worker.
+"""
+
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from threading import Lock
+from typing import cast
+import numpy as np
+from flask import Flask, current_app
+from pydub import AudioSegment
+from sqlalchemy import Select, func, or_, select
+from .api.aws_integration import SOUND_BUCKET_NAME, s3_client
+from .jobs import enqueue, handler
+from .models import Song, SongRendition, SongWaveform, db
+from .probe import ReadRange, probe
+from .response_cache import response_cache
+from .storage import retain
+from .uploads import SPECS, store_file
+
+
+@dataclass(slots=True, frozen=True)
+class Rendition:
+    name: str
+    # file extension, which decides the content type (see .uploads.SPECS)
+    ext: str
+    # ffmpeg muxer and encoder
+    format: str
+    codec: str
+    # bits per second
+    bitrate: int
+
+    @property
+    def content_type(self) -> str:
+        return SPECS["song"].content_types[self.ext]
+
+
+RENDITIONS = (
+    Rendition("opus-96k", "opus", "ogg", "libopus", 96_000),
+    Rendition("aac-160k", "aac", "adts", "aac", 160_000),
+)
+
+PREVIEW = Rendition("preview-80k", "aac", "adts", "aac", 80_000)
+# length of the preview, about 300 KB at its bitrate
+PREVIEW_MS = 30_000
+# the preview starts on a multiple of this
+PREVIEW_STEP_MS = 100
+# faded in and out so it does not start and stop mid note
+PREVIEW_FADE_MS = 1_000
+
+# resolutions of the waveform, each must divide the largest
+WAVEFORM_BUCKETS = (256, 1024, 4096)
+# served when a client does not ask for a resolution
+DEFAULT_WAVEFORM_BUCKETS = 1024
+
+
+@dataclass(slots=True)
+class Derived:
+    """Files derived from a song by derive, in its working directory"""
+
+    # rendition name -> path
+    renditions: dict[str, str] = field(default_factory=dict[str, str])
+    # buckets -> peaks
+    waveforms: dict[int, bytes] = field(default_factory=dict[int, bytes])
+    # path of the preview clip
+    preview: str | None = None
+
+
+def waveform_peaks(audio: AudioSegment, resolutions: list[int]) -> dict[int, bytes]:
+    """The min and max sample of every bucket at each resolution, scaled to int8 and interleaved"""
+    finest = max(WAVEFORM_BUCKETS)
+    # one row per frame, one column per channel
+    frames = np.asarray(audio.get_array_of_samples()).reshape(-1, audio.channels)
+
+    # songs shorter than the finest resolution get silent buckets at the end
+    if len(frames) < finest:
+        frames = np.pad(frames, ((0, finest - len(frames)), (0, 0)))
+
+    # reduce each bucket of frames first, then its channels, which is much faster than the other way around
+    starts = np.linspace(0, len(frames), finest, endpoint=False).astype(np.intp)
+    lows = np.minimum.reduceat(frames, starts).min(axis=1)
+    highs = np.maximum.reduceat(frames, starts).max(axis=1)
+    scale = 127 / (1 << (8 * audio.sample_width - 1))
+
+    peaks: dict[int, bytes] = {}
+
+    for buckets in resolutions:
+        # coarser resolutions from the finest one, each bucket covering a whole number of fine buckets
+        low = lows.reshape(buckets, -1).min(axis=1)
+        high = highs.reshape(buckets, -1).max(axis=1)
+        peaks[buckets] = np.rint(np.column_stack((low, high)) * scale).astype(np.int8).tobytes()
+
+    return peaks
+
+
+def loudest_start(audio: AudioSegment, length_ms: int) -> int:
+    """Start (in ms, a multiple of PREVIEW_STEP_MS) of the length_ms window of audio with the most energy"""
+    step = audio.frame_rate * PREVIEW_STEP_MS // 1000
+    window = length_ms // PREVIEW_STEP_MS
+    samples = np.asarray(audio.get_array_of_samples())
+    steps = len(samples) // (step * audio.channels)
+
+    if steps <= window:
+        return 0
+
+    # one row per step, the sum of its squared samples over every channel (the RMS without the mean and root,
+    # which do not change which window is loudest), squared a row at a time rather than copying the whole song
+    blocks = samples[: steps * step * audio.channels].reshape(steps, -1)
+    energy = np.einsum("ij,ij->i", blocks, blocks, dtype=np.float64, casting="unsafe")
+
+    # the energy of every window at once, from a running sum
+    total = np.concatenate(([0.0], np.cumsum(energy)))
+    windows = total[window:] - total[:-window]
+
+    return int(np.argmax(windows)) * PREVIEW_STEP_MS
+
+
+def export(audio: AudioSegment, path: str, rendition: Rendition) -> None:
+    audio.export(path, format=rendition.format, codec=rendition.codec, bitrate=f"{rendition.bitrate // 1000}k").close()
+
+
+def cut_preview(audio: AudioSegment, path: str) -> None:
+    start = loudest_start(audio, PREVIEW_MS)
+    clip = audio[start : start + PREVIEW_MS]
+    clip = clip.fade_in(PREVIEW_FADE_MS).fade_out(PREVIEW_FADE_MS)
+
+    export(clip, path, PREVIEW)
+
+
+def derive(source: str, directory: str, renditions: list[Rendition], waveforms: list[int], preview: bool) -> Derived:
+    """Decode source and write everything requested to directory. Runs in a pool process."""
+    audio = AudioSegment.from_file(source)
+    derived = Derived()
+
+    if waveforms:
+        derived.waveforms = waveform_peaks(audio, waveforms)
+
+    for rendition in renditions:
+        path = os.path.join(directory, f"{rendition.name}.{rendition.ext}")
+        export(audio, path, rendition)
+        derived.renditions[rendition.name] = path
+
+    if preview:
+        derived.preview = os.path.join(directory, f"{PREVIEW.name}.{PREVIEW.ext}")
+        cut_preview(audio, derived.preview)
+
+    return derived
+
+
+class MediaPool:
+    """Processes for decoding and encoding, started on first use so web workers never start any"""
+
+    def __init__(self) -> None:
+        self.processes = 1
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = Lock()
+
+    def init_app(self, app: Flask) -> None:
+        self.processes = cast(int, app.config["MEDIA_PROCESSES"]) or os.cpu_count() or 1
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # forking a process with running threads (the worker's) can copy a held lock into the child
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+
+            return self._executor
+
+    def derive(
+        self, source: str, directory: str, renditions: list[Rendition], waveforms: list[int], preview: bool
+    ) -> Derived:
+        return self.executor.submit(derive, source, directory, renditions, waveforms, preview).result()
+
+
+media_pool = MediaPool()
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def queue_processing(song: Song) -> None:
+    """Queue processing of a new song, committed with the song"""
+    # the jobs need the song's id
+    db.session.flush()
+    enqueue("probe_song", song_id=song.id)
+    enqueue("process_song", song_id=song.id)
+
+
+def read_original(key: str) -> ReadRange:
+    def read(offset: int, length: int) -> bytes:
+        response = s3_client.get_object(
+            Bucket=SOUND_BUCKET_NAME, Key=key, Range=f"bytes={offset}-{offset + length - 1}"
+        )
+        return response["Body"].read()
+
+    return read
+
+
+@handler("probe_song")
+def probe_song(song_id: int) -> None:
+    """Read a song's duration and format from the headers of its original"""
+    song = db.session.get(Song, song_id)
+
+    # deleted since the job was queued
+    if song is None:
+        return
+
+    key = song.song_ref.rsplit("/", 1)[1]
+    size = s3_client.head_object(Bucket=SOUND_BUCKET_NAME, Key=key)["ContentLength"]
+    info = probe(read_original(key), size)
+
+    # not worth retrying, the file will not change
+    if info is None:
+        current_app.logger.warning("could not read the audio metadata of song %s (%s)", song.id, song.song_ref)
+        return
+
+    song.duration_ms = info.duration_ms
+    song.bitrate = info.bitrate
+    song.sample_rate = info.sample_rate
+    song.channels = info.channels
+    song.codec = info.codec
+    song.updated_at = now()
+    db.session.commit()
+    response_cache.invalidate(f"song-{song.id}")
+
+
+def missing_renditions(song: Song) -> list[Rendition]:
+    have = {rendition.name for rendition in song.renditions}
+    return [rendition for rendition in RENDITIONS if rendition.name not in have]
+
+
+def share_renditions(song: Song, wanted: list[Rendition]) -> list[Rendition]:
+    """Copy renditions from other songs with the same original, returns the ones still missing"""
+    shared = {
+        rendition.name: rendition
+        for rendition in db.session.scalars(
+            select(SongRendition).join(Song).where(Song.song_ref == song.song_ref, Song.id != song.id)
+        )
+    }
+    missing: list[Rendition] = []
+
+    for rendition in wanted:
+        other = shared.get(rendition.name)
+
+        if other is None:
+            missing.append(rendition)
+            continue
+
+        retain(SOUND_BUCKET_NAME, other.url.rsplit("/", 1)[1])
+        song.renditions.append(
+            SongRendition(
+                name=other.name, url=other.url, content_type=other.content_type, bitrate=other.bitrate, size=other.size
+            )
+        )
+
+    return missing
+
+
+def missing_waveforms(song: Song) -> list[int]:
+    have = {waveform.buckets for waveform in song.waveforms}
+    return [buckets for buckets in WAVEFORM_BUCKETS if buckets not in have]
+
+
+def share_waveforms(song: Song, wanted: list[int]) -> list[int]:
+    """Copy waveforms from other songs with the same original, returns the ones still missing"""
+    shared = {
+        waveform.buckets: waveform
+        for waveform in db.session.scalars(
+            select(SongWaveform).join(Song).where(Song.song_ref == song.song_ref, Song.id != song.id)
+        )
+    }
+    missing: list[int] = []
+
+    for buckets in wanted:
+        other = shared.get(buckets)
+
+        if other is None:
+            missing.append(buckets)
+        else:
+            song.waveforms.append(SongWaveform(buckets=buckets, peaks=other.peaks))
+
+    return missing
+
+
+def share_preview(song: Song) -> bool:
+    """Copy the preview from another song with the same original, returns whether one is still missing"""
+    if song.preview_url is not None:
+        return False
+
+    other = db.session.scalars(
+        select(Song.preview_url)
+        .where(Song.song_ref == song.song_ref, Song.id != song.id, Song.preview_url.is_not(None))
+        .limit(1)
+    ).first()
+
+    if other is None:
+        return True
+
+    retain(SOUND_BUCKET_NAME, other.rsplit("/", 1)[1])
+    song.preview_url = other
+    return False
+
+
+def download_original(song: Song, directory: str) -> str:
+    key = song.song_ref.rsplit("/", 1)[1]
+    # keep the extension, ffmpeg goes by it for some containers
+    path = os.path.join(directory, "original." + key.rsplit(".", 1)[-1])
+
+    s3_client.download_file(SOUND_BUCKET_NAME, key, path)
+
+    return path
+
+
+def store_derived(path: str) -> str:
+    """Store a file derived from a song next to the originals, returns its url"""
+    with open(path, "rb") as f:
+        url = store_file("song", os.path.basename(path), f)
+
+    # raised to retry the job
+    if isinstance(url, tuple):
+        raise RuntimeError(f"storing {os.path.basename(path)} failed: {url[0]['errors']}")
+
+    return url
+
+
+@handler("process_song")
+def process_song(song_id: int) -> None:
+    """Derive everything a song is missing from its original"""
+    song = db.session.get(Song, song_id)
+
+    # deleted since the job was queued
+    if song is None:
+        return
+
+    before = (len(song.renditions), song.preview_url)
+    renditions = share_renditions(song, missing_renditions(song))
+    waveforms = share_waveforms(song, missing_waveforms(song))
+    preview = share_preview(song)
+
+    if renditions or waveforms or preview:
+        with tempfile.TemporaryDirectory(prefix="media-") as directory:
+            source = download_original(song, directory)
+            derived = media_pool.derive(source, directory, renditions, waveforms, preview)
+
+            for rendition in renditions:
+                path = derived.renditions[rendition.name]
+                song.renditions.append(
+                    SongRendition(
+                        name=rendition.name,
+                        url=store_derived(path),
+                        content_type=rendition.content_type,
+                        bitrate=rendition.bitrate,
+                        size=os.path.getsize(path),
+                    )
+                )
+
+            for buckets, peaks in derived.waveforms.items():
+                song.waveforms.append(SongWaveform(buckets=buckets, peaks=peaks))
+
+            if derived.preview is not None:
+                song.preview_url = store_derived(derived.preview)
+
+    # waveforms are served on their own, renditions and the preview are part of the song
+    if (len(song.renditions), song.preview_url) != before:
+        # the song's representation changed, which its validators go by
+        song.updated_at = now()
+        db.session.commit()
+        response_cache.invalidate(f"song-{song.id}")
+
+
+def unprocessed_songs() -> Select[tuple[int]]:
+    """Ids of songs missing anything process_song derives"""
+    renditions = select(func.count()).where(SongRendition.song_id == Song.id).scalar_subquery()
+    waveforms = select(func.count()).where(SongWaveform.song_id == Song.id).scalar_subquery()
+
+    return (
+        select(Song.id)
+        .where(or_(renditions < len(RENDITIONS), waveforms < len(WAVEFORM_BUCKETS), Song.preview_url.is_(None)))
+        .order_by(Song.id)
+    )
+
+
+def queue_backfill() -> int:
+    """Queue probing and processing of every song missing something, returns how many jobs were queued"""
+    unprobed = db.session.scalars(select(Song.id).where(Song.duration_ms.is_(None)).order_by(Song.id)).all()
+    unprocessed = db.session.scalars(unprocessed_songs()).all()
+
+    for song_id in unprobed:
+        enqueue("probe_song", song_id=song_id)
+    for song_id in unprocessed:
+        enqueue("process_song", song_id=song_id)
+
+    db.session.commit()
+
+    return len(unprobed) + len(unprocessed)
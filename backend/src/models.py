@@ -1,8 +1,8 @@
-from typing import NotRequired, TypedDict
+from typing import Any, NotRequired, TypedDict
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import JSON, BigInteger, ForeignKey, Index, LargeBinary, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship
-from datetime import datetime
+from datetime import datetime, timezone
 from flask_login import UserMixin  # pyright: ignore
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
@@ -28,9 +28,15 @@ class playlists_join(Base):
 
 class likes_join(Base):
     __tablename__ = "likes_join"
+    __table_args__ = (
+        # keyset pagination index for a user's likes, newest first
+        Index("ix_likes_join_user_id_created_at", "user_id", "created_at", "song_id"),
+    )
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
     song_id: Mapped[int] = mapped_column(ForeignKey("songs.id"), primary_key=True, index=True)
+    # python side default so sqlite stores the same format as the cursors we compare against
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc), server_default=func.now())
 
 
 # ------------------------- Model Classes --------------------------- #
@@ -105,13 +111,29 @@ class User(Base, UserMixin):
 
 class Song(Base):
     __tablename__ = "songs"
+    __table_args__ = (
+        # keyset pagination indexes for the landing page and artist pages
+        Index("ix_songs_created_at_id", "created_at", "id"),
+        Index("ix_songs_artist_id_created_at_id", "artist_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]
-    artist_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    artist_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     genre: Mapped[str | None]
     thumb_url: Mapped[str | None]
     song_ref: Mapped[str]
+    # denormalized count of likes_join rows, maintained by the likes routes and repaired by `flask likes rebuild-counts`
+    like_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # read from the original's headers by the worker (see src/media.py), null until then
+    duration_ms: Mapped[int | None]
+    # bits per second, averaged over the file
+    bitrate: Mapped[int | None]
+    sample_rate: Mapped[int | None]
+    channels: Mapped[int | None]
+    codec: Mapped[str | None]
+    # a short clip of the loudest part of the song, cut by the worker, null until then
+    preview_url: Mapped[str | None]
     created_at: Mapped[datetime]
     updated_at: Mapped[datetime]
     # Relationships
@@ -119,6 +141,40 @@ class Song(Base):
     playlists: Mapped[list["Playlist"]] = relationship(secondary=playlists_join.__table__, back_populates="songs")
     comments: Mapped[list["Comment"]] = relationship(back_populates="song")
     liking_users: Mapped[list["User"]] = relationship(secondary=likes_join.__table__, back_populates="liked_songs")
+    renditions: Mapped[list["SongRendition"]] = relationship(
+        back_populates="song", order_by="SongRendition.bitrate", cascade="all, delete-orphan"
+    )
+    waveforms: Mapped[list["SongWaveform"]] = relationship(back_populates="song", cascade="all, delete-orphan")
+
+
+class SongRendition(Base):
+    """A transcoded copy of a song for streaming, see src/media.py"""
+
+    __tablename__ = "song_renditions"
+
+    song_id: Mapped[int] = mapped_column(ForeignKey("songs.id"), primary_key=True)
+    # codec and bitrate, eg. opus-96k
+    name: Mapped[str] = mapped_column(primary_key=True)
+    url: Mapped[str]
+    content_type: Mapped[str]
+    # bits per second
+    bitrate: Mapped[int]
+    size: Mapped[int] = mapped_column(BigInteger)
+    # Relationships
+    song: Mapped["Song"] = relationship(back_populates="renditions")
+
+
+class SongWaveform(Base):
+    """Peaks of a song's waveform at one resolution, see src/media.py"""
+
+    __tablename__ = "song_waveforms"
+
+    song_id: Mapped[int] = mapped_column(ForeignKey("songs.id"), primary_key=True)
+    buckets: Mapped[int] = mapped_column(primary_key=True)
+    # min and max sample of each bucket, interleaved, as int8
+    peaks: Mapped[bytes] = mapped_column(LargeBinary)
+    # Relationships
+    song: Mapped["Song"] = relationship(back_populates="waveforms")
 
 
 class Playlist(Base):
@@ -147,3 +203,94 @@ class Comment(Base):
     # Relationships
     song: Mapped["Song"] = relationship(back_populates="comments")
     author: Mapped["User"] = relationship(back_populates="comments")
+
+
+class UploadSession(Base):
+    """A resumable upload in progress, see src/resumable.py"""
+
+    __tablename__ = "upload_sessions"
+
+    # random, as it is all a client needs to continue the upload
+    id: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    kind: Mapped[str]
+    # object key the finished file is stored under
+    key: Mapped[str]
+    content_type: Mapped[str]
+    # total size of the file, declared when the session is created
+    length: Mapped[int] = mapped_column(BigInteger)
+    # bytes received and stored so far
+    offset: Mapped[int] = mapped_column(BigInteger, default=0)
+    # the S3 multipart upload the parts belong to, None for the local store
+    multipart_id: Mapped[str | None]
+    # held by the request receiving a chunk, until leased_until
+    lease_id: Mapped[str | None]
+    leased_until: Mapped[datetime | None]
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+    created_at: Mapped[datetime]
+    updated_at: Mapped[datetime]
+    # Relationships
+    parts: Mapped[list["UploadPart"]] = relationship(
+        back_populates="session", order_by="UploadPart.number", cascade="all, delete-orphan"
+    )
+
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+
+    session_id: Mapped[str] = mapped_column(ForeignKey("upload_sessions.id"), primary_key=True)
+    number: Mapped[int] = mapped_column(primary_key=True)
+    etag: Mapped[str]
+    size: Mapped[int] = mapped_column(BigInteger)
+    # Relationships
+    session: Mapped["UploadSession"] = relationship(back_populates="parts")
+
+
+class ClaimedUpload(Base):
+    """An upload token that was used, tokens are single use, see src/uploads.py"""
+
+    __tablename__ = "claimed_uploads"
+
+    # sha256 of the token
+    token_hash: Mapped[str] = mapped_column(primary_key=True)
+    # the token's signature has expired by then, so the row is no longer needed
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+
+class StoredObject(Base):
+    """A file in S3 and how many records use it, see src/storage.py"""
+
+    __tablename__ = "stored_objects"
+    __table_args__ = (Index("ix_stored_objects_bucket_sha256", "bucket", "sha256", unique=True),)
+
+    bucket: Mapped[str] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(primary_key=True)
+    # hex digest of the content, None for files that were never hashed (uploaded before this, or in parts)
+    sha256: Mapped[str | None]
+    size: Mapped[int | None] = mapped_column(BigInteger)
+    content_type: Mapped[str | None]
+    # songs, playlists and users referencing the file by url
+    ref_count: Mapped[int] = mapped_column(default=0)
+    created_at: Mapped[datetime]
+
+
+class Job(Base):
+    """A queued background job, see src/jobs.py"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # name of the handler to run
+    kind: Mapped[str]
+    # keyword arguments for the handler
+    payload: Mapped[dict[str, Any]] = mapped_column(JSON)
+    # queued, or failed once out of attempts
+    status: Mapped[str] = mapped_column(default="queued")
+    attempts: Mapped[int] = mapped_column(default=0)
+    # not run before this, pushed back after each failure
+    run_at: Mapped[datetime]
+    # set while a worker runs the job, another worker takes it over after this
+    locked_until: Mapped[datetime | None]
+    last_error: Mapped[str | None] = mapped_column(Text)
+    created_at: Mapped[datetime]
@@ -0,0 +1,65 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from .backend_api import ApiErrorResponse
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+invalid_cursor_error: ApiErrorResponse = (
+    {"message": "Invalid cursor", "errors": {"cursor": "This cursor is malformed or expired"}},
+    400,
+)
+invalid_limit_error: ApiErrorResponse = (
+    {"message": "Invalid limit", "errors": {"limit": f"limit must be an integer between 1 and {MAX_PAGE_SIZE}"}},
+    400,
+)
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """
+    Encode a keyset position as an opaque url safe token.
+    Clients must treat this as a blob, the format may change at any time.
+    """
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int] | None:
+    """Decode a token created by encode_cursor, returns None if it is malformed"""
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        return None
+
+
+def encode_rank_cursor(rank: int, id: int, fuzzy: bool) -> str:
+    """
+    Encode a position in search results ordered by (rank, id) descending, see encode_cursor.
+    Ranks are integers so the position compares exactly with the ranks the database computes.
+    fuzzy marks a position in typo tolerant matches rather than full text ones.
+    """
+    raw = f"{rank}|{id}|{int(fuzzy)}".encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> tuple[int, int, bool] | None:
+    """Decode a token created by encode_rank_cursor, returns None if it is malformed"""
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, id, fuzzy = raw.split("|")
+        return int(rank), int(id), fuzzy == "1"
+    except ValueError:
+        return None
+
+
+def parse_limit(limit: str | None, default: int = DEFAULT_PAGE_SIZE) -> int | None:
+    """Parse a limit query param, returns None if it is out of range"""
+    if limit is None:
+        return default
+
+    if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_SIZE:
+        return None
+
+    return int(limit)
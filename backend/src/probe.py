@@ -0,0 +1,447 @@
+"""
+Audio metadata read from a file's headers, without decoding (or downloading) it.
+
+probe reads the first HEAD_BYTES and last TAIL_BYTES of a file, and otherwise only makes reads of at most MAX_READ
+bytes at offsets the headers point to, eg. the first mp3 frame after a large ID3 tag, or an mp4 moov box in the
+middle of a file. Durations come from the container where it records them (wav, flac, ogg, mp4, the Xing or VBRI
+header of a VBR mp3), and are estimated from the bitrate otherwise (CBR mp3, ADTS aac).
+
+Supports every format songs may be uploaded as, see .api.aws_integration.ALLOWED_SOUND_EXTENSIONS.
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+HEAD_BYTES = 16 * 1024
+TAIL_BYTES = 16 * 1024
+MAX_READ = 64 * 1024
+# a file with more chunks or boxes than this before its audio is not worth reading further
+MAX_SECTIONS = 64
+# bytes after an ID3 tag searched for the first frame
+SYNC_SEARCH = 4096
+
+# reads length bytes from offset, fewer only at the end of the file
+type ReadRange = Callable[[int, int], bytes]
+
+
+@dataclass(slots=True, frozen=True)
+class AudioInfo:
+    duration_ms: int
+    # bits per second, averaged over the whole file
+    bitrate: int
+    sample_rate: int
+    channels: int
+    codec: str
+
+
+@dataclass(slots=True, frozen=True)
+class Stream:
+    """What a format's parser finds, probe works out the bitrate from the duration"""
+
+    duration_ms: int
+    sample_rate: int
+    channels: int
+    codec: str
+
+
+class File:
+    """A file read through its head and tail, and bounded reads of anything in between"""
+
+    def __init__(self, read: ReadRange, size: int) -> None:
+        self._read = read
+        self.size = size
+
+        if size <= HEAD_BYTES + TAIL_BYTES:
+            self.head = read(0, size)
+            self.tail_start = 0
+            self.tail = self.head
+        else:
+            self.head = read(0, HEAD_BYTES)
+            self.tail_start = size - TAIL_BYTES
+            self.tail = read(self.tail_start, TAIL_BYTES)
+
+    def read(self, offset: int, length: int) -> bytes:
+        length = min(length, MAX_READ, self.size - offset)
+
+        if offset < 0 or length <= 0:
+            return b""
+        if offset + length <= len(self.head):
+            return self.head[offset : offset + length]
+        if offset >= self.tail_start:
+            return self.tail[offset - self.tail_start : offset + length - self.tail_start]
+
+        return self._read(offset, length)
+
+
+def probe(read: ReadRange, size: int) -> AudioInfo | None:
+    """Metadata of the audio file of this size read through read, None if it is not in a format this understands"""
+    file = File(read, size)
+
+    try:
+        stream = parse(file)
+    except (struct.error, IndexError, ValueError, ZeroDivisionError):
+        # truncated or corrupt headers
+        return None
+
+    if stream is None or stream.duration_ms <= 0 or stream.sample_rate <= 0 or stream.channels <= 0:
+        return None
+
+    return AudioInfo(
+        duration_ms=stream.duration_ms,
+        bitrate=size * 8000 // stream.duration_ms,
+        sample_rate=stream.sample_rate,
+        channels=stream.channels,
+        codec=stream.codec,
+    )
+
+
+def parse(file: File) -> Stream | None:
+    head = file.head
+
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return parse_wav(file)
+    if head[:4] == b"fLaC":
+        return parse_flac(file)
+    if head[:4] == b"OggS":
+        return parse_ogg(file)
+    if head[4:8] == b"ftyp":
+        return parse_mp4(file)
+
+    # mp3 and aac streams may start with an ID3 tag, sometimes followed by padding
+    skipped = id3_size(head)
+    after_tag = file.read(skipped, SYNC_SEARCH)
+    sync = after_tag.find(b"\xff")
+
+    while sync != -1 and sync + 1 < len(after_tag):
+        second = after_tag[sync + 1]
+
+        if second & 0xF6 == 0xF0:
+            return parse_adts(file, skipped + sync)
+        if second & 0xE0 == 0xE0:
+            return parse_mp3(file, skipped + sync)
+
+        sync = after_tag.find(b"\xff", sync + 1)
+
+    return None
+
+
+# * wav
+
+WAV_PCM = 1
+WAV_FLOAT = 3
+WAV_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav(file: File) -> Stream | None:
+    offset = 12
+    fmt: tuple[int, int, int, int, int, int] | None = None
+
+    for _ in range(MAX_SECTIONS):
+        header = file.read(offset, 8)
+        if len(header) < 8:
+            return None
+
+        chunk, size = header[:4], struct.unpack("<I", header[4:])[0]
+
+        if chunk == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", file.read(offset + 8, 16))
+        elif chunk == b"data":
+            if fmt is None:
+                return None
+
+            tag, channels, sample_rate, byte_rate, _, bits = fmt
+            # a stream being written may not have its size filled in yet
+            data_size = min(size, file.size - offset - 8)
+
+            if tag in (WAV_PCM, WAV_EXTENSIBLE):
+                codec = "pcm_u8" if bits == 8 else f"pcm_s{bits}le"
+            elif tag == WAV_FLOAT:
+                codec = f"pcm_f{bits}le"
+            else:
+                codec = f"wav_{tag:#06x}"
+
+            return Stream(data_size * 1000 // byte_rate, sample_rate, channels, codec)
+
+        # chunks are padded to an even size
+        offset += 8 + size + (size & 1)
+
+    return None
+
+
+# * flac
+
+
+def parse_flac(file: File) -> Stream | None:
+    # STREAMINFO is always the first metadata block, right after the 4 byte block header
+    info = file.head[8:42]
+
+    sample_rate = int.from_bytes(info[10:13]) >> 4
+    channels = ((info[12] >> 1) & 0x7) + 1
+    samples = ((info[13] & 0xF) << 32) | int.from_bytes(info[14:18])
+
+    # an encoder that did not know the length writes 0
+    if samples == 0:
+        return None
+
+    return Stream(samples * 1000 // sample_rate, sample_rate, channels, "flac")
+
+
+# * ogg (opus and vorbis)
+
+OPUS_SAMPLE_RATE = 48000
+
+
+def ogg_last_granule(file: File) -> int | None:
+    """Granule position of the last page, the number of samples up to its end"""
+    tail = file.tail
+    end = len(tail)
+
+    while (page := tail.rfind(b"OggS", 0, end)) != -1:
+        # "OggS" may also appear in audio data, and -1 marks a page on which no packet ends
+        if page + 14 <= len(tail) and tail[page + 4] == 0:
+            granule = struct.unpack_from("<q", tail, page + 6)[0]
+            if granule >= 0:
+                return granule
+
+        end = page
+
+    return None
+
+
+def parse_ogg(file: File) -> Stream | None:
+    head = file.head
+    segments = head[26]
+    packet = head[27 + segments :]
+
+    if packet.startswith(b"OpusHead"):
+        # opus always decodes at 48kHz, the header's input sample rate is only informational
+        channels, pre_skip = packet[9], struct.unpack_from("<H", packet, 10)[0]
+        sample_rate, codec = OPUS_SAMPLE_RATE, "opus"
+    elif packet.startswith(b"\x01vorbis"):
+        channels, sample_rate = packet[11], struct.unpack_from("<I", packet, 12)[0]
+        pre_skip, codec = 0, "vorbis"
+    else:
+        return None
+
+    granule = ogg_last_granule(file)
+    if granule is None:
+        return None
+
+    return Stream((granule - pre_skip) * 1000 // sample_rate, sample_rate, channels, codec)
+
+
+# * mp4 (m4a)
+
+MP4_CODECS = {b"mp4a": "aac", b"alac": "alac", b"Opus": "opus", b"fLaC": "flac", b"ac-3": "ac3", b"ec-3": "eac3"}
+
+
+def boxes(data: bytes, start: int = 0, end: int | None = None) -> Iterator[tuple[bytes, int, int]]:
+    """(type, body start, body end) of each box in data[start:end], clipped to data"""
+    end = len(data) if end is None else min(end, len(data))
+
+    for _ in range(MAX_SECTIONS):
+        if start + 8 > end:
+            return
+
+        size, kind = struct.unpack_from(">I4s", data, start)
+        header = 8
+
+        if size == 1:
+            size, header = struct.unpack_from(">Q", data, start + 8)[0], 16
+        elif size == 0:
+            size = end - start
+
+        if size < header:
+            return
+
+        yield kind, start + header, min(start + size, end)
+        start += size
+
+
+def child(data: bytes, start: int, end: int, kind: bytes) -> tuple[int, int] | None:
+    for found, body, body_end in boxes(data, start, end):
+        if found == kind:
+            return body, body_end
+
+    return None
+
+
+def media_duration(data: bytes, body: int) -> tuple[int, int]:
+    """timescale and duration of an mvhd or mdhd box"""
+    if data[body] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, body + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, body + 12)
+
+    return timescale, duration
+
+
+def find_moov(file: File) -> bytes | None:
+    offset = 0
+
+    # walk the top level boxes, reading just their headers, moov is usually first or last
+    for _ in range(MAX_SECTIONS):
+        header = file.read(offset, 16)
+        if len(header) < 8:
+            return None
+
+        size, kind = struct.unpack_from(">I4s", header)
+        header_size = 8
+
+        if size == 1:
+            size, header_size = struct.unpack_from(">Q", header, 8)[0], 16
+        elif size == 0:
+            size = file.size - offset
+
+        if kind == b"moov":
+            # the sample tables at its end can be large, the headers come first
+            return file.read(offset + header_size, size - header_size)
+
+        if size < header_size:
+            return None
+
+        offset += size
+
+    return None
+
+
+def parse_mp4(file: File) -> Stream | None:
+    moov = find_moov(file)
+    if moov is None:
+        return None
+
+    for kind, trak, trak_end in boxes(moov):
+        if kind != b"trak":
+            continue
+
+        mdia = child(moov, trak, trak_end, b"mdia")
+        if mdia is None:
+            continue
+
+        hdlr = child(moov, *mdia, b"hdlr")
+        if hdlr is None or moov[hdlr[0] + 8 : hdlr[0] + 12] != b"soun":
+            continue
+
+        mdhd = child(moov, *mdia, b"mdhd")
+        minf = child(moov, *mdia, b"minf")
+        stbl = minf and child(moov, *minf, b"stbl")
+        stsd = stbl and child(moov, *stbl, b"stsd")
+        if mdhd is None or stsd is None:
+            return None
+
+        timescale, duration = media_duration(moov, mdhd[0])
+
+        # the first sample entry, after the version, flags and entry count
+        entry = stsd[0] + 8
+        codec = moov[entry + 4 : entry + 8]
+        channels, _, _, _, sample_rate = struct.unpack_from(">HHHHI", moov, entry + 24)
+
+        return Stream(
+            duration * 1000 // timescale,
+            sample_rate >> 16,
+            channels,
+            MP4_CODECS.get(codec, codec.decode("latin-1").strip()),
+        )
+
+    return None
+
+
+# * mp3
+
+
+def id3_size(head: bytes) -> int:
+    """Length of the ID3v2 tag at the start of head, 0 if there is none"""
+    if head[:3] != b"ID3" or len(head) < 10:
+        return 0
+
+    # syncsafe, 7 bits per byte
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    footer = 10 if head[5] & 0x10 else 0
+
+    return 10 + size + footer
+
+
+# by version bits (MPEG 1, MPEG 2, MPEG 2.5), then sample rate index
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+MP3_MPEG_1 = 3
+# layer III only, kbps by bitrate index
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_LAYER_3 = 1
+
+
+def parse_mp3(file: File, start: int) -> Stream | None:
+    frame = file.read(start, 256)
+    version = (frame[1] >> 3) & 0x3
+    layer = (frame[1] >> 1) & 0x3
+    bitrate_index, rate_index = frame[2] >> 4, (frame[2] >> 2) & 0x3
+
+    if version not in MP3_SAMPLE_RATES or layer != MP3_LAYER_3 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == MP3_MPEG_1
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    mono = frame[3] >> 6 == 3
+    channels = 1 if mono else 2
+    samples_per_frame = 1152 if mpeg1 else 576
+
+    # a VBR encoder writes the frame count in a Xing (or Info) header after the first frame's side info
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = 4 + side_info
+
+    frames: int | None = None
+
+    if frame[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack_from(">I", frame, xing + 4)[0]
+        if flags & 0x1:
+            frames = struct.unpack_from(">I", frame, xing + 8)[0]
+    elif frame[36:40] == b"VBRI":
+        frames = struct.unpack_from(">I", frame, 36 + 14)[0]
+
+    if frames:
+        return Stream(frames * samples_per_frame * 1000 // sample_rate, sample_rate, channels, "mp3")
+
+    # constant bitrate, the audio is everything up to the ID3v1 tag if there is one
+    audio = file.size - start - (128 if file.tail[-128:-125] == b"TAG" else 0)
+    kbps = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index]
+
+    return Stream(audio * 8 // kbps, sample_rate, channels, "mp3")
+
+
+# * aac (ADTS)
+
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+
+def parse_adts(file: File, start: int) -> Stream | None:
+    frames = file.read(start, HEAD_BYTES)
+    rate_index = (frames[2] >> 2) & 0xF
+    sample_rate = ADTS_SAMPLE_RATES[rate_index]
+    channels = ((frames[2] & 0x1) << 2) | (frames[3] >> 6)
+
+    # ADTS has no length anywhere, so average the bitrate of the first frames and assume it holds throughout
+    offset, frame_bytes, samples = 0, 0, 0
+
+    while offset + 7 <= len(frames) and frames[offset] == 0xFF and frames[offset + 1] & 0xF6 == 0xF0:
+        length = ((frames[offset + 3] & 0x3) << 11) | (frames[offset + 4] << 3) | (frames[offset + 5] >> 5)
+        if length < 7 or offset + length > len(frames):
+            break
+
+        frame_bytes += length
+        samples += 1024 * ((frames[offset + 6] & 0x3) + 1)
+        offset += length
+
+    if samples == 0:
+        return None
+
+    # seconds = audio bytes / (frame bytes / seconds of frames)
+    duration_ms = (file.size - start) * samples * 1000 // (frame_bytes * sample_rate)
+
+    return Stream(duration_ms, sample_rate, channels, "aac")
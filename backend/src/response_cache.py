@@ -0,0 +1,425 @@
+"""
+Response cache for public, read only GET endpoints.
+
+Routes opt in with @response_cache.cached and describe what their response depends on by calling cache_tags,
+eg. a song page is tagged song-12 and artist-4. Handlers that change data call response_cache.invalidate with the
+same tags after committing, which drops exactly the entries built from that data.
+
+Entries live in an in process LRU by default. Set RESPONSE_CACHE_REDIS_URL to share one cache between workers,
+otherwise a write only invalidates the worker that handled it and other workers serve stale entries for up to
+RESPONSE_CACHE_TTL seconds.
+
+Streamed responses are stored once they have been sent in full, unless they grow past
+RESPONSE_CACHE_MAX_ENTRY_BYTES, at which point the copy is dropped and the rest streams through untouched.
+
+Every invalidation bumps a generation, and records it against the tags it dropped. A response is built from data
+read after the generation it started at, and it is not stored if any of its tags was invalidated since, as it may
+have been built from data read before that write.
+"""
+
+import importlib
+import time
+from datetime import datetime
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator, Protocol, cast
+from flask import Flask, Response, current_app, g, request
+from .backend_api import CacheStats
+from .conditional import validate
+from .cdn import queue_purge
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    body: bytes
+    status: int
+    mimetype: str
+    # validators set by the route with check_validators
+    etag: str | None = None
+    last_modified: datetime | None = None
+    tags: frozenset[str] = frozenset()
+
+
+# invalidated tags remembered by a LocalCache, responses that started building before the oldest forgotten one
+# are not stored
+REMEMBERED_TAGS = 10_000
+# how long a RedisCache remembers the generation a tag was invalidated at, longer than any response takes to build
+TAG_GENERATION_TTL = 60 * 60
+
+
+class CacheBackend(Protocol):
+    name: str
+
+    def get(self, key: str) -> CachedResponse | None: ...
+
+    def generation(self) -> int:
+        """The current generation, read before building a response"""
+        ...
+
+    def set(self, key: str, entry: CachedResponse, ttl: float, tags: set[str], since: int) -> bool:
+        """Store entry unless any of tags was invalidated after generation since, returns whether it was stored"""
+        ...
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        """Drop every entry carrying any of tags, returns how many were dropped"""
+        ...
+
+    def clear(self) -> None: ...
+
+
+class LocalCache:
+    """LRU of responses bounded by entry count and total body size, with a TTL per entry"""
+
+    name = "local"
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.evictions = 0
+        self._lock = Lock()
+        # key -> (expiry, entry, tags), least recently used first
+        self._entries: OrderedDict[str, tuple[float, CachedResponse, set[str]]] = OrderedDict()
+        self._tagged: dict[str, set[str]] = {}
+        self._generation = 0
+        # tag -> generation it was last invalidated at, least recently invalidated first
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        # generation of the latest tag dropped from _invalidated
+        self._forgotten = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: str) -> None:
+        _, entry, tags = self._entries.pop(key)
+        self.size_bytes -= len(entry.body)
+
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            found = self._entries.get(key)
+
+            if found is None:
+                return None
+
+            if found[0] < time.monotonic():
+                self._drop(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return found[1]
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def set(self, key: str, entry: CachedResponse, ttl: float, tags: set[str], since: int) -> bool:
+        if len(entry.body) > self.max_bytes:
+            return False
+
+        with self._lock:
+            if since < self._forgotten or any(self._invalidated.get(tag, 0) > since for tag in tags):
+                return False
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (time.monotonic() + ttl, entry, tags)
+            self.size_bytes += len(entry.body)
+
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+            return True
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            self._generation += 1
+            tags = list(tags)
+
+            for tag in tags:
+                self._invalidated[tag] = self._generation
+                self._invalidated.move_to_end(tag)
+
+            while len(self._invalidated) > REMEMBERED_TAGS:
+                self._forgotten = self._invalidated.popitem(last=False)[1]
+
+            keys = {key for tag in tags for key in self._tagged.get(tag, ())}
+
+            for key in keys:
+                self._drop(key)
+
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self.size_bytes = 0
+
+
+class RedisCache:
+    """
+    Cache shared by every worker through redis. Each tag is a set of the keys carrying it,
+    which lives at least as long as those keys.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "response-cache:") -> None:
+        # optional dependency, only needed when a shared cache is configured
+        redis = importlib.import_module("redis")
+
+        self.prefix = prefix
+        self.client: Any = redis.Redis.from_url(url)
+        self.watch_error: type[Exception] = redis.WatchError
+
+    def get(self, key: str) -> CachedResponse | None:
+        found = cast(dict[bytes, bytes], self.client.hgetall(self.prefix + key))
+
+        if not found:
+            return None
+
+        try:
+            etag = found[b"etag"].decode()
+            last_modified = found[b"last_modified"].decode()
+
+            return CachedResponse(
+                found[b"body"],
+                int(found[b"status"]),
+                found[b"mimetype"].decode(),
+                etag or None,
+                datetime.fromisoformat(last_modified) if last_modified else None,
+                frozenset(found[b"tags"].decode().split()),
+            )
+        except KeyError:
+            # written by an older version without every field
+            return None
+
+    def generation(self) -> int:
+        return int(self.client.get(f"{self.prefix}generation") or 0)
+
+    def set(self, key: str, entry: CachedResponse, ttl: float, tags: set[str], since: int) -> bool:
+        expire = max(1, round(ttl))
+        generations = [f"{self.prefix}invalidated:{tag}" for tag in tags]
+
+        with self.client.pipeline() as pipe:
+            try:
+                # an invalidation of any of tags between here and execute aborts the store
+                if generations:
+                    pipe.watch(*generations)
+
+                    if any(int(found) > since for found in pipe.mget(generations) if found is not None):
+                        return False
+
+                pipe.multi()
+                self._queue_set(pipe, key, entry, expire, tags)
+                pipe.execute()
+            except self.watch_error:
+                return False
+
+        return True
+
+    def _queue_set(self, pipe: Any, key: str, entry: CachedResponse, expire: int, tags: Iterable[str]) -> None:
+        pipe.hset(
+            self.prefix + key,
+            mapping={
+                "body": entry.body,
+                "status": entry.status,
+                "mimetype": entry.mimetype,
+                "etag": entry.etag or "",
+                "last_modified": entry.last_modified.isoformat() if entry.last_modified else "",
+                "tags": " ".join(entry.tags),
+            },
+        )
+        pipe.expire(self.prefix + key, expire)
+
+        for tag in tags:
+            pipe.sadd(f"{self.prefix}tag:{tag}", key)
+            pipe.expire(f"{self.prefix}tag:{tag}", expire, gt=True)
+            # a new tag set has no ttl for gt to compare against
+            pipe.expire(f"{self.prefix}tag:{tag}", expire, nx=True)
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        tag_keys = [f"{self.prefix}tag:{tag}" for tag in tags]
+
+        if not tag_keys:
+            return 0
+
+        # recorded before the entries are dropped, so a store racing with this either sees it or gets dropped
+        generation = int(self.client.incr(f"{self.prefix}generation"))
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.set(f"{self.prefix}invalidated:{tag}", generation, ex=TAG_GENERATION_TTL)
+        pipe.execute()
+
+        keys = cast(set[bytes], self.client.sunion(tag_keys))
+        dropped = int(self.client.delete(*(self.prefix + key.decode() for key in keys))) if keys else 0
+        self.client.delete(*tag_keys)
+
+        return dropped
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+
+def cache_tags(*tags: str) -> None:
+    """
+    Tag the response being built by a cached route, so invalidating any of tags drops it.
+    The same tags are sent to the CDN as surrogate keys by .cdn.edge_cached.
+    """
+    cast(set[str], g.setdefault("cache_tags", set())).update(tags)
+
+
+class ResponseCache:
+    def __init__(self) -> None:
+        self.backend: CacheBackend = LocalCache(max_entries=2048, max_bytes=32 * 1024 * 1024)
+        self.enabled = True
+        self.ttl = 30.0
+        self.max_entry_bytes = 1024 * 1024
+        self._lock = Lock()
+        self._counts = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def init_app(self, app: Flask) -> None:
+        self.enabled = cast(bool, app.config["RESPONSE_CACHE_ENABLED"])
+        self.ttl = cast(float, app.config["RESPONSE_CACHE_TTL"])
+        self.max_entry_bytes = cast(int, app.config["RESPONSE_CACHE_MAX_ENTRY_BYTES"])
+        redis_url = cast(str | None, app.config["RESPONSE_CACHE_REDIS_URL"])
+
+        if redis_url:
+            self.backend = RedisCache(redis_url)
+        else:
+            self.backend = LocalCache(
+                max_entries=cast(int, app.config["RESPONSE_CACHE_MAX_ENTRIES"]),
+                max_bytes=cast(int, app.config["RESPONSE_CACHE_MAX_BYTES"]),
+            )
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[counter] += n
+
+    def _store(self, key: str, entry: CachedResponse, since: int) -> None:
+        if len(entry.body) > self.max_entry_bytes:
+            return
+
+        if self.backend.set(key, entry, self.ttl, set(entry.tags), since):
+            self._count("stores")
+
+    def _tee(
+        self, key: str, body: Iterable[str] | Iterable[bytes], entry: CachedResponse, since: int
+    ) -> Iterator[bytes]:
+        """Pass a streamed body through, storing a copy once it has been sent in full"""
+        copy: bytearray | None = bytearray()
+
+        try:
+            for chunk in body:
+                data = chunk.encode() if isinstance(chunk, str) else chunk
+
+                if copy is not None:
+                    copy += data
+                    if len(copy) > self.max_entry_bytes:
+                        copy = None
+
+                yield data
+        finally:
+            # the wrapped body may hold the request context open until it is closed
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+
+        if copy is not None:
+            entry.body = bytes(copy)
+            self._store(key, entry, since)
+
+    def cached[**P](self, view: Callable[P, Any]) -> Callable[P, Any]:
+        """
+        Serve a GET route from the cache, keyed by path and query string.
+        Only 200 responses are stored, tagged with whatever the route passed to cache_tags,
+        which for streamed responses must be called before the body is returned.
+        """
+
+        @wraps(view)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> Any:
+            if not self.enabled or request.method != "GET":
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            hit = self.backend.get(key)
+
+            if hit is not None:
+                self._count("hits")
+                g.cache_tags = set(hit.tags)
+
+                if hit.etag is not None:
+                    unchanged = validate(hit.etag, hit.last_modified)
+                    if unchanged is not None:
+                        return unchanged
+
+                response = Response(hit.body, status=hit.status, mimetype=hit.mimetype)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            self._count("misses")
+            # read before the view reads anything, see the module docstring
+            since = self.backend.generation()
+            tags = g.cache_tags = set[str]()
+            response = current_app.make_response(view(*args, **kwargs))
+
+            if response.status_code == 200:
+                validators: tuple[str, datetime | None] = g.get("validators", (None, None))
+                entry = CachedResponse(
+                    b"", response.status_code, response.mimetype or "application/json", *validators, frozenset(tags)
+                )
+
+                if response.is_streamed:
+                    response.response = self._tee(key, response.response, entry, since)
+                else:
+                    entry.body = response.get_data()
+                    self._store(key, entry, since)
+
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    def invalidate(self, *tags: str) -> None:
+        """
+        Drop every cached response tagged with any of tags, and purge them from the CDN.
+        Call after the change is committed.
+        """
+        self._count("invalidations", self.backend.invalidate(tags))
+        queue_purge(*tags)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            out: CacheStats = {
+                "backend": self.backend.name,
+                "hits": self._counts["hits"],
+                "misses": self._counts["misses"],
+                "stores": self._counts["stores"],
+                "invalidations": self._counts["invalidations"],
+            }
+
+        if isinstance(self.backend, LocalCache):
+            out["entries"] = len(self.backend)
+            out["size_bytes"] = self.backend.size_bytes
+            out["evictions"] = self.backend.evictions
+
+        return out
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,372 @@
+"""
+Resumable uploads for large files, in the spirit of tus.
+
+1. POST /api/uploads/sessions with the file's kind, name and size creates a session.
+2. PATCH /api/uploads/sessions/<id> with an Upload-Offset header equal to the session's offset sends the next
+   chunk of the file. The chunk is stored a part (UPLOAD_PART_SIZE bytes) at a time, and the offset is committed
+   after every part, so a dropped connection only loses the part that was being received.
+3. GET (or HEAD) /api/uploads/sessions/<id> tells a client that lost track where to continue from.
+4. POST /api/uploads/sessions/<id>/complete once everything is sent assembles the file and returns an upload
+   token, used like the token of a direct upload.
+
+Parts are stored in an S3 multipart upload, or in one file per session under UPLOAD_SESSION_DIR when
+UPLOAD_SESSION_STORE is local, which is sent to S3 on completion. S3 needs parts of at least 5MiB, so chunks other
+than the last must be at least one part long, and a trailing partial part of a chunk is dropped (and not counted
+in the offset) to be sent again with the next chunk. Clients that send whole multiples of the part size never
+resend anything. Sessions expire UPLOAD_SESSION_TTL seconds after they were last written to, and
+`flask uploads cleanup` aborts expired ones.
+
+A chunk is received under a lease on its session, taken only at the session's current offset and renewed with
+every part, so a second PATCH of the same session gets a 409 instead of storing a part under the same number.
+A request that stalls for longer than UPLOAD_CHUNK_LEASE loses the lease, and stops at its next part.
+"""
+
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import IO, Protocol, cast
+from flask import Flask, current_app, request
+from sqlalchemy import or_, select, update
+from werkzeug.exceptions import ClientDisconnected
+from .api.aws_integration import get_unique_filename, s3_client
+from .backend_api import ApiError, ApiErrorResponse, NewUpload, StoredUpload, UploadKind, UploadSessionInfo
+from .ingest import MIN_PART_SIZE, ingest
+from .models import UploadPart, UploadSession, db
+from .storage import deduplicate
+from .uploads import SPECS, check_filename, issue_token, max_bytes, upload_error
+
+session_not_found_error: ApiErrorResponse = (
+    ApiError(message="Upload session not found", errors={"session": "No such upload session, or it has expired"}),
+    404,
+)
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class PartStore(Protocol):
+    def create(self, session: UploadSession) -> str | None:
+        """Prepare to receive parts, returns the multipart upload id if there is one"""
+        ...
+
+    def put_part(self, session: UploadSession, number: int, data: bytes) -> str:
+        """Store part number (from 1) of the session at session.offset, returns its etag"""
+        ...
+
+    def complete(self, session: UploadSession) -> str | None:
+        """Assemble the session's parts into its object, returns its sha256 if the parts were read to do so"""
+        ...
+
+    def abort(self, session: UploadSession) -> None: ...
+
+
+class S3PartStore:
+    def create(self, session: UploadSession) -> str | None:
+        created = s3_client.create_multipart_upload(
+            Bucket=SPECS[cast(UploadKind, session.kind)].bucket,
+            Key=session.key,
+            ContentType=session.content_type,
+            ACL="public-read",
+        )
+        return created["UploadId"]
+
+    def put_part(self, session: UploadSession, number: int, data: bytes) -> str:
+        assert session.multipart_id is not None
+
+        response = s3_client.upload_part(
+            Bucket=SPECS[cast(UploadKind, session.kind)].bucket,
+            Key=session.key,
+            UploadId=session.multipart_id,
+            PartNumber=number,
+            Body=data,
+        )
+        return response["ETag"]
+
+    def complete(self, session: UploadSession) -> str | None:
+        assert session.multipart_id is not None
+
+        s3_client.complete_multipart_upload(
+            Bucket=SPECS[cast(UploadKind, session.kind)].bucket,
+            Key=session.key,
+            UploadId=session.multipart_id,
+            MultipartUpload={"Parts": [{"PartNumber": part.number, "ETag": part.etag} for part in session.parts]},
+        )
+        # S3 assembles the parts without the server seeing them again
+        return None
+
+    def abort(self, session: UploadSession) -> None:
+        # left behind by the local store before switching to S3
+        if session.multipart_id is None:
+            return
+
+        s3_client.abort_multipart_upload(
+            Bucket=SPECS[cast(UploadKind, session.kind)].bucket, Key=session.key, UploadId=session.multipart_id
+        )
+
+
+class LocalPartStore:
+    """Keeps each session's parts in one local file, for development without an S3 server"""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _path(self, session: UploadSession) -> str:
+        return os.path.join(self.root, session.id)
+
+    def create(self, session: UploadSession) -> str | None:
+        os.makedirs(self.root, exist_ok=True)
+        open(self._path(session), "wb").close()
+        return None
+
+    def put_part(self, session: UploadSession, number: int, data: bytes) -> str:
+        with open(self._path(session), "r+b") as f:
+            # drop anything left behind by a part that was interrupted while being written
+            f.truncate(session.offset)
+            f.seek(session.offset)
+            f.write(data)
+
+        return str(number)
+
+    def complete(self, session: UploadSession) -> str | None:
+        with open(self._path(session), "rb") as f:
+            ingested = ingest(
+                f,
+                SPECS[cast(UploadKind, session.kind)].bucket,
+                session.key,
+                session.content_type,
+                session.length,
+                part_size=part_size(),
+                concurrency=cast(int, current_app.config["UPLOAD_CONCURRENCY"]),
+            )
+
+        os.remove(self._path(session))
+        return ingested.sha256
+
+    def abort(self, session: UploadSession) -> None:
+        try:
+            os.remove(self._path(session))
+        except FileNotFoundError:
+            pass
+
+
+def part_size() -> int:
+    return max(cast(int, current_app.config["UPLOAD_PART_SIZE"]), MIN_PART_SIZE)
+
+
+def part_store() -> PartStore:
+    return cast(PartStore, current_app.extensions["upload_part_store"])
+
+
+def init_app(app: Flask) -> None:
+    if cast(str, app.config["UPLOAD_SESSION_STORE"]) == "local":
+        root = cast(str | None, app.config["UPLOAD_SESSION_DIR"]) or os.path.join(app.instance_path, "upload-sessions")
+        app.extensions["upload_part_store"] = LocalPartStore(root)
+    else:
+        app.extensions["upload_part_store"] = S3PartStore()
+
+
+def session_info(session: UploadSession) -> UploadSessionInfo:
+    return {
+        "id": session.id,
+        "offset": session.offset,
+        "length": session.length,
+        "part_size": part_size(),
+        "expires_at": session.expires_at,
+    }
+
+
+def expiry() -> datetime:
+    return now() + timedelta(seconds=cast(int, current_app.config["UPLOAD_SESSION_TTL"]))
+
+
+def create_session(new: NewUpload, user_id: int) -> UploadSession | ApiErrorResponse:
+    if new["kind"] not in SPECS:
+        return upload_error("kind", "kind must be song or image")
+
+    content_type = check_filename(new["kind"], new["filename"])
+    if isinstance(content_type, tuple):
+        return content_type
+
+    limit = max_bytes(new["kind"])
+    if not 0 < new["size"] <= limit:
+        return upload_error("size", f"File must be between 1 byte and {limit} bytes", 413)
+
+    session = UploadSession(
+        id=secrets.token_urlsafe(24),
+        user_id=user_id,
+        kind=new["kind"],
+        key=get_unique_filename(new["filename"]),
+        content_type=content_type,
+        length=new["size"],
+        offset=0,
+        expires_at=expiry(),
+        created_at=now(),
+        updated_at=now(),
+    )
+    session.multipart_id = part_store().create(session)
+
+    db.session.add(session)
+    db.session.commit()
+
+    return session
+
+
+def find_session(session_id: str, user_id: int, lock: bool = False) -> UploadSession | None:
+    """The user's unexpired session, locked for writing if lock is set"""
+    query = select(UploadSession).where(
+        UploadSession.id == session_id, UploadSession.user_id == user_id, UploadSession.expires_at > now()
+    )
+
+    if lock:
+        # completing and aborting wait for each other (postgres only), chunks take a lease instead
+        query = query.with_for_update()
+
+    return db.session.scalars(query).one_or_none()
+
+
+def read_part(stream: IO[bytes], size: int) -> bytes:
+    """Read up to size bytes, fewer only at the end of the stream"""
+    data = bytearray()
+
+    while len(data) < size and (chunk := stream.read(size - len(data))):
+        data += chunk
+
+    return bytes(data)
+
+
+def lease_end() -> datetime:
+    return now() + timedelta(seconds=cast(int, current_app.config["UPLOAD_CHUNK_LEASE"]))
+
+
+def take_lease(session: UploadSession, lease: str) -> bool:
+    """Lease the session to the request receiving the chunk at its offset, unless someone else holds it"""
+    taken = db.session.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session.id,
+            UploadSession.offset == session.offset,
+            or_(UploadSession.lease_id.is_(None), UploadSession.leased_until <= now()),
+        )
+        .values(lease_id=lease, leased_until=lease_end())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return taken.rowcount == 1
+
+
+def release_lease(session_id: str, lease: str) -> None:
+    db.session.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.lease_id == lease)
+        .values(lease_id=None, leased_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def receive_chunk(session: UploadSession, offset: int) -> UploadSession | ApiErrorResponse:
+    """Store the request body, which continues the file at offset"""
+    if offset != session.offset:
+        return upload_error("Upload-Offset", f"Upload-Offset must be the session's offset ({session.offset})", 409)
+
+    declared = request.content_length
+    if declared is None:
+        return upload_error("Content-Length", "Chunks must have a Content-Length", 411)
+
+    if session.offset + declared > session.length:
+        return upload_error("Content-Length", "Chunk goes past the end of the file", 413)
+
+    size = part_size()
+    final = session.offset + declared == session.length
+
+    if not final and declared < size:
+        return upload_error("Content-Length", f"Chunks other than the last must be at least {size} bytes")
+
+    lease = secrets.token_urlsafe(12)
+
+    if not take_lease(session, lease):
+        return upload_error("session", "Another chunk of this upload is being received", 409)
+
+    store = part_store()
+    remaining = declared
+
+    try:
+        # only whole parts are stored, or the rest of the file
+        while remaining >= size or (final and remaining > 0):
+            data = read_part(request.stream, min(size, remaining))
+            if len(data) < min(size, remaining):
+                raise ClientDisconnected()
+
+            # nothing else stores parts of the session while the lease is held
+            number = len(session.parts) + 1
+            etag = store.put_part(session, number, data)
+
+            # the lease may have run out while the part was received
+            renewed = db.session.execute(
+                update(UploadSession)
+                .where(UploadSession.id == session.id, UploadSession.lease_id == lease)
+                .values(
+                    offset=session.offset + len(data),
+                    leased_until=lease_end(),
+                    expires_at=expiry(),
+                    updated_at=now(),
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            if renewed.rowcount != 1:
+                db.session.rollback()
+                return upload_error("session", "Another chunk of this upload took over while this one stalled", 409)
+
+            db.session.add(UploadPart(session_id=session.id, number=number, etag=etag, size=len(data)))
+            remaining -= len(data)
+
+            # keep each part as soon as it is stored, so it survives a dropped connection
+            db.session.commit()
+    except ClientDisconnected:
+        return upload_error("body", f"Upload was interrupted, continue from offset {session.offset}")
+    finally:
+        release_lease(session.id, lease)
+
+    return session
+
+
+def complete_session(session: UploadSession) -> StoredUpload | ApiErrorResponse:
+    if session.offset != session.length:
+        return upload_error("session", f"Only {session.offset} of {session.length} bytes have been received")
+
+    kind = cast(UploadKind, session.kind)
+    sha256 = part_store().complete(session)
+    key = session.key if sha256 is None else deduplicate(SPECS[kind].bucket, session.key, sha256)
+
+    out: StoredUpload = {
+        "upload_token": issue_token(session.user_id, kind, key, session.content_type, sha256=sha256),
+        "file_url": SPECS[kind].location + key,
+        "size": session.length,
+    }
+    if sha256 is not None:
+        out["sha256"] = sha256
+
+    db.session.delete(session)
+    db.session.commit()
+
+    return out
+
+
+def abort_session(session: UploadSession) -> None:
+    part_store().abort(session)
+
+    db.session.delete(session)
+    db.session.commit()
+
+
+def cleanup_expired() -> int:
+    """Abort every expired session, returns how many there were"""
+    expired = db.session.scalars(select(UploadSession).where(UploadSession.expires_at <= now())).all()
+
+    for session in expired:
+        abort_session(session)
+
+    return len(expired)
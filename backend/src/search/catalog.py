@@ -0,0 +1,178 @@
+"""
+In process search indexes over the catalog's names, and the hooks that keep them current.
+
+Each worker builds its indexes in a background thread, started by its first request, and rebuilds them every
+INDEX_MAX_AGE. A build reads the database into new indexes and swaps them in with a single assignment, so requests
+never wait on a rebuild and only the first ones of a worker wait (up to INDEX_BUILD_WAIT) for the first build.
+Trigram indexes are only built where pg_trgm is not available (see .fuzzy).
+
+Routes that create, rename or delete songs, playlists or profiles call names_changed/names_removed after committing,
+which updates this worker's indexes in place, and is replayed onto indexes being built so the swap does not lose
+it. Other workers pick up the change with their next rebuild.
+"""
+
+import os
+import time
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import cast
+from flask import Flask, current_app
+from sqlalchemy import select
+from ..models import Playlist, Song, User, db
+from .fulltext import SearchKind
+from .prefix import PrefixIndex
+from .trigram import TrigramIndex
+
+INDEX_MAX_AGE = 300.0
+# longest a request waits for a worker's first build, it searches empty indexes after that
+INDEX_BUILD_WAIT = 30.0
+
+KINDS: list[SearchKind] = ["song", "artist", "playlist"]
+
+# (kind, id, display name, indexed names), with no names for a removal
+type Change = tuple[SearchKind, int, str, tuple[str | None, ...] | None]
+
+
+def load_names(kind: SearchKind) -> list[tuple[int, str, list[str | None]]]:
+    """(id, display name, indexed names) of every row of a kind"""
+    if kind == "song":
+        return [(id, name, [name]) for id, name in db.session.execute(select(Song.id, Song.name))]
+
+    if kind == "artist":
+        return [
+            (id, stage_name or username, [username, stage_name])
+            for id, username, stage_name in db.session.execute(select(User.id, User.username, User.stage_name))
+        ]
+
+    return [(id, name, [name]) for id, name in db.session.execute(select(Playlist.id, Playlist.name))]
+
+
+@dataclass(slots=True)
+class _Indexes:
+    # empty on postgres
+    trigrams: dict[SearchKind, TrigramIndex] = field(default_factory=dict[SearchKind, TrigramIndex])
+    prefixes: PrefixIndex = field(default_factory=PrefixIndex)
+
+    def apply(self, change: Change) -> None:
+        kind, id, display, names = change
+        trigrams = self.trigrams.get(kind)
+
+        if names is None:
+            if trigrams is not None:
+                trigrams.remove(id)
+            self.prefixes.remove(kind, id)
+        else:
+            if trigrams is not None:
+                trigrams.add(id, *names)
+            self.prefixes.put(kind, id, display, *names)
+
+
+def build_indexes() -> _Indexes:
+    names: dict[SearchKind, list[tuple[int, str, list[str | None]]]] = {kind: load_names(kind) for kind in KINDS}
+    # the transaction is not needed while building
+    db.session.rollback()
+
+    trigrams: dict[SearchKind, TrigramIndex] = {}
+
+    if db.session.get_bind().dialect.name != "postgresql":
+        trigrams = {kind: TrigramIndex((id, indexed) for id, _, indexed in rows) for kind, rows in names.items()}
+
+    return _Indexes(
+        trigrams,
+        PrefixIndex((kind, id, display, indexed) for kind, rows in names.items() for id, display, indexed in rows),
+    )
+
+
+class _CatalogIndexes:
+    def __init__(self) -> None:
+        self.lock = Lock()
+        # replaced whole by every build
+        self.indexes = _Indexes()
+        # set once a worker's first build is done, whether or not it succeeded
+        self.ready = Event()
+        # the process whose builder thread is running, a forked worker starts its own
+        self._pid: int | None = None
+        # changes made while a build reads the database, None when no build is running
+        self._pending: list[Change] | None = None
+
+    def init_app(self, app: Flask) -> None:
+        app.before_request(self.start)
+
+    def start(self) -> None:
+        """Start this process's builder thread if it is not running"""
+        if self._pid == os.getpid():
+            return
+
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self.ready.clear()
+
+        app = cast(Flask, current_app._get_current_object())  # pyright: ignore
+        Thread(target=self._run, args=(app,), name="catalog-indexes", daemon=True).start()
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            with app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    app.logger.exception("building the catalog search indexes failed")
+
+            self.ready.set()
+            time.sleep(INDEX_MAX_AGE)
+
+    def rebuild(self) -> None:
+        with self.lock:
+            self._pending = []
+
+        try:
+            indexes = build_indexes()
+
+            with self.lock:
+                for change in self._pending:
+                    indexes.apply(change)
+
+                self.indexes = indexes
+        finally:
+            with self.lock:
+                self._pending = None
+
+    def _wait(self) -> _Indexes:
+        self.start()
+        self.ready.wait(INDEX_BUILD_WAIT)
+        return self.indexes
+
+    def trigram_index(self, kind: SearchKind) -> TrigramIndex:
+        return self._wait().trigrams.get(kind) or TrigramIndex()
+
+    def prefix_index(self) -> PrefixIndex:
+        return self._wait().prefixes
+
+    def _change(self, change: Change) -> None:
+        with self.lock:
+            self.indexes.apply(change)
+
+            if self._pending is not None:
+                self._pending.append(change)
+
+    def changed(self, kind: SearchKind, id: int, display: str, names: tuple[str | None, ...]) -> None:
+        self._change((kind, id, display, names))
+
+    def removed(self, kind: SearchKind, id: int) -> None:
+        self._change((kind, id, "", None))
+
+
+catalog_indexes = _CatalogIndexes()
+
+
+def names_changed(kind: SearchKind, id: int, display: str, *names: str | None) -> None:
+    """Record that a row was created or renamed, display is the name shown in results"""
+    catalog_indexes.changed(kind, id, display, names)
+
+
+def names_removed(kind: SearchKind, id: int) -> None:
+    """Record that a row was deleted"""
+    catalog_indexes.removed(kind, id)
@@ -0,0 +1,98 @@
+"""
+Full text search indexes over song names, artist names and playlist names.
+
+On postgres each table gets a generated tsvector column with a GIN index, on sqlite (dev) each table gets an
+external content FTS5 table kept in sync by triggers. Both are created by the migrations, and by create_all
+through the metadata listeners below.
+"""
+
+import re
+from typing import Literal
+from sqlalchemy import DDL, ColumnElement, Integer, Select, event, func, literal, literal_column, select, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from ..models import Base, db
+
+type SearchKind = Literal["song", "artist", "playlist"]
+
+# table and indexed columns for each kind of search result
+FULLTEXT_COLUMNS: dict[SearchKind, tuple[str, list[str]]] = {
+    "song": ("songs", ["name"]),
+    "artist": ("users", ["username", "stage_name"]),
+    "playlist": ("playlists", ["name"]),
+}
+
+# names are mostly proper nouns, so do not stem or drop stopwords
+TS_CONFIG = "simple"
+
+
+def postgres_ddl(table: str, columns: list[str]) -> list[str]:
+    document = " || ' ' || ".join(f"coalesce({c}, '')" for c in columns)
+
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', {document})) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)",
+    ]
+
+
+def sqlite_ddl(table: str, columns: list[str]) -> list[str]:
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {table}_fts(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {table}_fts({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {table}_fts({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {table}_fts(rowid, {cols}) VALUES (new.id, {new}); END",
+        # index any rows that already exist
+        f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+    ]
+
+
+for _table, _columns in FULLTEXT_COLUMNS.values():
+    for _stmt in postgres_ddl(_table, _columns):
+        event.listen(Base.metadata, "after_create", DDL(_stmt).execute_if(dialect="postgresql"))
+
+    for _stmt in sqlite_ddl(_table, _columns):
+        event.listen(Base.metadata, "after_create", DDL(_stmt).execute_if(dialect="sqlite"))
+
+    # the fts table is not part of the metadata, so drop it alongside its content table
+    event.listen(Base.metadata, "before_drop", DDL(f"DROP TABLE IF EXISTS {_table}_fts").execute_if(dialect="sqlite"))
+
+
+def query_terms(query: str) -> list[str]:
+    """Split user input into lowercase word tokens, dropping any query syntax"""
+    return re.findall(r"\w+", query.lower())
+
+
+def ranked_matches(kind: SearchKind, terms: list[str]) -> Select[tuple[int, float]]:
+    """
+    Select (id, rank) of every row of the given kind matching all terms, treating each term as a prefix.
+    A higher rank is a better match.
+    """
+    table, _ = FULLTEXT_COLUMNS[kind]
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        tsquery = func.to_tsquery(TS_CONFIG, literal(" & ".join(f"{t}:*" for t in terms)))
+        vector: ColumnElement[str] = literal_column(f"{table}.search_vector", TSVECTOR)
+
+        return (
+            select(literal_column(f"{table}.id", Integer).label("id"), func.ts_rank(vector, tsquery).label("rank"))
+            .select_from(text(table))
+            .where(vector.bool_op("@@")(tsquery))
+        )
+
+    # bm25 ranks are negative, lower is better
+    bm25: ColumnElement[float] = literal_column("rank")
+
+    return (
+        select(literal_column("rowid", Integer).label("id"), (-bm25).label("rank"))
+        .select_from(text(f"{table}_fts"))
+        .where(text(f"{table}_fts MATCH :match").bindparams(match=" ".join(f'"{t}"*' for t in terms)))
+    )
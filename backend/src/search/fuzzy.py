@@ -0,0 +1,68 @@
+"""
+Typo tolerant name matching by trigram similarity.
+
+On postgres this uses pg_trgm with GIN trigram indexes. Elsewhere (the sqlite dev database) the in process
+TrigramIndexes from .catalog are searched instead.
+"""
+
+from typing import cast
+from flask import current_app
+from sqlalchemy import DDL, event, func, select, text
+from ..models import Base, Playlist, Song, User, db
+from .fulltext import SearchKind
+from .catalog import catalog_indexes
+
+# columns with a trigram index per table
+TRIGRAM_COLUMNS: dict[str, list[str]] = {
+    "songs": ["name"],
+    "users": ["username", "stage_name"],
+    "playlists": ["name"],
+}
+
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+for _table, _columns in TRIGRAM_COLUMNS.items():
+    for _column in _columns:
+        event.listen(
+            Base.metadata,
+            "after_create",
+            DDL(
+                f"CREATE INDEX IF NOT EXISTS ix_{_table}_{_column}_trgm ON {_table} USING gin ({_column} gin_trgm_ops)"
+            ).execute_if(dialect="postgresql"),
+        )
+
+
+def similarity_threshold() -> float:
+    return cast(float, current_app.config["SEARCH_SIMILARITY_THRESHOLD"])
+
+
+def _postgres_matches(kind: SearchKind, query: str, threshold: float, limit: int) -> list[tuple[int, float]]:
+    # the % operator uses this threshold and is what the trigram indexes can serve
+    db.session.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :t, true)"), {"t": str(threshold)})
+
+    if kind == "song":
+        rank = func.similarity(Song.name, query)
+        stmt = select(Song.id, rank).where(Song.name.bool_op("%")(query))
+    elif kind == "artist":
+        rank = func.greatest(func.similarity(User.username, query), func.similarity(User.stage_name, query))
+        stmt = select(User.id, rank).where(User.username.bool_op("%")(query) | User.stage_name.bool_op("%")(query))
+    else:
+        rank = func.similarity(Playlist.name, query)
+        stmt = select(Playlist.id, rank).where(Playlist.name.bool_op("%")(query))
+
+    # ties broken by id, so the same matches are found for every page of them
+    rows = db.session.execute(stmt.order_by(rank.desc(), stmt.selected_columns[0].desc()).limit(limit))
+
+    return [(row_id, float(row_rank)) for row_id, row_rank in rows]
+
+
+def fuzzy_matches(kind: SearchKind, query: str, limit: int) -> list[tuple[int, float]]:
+    """(id, similarity) of the rows of a kind whose names are most similar to query, best first"""
+    threshold = similarity_threshold()
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        return _postgres_matches(kind, query, threshold, limit)
+
+    return catalog_indexes.trigram_index(kind).search(query, threshold, limit)
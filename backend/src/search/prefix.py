@@ -0,0 +1,104 @@
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Iterable
+from .fulltext import SearchKind
+
+_WORD = re.compile(r"\w+")
+
+type Entity = tuple[SearchKind, int]
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation, and collapse whitespace"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+
+    return " ".join(_WORD.findall(stripped))
+
+
+def prefix_keys(*names: str | None) -> set[str]:
+    """Every normalized name, starting at each of its words, so prefixes of later words also match"""
+    keys: set[str] = set()
+
+    for name in names:
+        if name:
+            words = normalize(name).split()
+            keys.update(" ".join(words[i:]) for i in range(len(words)))
+
+    return keys
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, kind, id) searched with bisect, for autocomplete.
+
+    Lookups are O(log n) plus the number of results, inserts and removals shift the array
+    which is a memmove and cheap next to anything that would touch the database.
+    """
+
+    __slots__ = ("_entries", "_entities")
+
+    def __init__(self, entities: Iterable[tuple[SearchKind, int, str, list[str | None]]] = ()) -> None:
+        self._entries: list[tuple[str, SearchKind, int]] = []
+        # keys and display name of every indexed entity
+        self._entities: dict[Entity, tuple[set[str], str]] = {}
+
+        for kind, id, display, names in entities:
+            keys = prefix_keys(*names)
+            self._entities[(kind, id)] = (keys, display)
+            self._entries.extend((key, kind, id) for key in keys)
+
+        self._entries.sort()
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def put(self, kind: SearchKind, id: int, display: str, *names: str | None) -> None:
+        """Index an entity under all of its names, replacing any previous entry"""
+        self.remove(kind, id)
+
+        keys = prefix_keys(*names)
+        self._entities[(kind, id)] = (keys, display)
+
+        for key in keys:
+            insort(self._entries, (key, kind, id))
+
+    def remove(self, kind: SearchKind, id: int) -> None:
+        found = self._entities.pop((kind, id), None)
+
+        if found is None:
+            return
+
+        for key in found[0]:
+            i = bisect_left(self._entries, (key, kind, id))
+
+            if i < len(self._entries) and self._entries[i] == (key, kind, id):
+                del self._entries[i]
+
+    def search(self, prefix: str, limit: int) -> list[tuple[SearchKind, int, str]]:
+        """Up to limit (kind, id, display name) of entities with a name or word starting with prefix"""
+        prefix = normalize(prefix)
+
+        if not prefix:
+            return []
+
+        out: list[tuple[SearchKind, int, str]] = []
+        seen: set[Entity] = set()
+
+        entries = self._entries
+        i = bisect_left(entries, (prefix,))
+
+        while i < len(entries) and len(out) < limit:
+            key, kind, id = entries[i]
+
+            if not key.startswith(prefix):
+                break
+
+            if (kind, id) not in seen:
+                seen.add((kind, id))
+                out.append((kind, id, self._entities[(kind, id)][1]))
+
+            i += 1
+
+        return out
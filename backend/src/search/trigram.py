@@ -0,0 +1,167 @@
+import re
+from array import array
+from collections import Counter
+from heapq import nlargest
+from math import ceil
+from typing import Iterable
+
+_WORD = re.compile(r"\w+")
+
+# tombstoned slots are compacted away once there are more of them than this and than live documents
+COMPACT_AFTER = 4096
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Trigrams of a string the way pg_trgm computes them: lowercase alphanumeric words,
+    each padded with two leading spaces and one trailing space.
+    """
+    out: set[str] = set()
+
+    for word in _WORD.findall(text.lower()):
+        padded = f"  {word} "
+        out.update(padded[i : i + 3] for i in range(len(padded) - 2))
+
+    return out
+
+
+def similarity(a: str, b: str) -> float:
+    """pg_trgm similarity, shared trigrams over all distinct trigrams"""
+    ta, tb = trigrams(a), trigrams(b)
+
+    if not ta or not tb:
+        return 0.0
+
+    shared = len(ta & tb)
+    return shared / (len(ta) + len(tb) - shared)
+
+
+class TrigramIndex:
+    """
+    In memory trigram inverted index, used where pg_trgm is not available.
+
+    Documents are stored in slots, postings hold slot numbers in compact arrays.
+    Removing a document tombstones its slot, and updating one removes and re-adds it. Once tombstones outnumber
+    live documents (and COMPACT_AFTER) the index is compacted, so a long lived index does not grow with churn.
+    """
+
+    __slots__ = ("_postings", "_sizes", "_ids", "_slots", "_dead")
+
+    def __init__(self, documents: Iterable[tuple[int, list[str | None]]] = ()) -> None:
+        self._postings: dict[str, array[int]] = {}
+        # trigram count per slot, 0 for tombstoned slots
+        self._sizes: array[int] = array("H")
+        self._ids: array[int] = array("q")
+        self._slots: dict[int, int] = {}
+        self._dead = 0
+
+        for id, names in documents:
+            self._insert(id, names)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, id: int, *names: str | None) -> None:
+        """Index a document under all of its names, replacing any previous entry for id"""
+        self.remove(id)
+        self._insert(id, names)
+
+    def _insert(self, id: int, names: Iterable[str | None]) -> None:
+        grams: set[str] = set()
+        for name in names:
+            if name:
+                grams |= trigrams(name)
+
+        slot = len(self._ids)
+        self._ids.append(id)
+        self._sizes.append(min(len(grams), 0xFFFF))
+        self._slots[id] = slot
+
+        postings = self._postings
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("I")
+            posting.append(slot)
+
+    def remove(self, id: int) -> None:
+        slot = self._slots.pop(id, None)
+
+        if slot is None:
+            return
+
+        self._sizes[slot] = 0
+        self._dead += 1
+
+        if self._dead > max(COMPACT_AFTER, len(self._slots)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop tombstoned slots, renumbering the live ones in their current order"""
+        # old slot -> new slot, -1 for tombstones
+        renumbered = array("q", [-1]) * len(self._ids)
+        sizes: array[int] = array("H")
+        ids: array[int] = array("q")
+
+        for id, slot in sorted(self._slots.items(), key=lambda item: item[1]):
+            renumbered[slot] = len(ids)
+            self._slots[id] = len(ids)
+            ids.append(id)
+            sizes.append(self._sizes[slot])
+
+        postings: dict[str, array[int]] = {}
+
+        for gram, posting in self._postings.items():
+            kept = array("I", [renumbered[slot] for slot in posting if renumbered[slot] >= 0])
+            if kept:
+                postings[gram] = kept
+
+        self._postings, self._sizes, self._ids, self._dead = postings, sizes, ids, 0
+
+    def search(self, query: str, threshold: float, limit: int, budget: int = 200_000) -> list[tuple[int, float]]:
+        """
+        Find up to limit (id, similarity) pairs with similarity >= threshold, best first.
+
+        At most budget posting entries are scanned, rarest trigrams first, which bounds latency on large
+        catalogs. A trigram too common to scan in full is sampled evenly across its posting, so old and new
+        documents are equally likely to be counted. Skipped and sampled trigrams only make the reported
+        similarity an underestimate.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+
+        nq = len(grams)
+        # sim = shared / (nq + size - shared) >= threshold implies shared >= threshold * nq
+        min_shared = max(1, ceil(threshold * nq))
+
+        counts: Counter[int] = Counter()
+        scanned = 0
+
+        for posting in sorted((self._postings.get(g, array("I")) for g in grams), key=len):
+            remaining = budget - scanned
+            if remaining <= 0:
+                break
+
+            if len(posting) > remaining:
+                posting = posting[:: ceil(len(posting) / remaining)]
+
+            # counting is done in C, only candidates are walked in python
+            counts.update(posting)
+            scanned += len(posting)
+
+        sizes = self._sizes
+        ids = self._ids
+        scored: list[tuple[float, int]] = []
+
+        for slot, shared in counts.items():
+            size = sizes[slot]
+
+            if shared < min_shared or size == 0:
+                continue
+
+            sim = shared / (nq + size - shared)
+            if sim >= threshold:
+                scored.append((sim, ids[slot]))
+
+        return [(id, sim) for sim, id in nlargest(limit, scored)]
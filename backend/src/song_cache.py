@@ -0,0 +1,211 @@
+"""
+A local disk cache of stored songs, for GET /api/songs/<id>/stream.
+
+A song is downloaded into SONG_CACHE_DIR the first time it is streamed, with SONG_CACHE_CONCURRENCY ranged GETs of
+SONG_CACHE_CHUNK_SIZE bytes at a time, and every later request (and every seek) is served from the local file.
+Stored files never change under the same key, so a cached file is never stale. Once the cache grows past
+SONG_CACHE_MAX_BYTES the least recently used files are deleted, going by their mtime, which is bumped when a file
+is used. Every worker process shares the directory, files appear in it atomically (by rename), and a file deleted
+while it is being sent stays readable until it is closed. Files are opened by the cache itself, which downloads a
+file again if another worker evicts it before it is open.
+
+Responses send the file itself, sliced to the requested range, through the server's wsgi.file_wrapper, which
+gunicorn sends with sendfile(2) without copying it through the worker.
+"""
+
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import IO, Iterator, cast
+from flask import Flask, Response, current_app, request
+from .api.aws_integration import s3_client
+
+# bytes read at a time when the server has no wsgi.file_wrapper
+READ_SIZE = 64 * 1024
+# a used file's mtime is only bumped this often, it only has to order files roughly
+TOUCH_INTERVAL = 60
+# partial downloads older than this were left behind by a crashed worker
+ABANDONED_AFTER = 60 * 60
+
+
+class SongCache:
+    def __init__(self) -> None:
+        self.root = ""
+        self.max_bytes = 0
+        self.chunk_size = 0
+        self.concurrency = 1
+        self._locks: dict[str, Lock] = {}
+        self._locks_lock = Lock()
+
+    def init_app(self, app: Flask) -> None:
+        self.root = cast(str | None, app.config["SONG_CACHE_DIR"]) or os.path.join(app.instance_path, "song-cache")
+        self.max_bytes = cast(int, app.config["SONG_CACHE_MAX_BYTES"])
+        self.chunk_size = cast(int, app.config["SONG_CACHE_CHUNK_SIZE"])
+        self.concurrency = cast(int, app.config["SONG_CACHE_CONCURRENCY"])
+
+    def _lock(self, key: str) -> Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, Lock())
+
+    def open(self, bucket: str, key: str) -> IO[bytes]:
+        """bucket/key opened for reading, downloading it first if it is not cached"""
+        try:
+            return open(self._path(bucket, key), "rb")
+        except FileNotFoundError:
+            # evicted by another worker between being found (or downloaded) and being opened, so download it again
+            return open(self._path(bucket, key), "rb")
+
+    def _path(self, bucket: str, key: str) -> str:
+        """Local path of bucket/key, downloading it first if it is not cached"""
+        path = os.path.join(self.root, bucket, key)
+
+        if self._hit(path):
+            return path
+
+        name = f"{bucket}/{key}"
+
+        # one download per file per process, other threads wait for it
+        with self._lock(name):
+            try:
+                if not self._hit(path):
+                    self._fill(bucket, key, path)
+                    self._evict(keep=path)
+            finally:
+                # threads still waiting on it find the file, or after a failed fill may download it again at once
+                with self._locks_lock:
+                    self._locks.pop(name, None)
+
+        return path
+
+    def _hit(self, path: str) -> bool:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+
+        if time.time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by another worker just now
+                return False
+
+        return True
+
+    def _fill(self, bucket: str, key: str, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{key}.", suffix=".part")
+
+        def fetch(offset: int) -> None:
+            end = min(offset + self.chunk_size, size) - 1
+            data = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={offset}-{end}")["Body"].read()
+            os.pwrite(fd, data, offset)
+
+        try:
+            try:
+                os.ftruncate(fd, size)
+
+                with ThreadPoolExecutor(self.concurrency) as pool:
+                    # list raises the first failed fetch
+                    list(pool.map(fetch, range(0, size, self.chunk_size)))
+            finally:
+                os.close(fd)
+
+            os.replace(partial, path)
+        except BaseException:
+            os.remove(partial)
+            raise
+
+    def _evict(self, keep: str) -> None:
+        """Delete the least recently used files (other than keep, which is about to be sent) until the cache fits"""
+        files: list[tuple[float, int, str]] = []
+        total = 0
+
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir():
+                continue
+
+            for entry in os.scandir(bucket.path):
+                # other workers rename, evict and clean up files while this one looks
+                try:
+                    stat = entry.stat()
+
+                    if entry.name.endswith(".part"):
+                        if time.time() - stat.st_mtime > ABANDONED_AFTER:
+                            os.remove(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        files.sort()
+
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+
+song_cache = SongCache()
+
+
+def read_range(file: IO[bytes], length: int) -> Iterator[bytes]:
+    try:
+        while length > 0 and (chunk := file.read(min(READ_SIZE, length))):
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def ranged_file_response(file: IO[bytes], content_type: str, etag: str) -> Response:
+    """
+    The open file, or the single byte range the request asks for as a 206, closing the file once it is sent.
+    Multiple ranges, and ranges of another version (by If-Range), get the whole file.
+    """
+    size = os.fstat(file.fileno()).st_size
+    start, stop, status = 0, size, 200
+
+    byte_range = request.range
+    if_range = request.if_range
+    current = (if_range.etag is None and if_range.date is None) or if_range.etag == etag
+
+    if byte_range is not None and len(byte_range.ranges) == 1 and current:
+        bounds = byte_range.range_for_length(size)
+
+        if bounds is None:
+            file.close()
+            response = current_app.response_class(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+
+        (start, stop), status = bounds, 206
+
+    file.seek(start)
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+
+    # the server sends Content-Length bytes from the file's position, with sendfile where it can
+    body = file_wrapper(file, READ_SIZE) if file_wrapper is not None else read_range(file, stop - start)
+
+    response = current_app.response_class(body, status=status, mimetype=content_type, direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = "bytes"
+    response.set_etag(etag)
+
+    if status == 206:
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    return response
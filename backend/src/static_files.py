@@ -0,0 +1,152 @@
+"""
+Serving the built frontend.
+
+`pnpm build` writes .br and .gz siblings next to every compressible file in dist (see frontend/precompress.js),
+and files are sent as the best sibling the client accepts, so nothing static is compressed per request.
+Vite's hashed output under assets/ never changes under the same name and is cached for a year, everything else
+(index.html, files copied from public/) is revalidated on each use.
+
+index.html is served for every client side route and every 404, so it is read once and kept in memory,
+along with its compressed variants.
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from hashlib import blake2b
+from threading import Lock
+from flask import Flask, Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from .compression import brotli, negotiate
+
+# file extension of the precompressed sibling for each encoding, in order of preference
+SIBLINGS = {"br": ".br", "gzip": ".gz"}
+
+# vite names build output assets/[name]-[hash].[ext]
+HASHED_ASSET = re.compile(r"^assets/.+-[\w-]{8}\.\w+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@dataclass(slots=True, frozen=True)
+class InMemoryFile:
+    # encoding (None for identity) -> body
+    variants: dict[str | None, bytes]
+    mimetype: str
+    etag: str
+    mtime: float
+
+
+def load_variants(path: str) -> dict[str | None, bytes]:
+    """A file's body and its precompressed siblings, compressing any missing siblings now"""
+    with open(path, "rb") as f:
+        body = f.read()
+
+    variants: dict[str | None, bytes] = {None: body}
+
+    for encoding, suffix in SIBLINGS.items():
+        if os.path.isfile(path + suffix):
+            with open(path + suffix, "rb") as f:
+                variants[encoding] = f.read()
+        elif encoding == "gzip":
+            variants[encoding] = gzip.compress(body, 9, mtime=0)
+        elif brotli is not None:
+            variants[encoding] = brotli.compress(body, quality=11)
+
+    return variants
+
+
+class StaticFiles:
+    def __init__(self) -> None:
+        self.folder = ""
+        self.reload = False
+        self._index: InMemoryFile | None = None
+        self._lock = Lock()
+
+    def init_app(self, app: Flask) -> None:
+        assert app.static_folder is not None
+        self.folder = app.static_folder
+        # pick up rebuilt frontends without a restart while developing
+        self.reload = app.debug
+
+        # replaces flask's static view, so the url rule (static_url_path) stays the same
+        app.view_functions["static"] = self.send_static
+
+    def _load_index(self) -> InMemoryFile | None:
+        if self._index is not None and not self.reload:
+            return self._index
+
+        path = os.path.join(self.folder, "index.html")
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+        if self._index is not None and self._index.mtime == mtime:
+            return self._index
+
+        with self._lock:
+            variants = load_variants(path)
+            etag = blake2b(variants[None], digest_size=12).hexdigest()
+            self._index = InMemoryFile(variants, "text/html", etag, mtime)
+
+        return self._index
+
+    def index(self) -> Response:
+        """index.html from memory, in the encoding the client prefers"""
+        index = self._load_index()
+
+        if index is None:
+            return Response("frontend has not been built", status=404, mimetype="text/plain")
+
+        encoding = negotiate(request, [e for e in SIBLINGS if e in index.variants])
+
+        response = Response(index.variants[encoding], mimetype=index.mimetype)
+        response.vary.add("Accept-Encoding")
+        response.cache_control.no_cache = True
+        response.set_etag(index.etag if encoding is None else f"{index.etag}-{encoding}")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+
+        response.make_conditional(request)
+        return response
+
+    def send_static(self, filename: str) -> Response:
+        """Send a file from the frontend build, preferring a precompressed sibling"""
+        if filename == "index.html":
+            return self.index()
+
+        path = safe_join(self.folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+
+        available = [e for e, suffix in SIBLINGS.items() if os.path.isfile(path + suffix)]
+        encoding = negotiate(request, available)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        hashed = HASHED_ASSET.match(filename) is not None
+
+        response = send_file(
+            path if encoding is None else path + SIBLINGS[encoding],
+            mimetype=mimetype,
+            max_age=IMMUTABLE_MAX_AGE if hashed else 0,
+            conditional=True,
+        )
+
+        if available:
+            response.vary.add("Accept-Encoding")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+
+        if hashed:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+
+        return response
+
+
+static_files = StaticFiles()
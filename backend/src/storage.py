@@ -0,0 +1,185 @@
+"""
+Content addressed storage of uploaded files.
+
+Files whose hash is known before they are sent to S3 (files uploaded through a form, and direct uploads that
+declare their sha256) are stored as `<sha256>.<ext>`. stored_objects records every file with the number of
+records (songs, their renditions and previews, playlists, users) using it by url. A file whose content is already
+stored is not sent again, the existing object gets another reference instead, and releasing a reference only
+deletes the object once it was the last one.
+
+Files streamed through the server are only hashed as they are stored, so a duplicate is deleted again right after
+(see deduplicate).
+
+Objects are deleted by a background job (see .jobs), queued in the same transaction as the release.
+
+Files stored before reference counting have no row until they are first released, which counts the records still
+using them. `flask storage rebuild-refs` recounts every file at once, eg. after seeding.
+"""
+
+import hashlib
+from collections import Counter
+from datetime import datetime, timezone
+from typing import IO
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .api.aws_integration import IMAGE_BUCKET_NAME, S3_IMAGE_LOCATION, S3_SOUND_LOCATION, SOUND_BUCKET_NAME, s3_client
+from .ingest import CHUNK_SIZE
+from .jobs import enqueue, handler
+from .models import Playlist, Song, SongRendition, StoredObject, User, db
+
+# every column holding the url of a stored file
+URL_COLUMNS = (
+    Song.song_ref,
+    Song.thumb_url,
+    Song.preview_url,
+    SongRendition.url,
+    Playlist.thumbnail,
+    User.profile_image,
+)
+
+# bucket -> public url prefix of its objects
+LOCATIONS = {SOUND_BUCKET_NAME: S3_SOUND_LOCATION, IMAGE_BUCKET_NAME: S3_IMAGE_LOCATION}
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def content_key(sha256: str, filename: str) -> str:
+    """Object key of a file with this content, keeping the extension of filename"""
+    return f"{sha256}.{filename.rsplit('.', 1)[1].lower()}"
+
+
+def hash_file(content: IO[bytes]) -> tuple[str, int]:
+    """sha256 and size of a seekable file, leaving it at the start"""
+    digest = hashlib.sha256()
+    size = 0
+
+    content.seek(0)
+    while chunk := content.read(CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+
+    return digest.hexdigest(), size
+
+
+def find(bucket: str, sha256: str) -> StoredObject | None:
+    """The stored file in bucket with this content, if there is one"""
+    return db.session.scalars(
+        select(StoredObject).where(StoredObject.bucket == bucket, StoredObject.sha256 == sha256)
+    ).one_or_none()
+
+
+def retain(
+    bucket: str, key: str, sha256: str | None = None, size: int | None = None, content_type: str | None = None
+) -> None:
+    """Count another record using bucket/key, recording the file if it is new. Committed with the record."""
+    # the same content stored under two keys (a race between streamed uploads) keeps the first one findable
+    if sha256 is not None and find(bucket, sha256) is not None:
+        sha256 = None
+
+    insert = postgresql_insert if db.session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    new = insert(StoredObject).values(
+        bucket=bucket, key=key, sha256=sha256, size=size, content_type=content_type, ref_count=1, created_at=now()
+    )
+
+    # one statement, so concurrent first references cannot both insert
+    db.session.execute(
+        new.on_conflict_do_update(
+            index_elements=[StoredObject.bucket, StoredObject.key],
+            set_={
+                "ref_count": StoredObject.ref_count + 1,
+                "sha256": func.coalesce(StoredObject.sha256, new.excluded.sha256),
+                "size": func.coalesce(StoredObject.size, new.excluded.size),
+                "content_type": func.coalesce(StoredObject.content_type, new.excluded.content_type),
+            },
+        )
+    )
+
+
+def count_references(url: str) -> int:
+    return sum(db.session.scalar(select(func.count()).where(column == url)) or 0 for column in URL_COLUMNS)
+
+
+def release(url: str, bucket: str) -> None:
+    """
+    Drop a record's reference to the file at url, deleting the file if nothing else uses it.
+    Called while the record still holds the url.
+    """
+    key = url.rsplit("/", 1)[1]
+    # retain counts in the database, so a copy loaded earlier in the session may be behind
+    stored = db.session.get(StoredObject, (bucket, key), with_for_update=True, populate_existing=True)
+
+    if stored is None:
+        # stored before reference counting, see who else uses it now
+        others = count_references(url) - 1
+
+        if others > 0:
+            db.session.add(StoredObject(bucket=bucket, key=key, ref_count=others, created_at=now()))
+            return
+    else:
+        stored.ref_count -= 1
+
+        if stored.ref_count > 0:
+            return
+
+        db.session.delete(stored)
+
+    enqueue("delete_object", bucket=bucket, key=key)
+
+
+def deduplicate(bucket: str, key: str, sha256: str) -> str:
+    """
+    The key to use for a file that was just stored as bucket/key, which is the key of an existing file with the
+    same content if there is one, in which case the new copy is deleted once the session is committed.
+    """
+    existing = find(bucket, sha256)
+
+    if existing is None or existing.key == key:
+        return key
+
+    enqueue("delete_object", bucket=bucket, key=key)
+    return existing.key
+
+
+@handler("delete_object")
+def delete_object(bucket: str, key: str) -> None:
+    """Delete a stored file nothing uses anymore"""
+    # stored again since the job was queued, by a new upload of the same content
+    if db.session.get(StoredObject, (bucket, key)) is not None:
+        return
+
+    s3_client.delete_object(Bucket=bucket, Key=key)
+
+
+def rebuild_ref_counts() -> int:
+    """
+    Recount the records using every stored file, adding rows for files stored before reference counting.
+    Files no longer used keep their row (with no references) and are not deleted. Returns how many rows changed.
+    """
+    counts: Counter[tuple[str, str]] = Counter()
+
+    for column in URL_COLUMNS:
+        for url, n in db.session.execute(select(column, func.count()).where(column.is_not(None)).group_by(column)):
+            for bucket, location in LOCATIONS.items():
+                if url is not None and url.startswith(location):
+                    counts[bucket, url[len(location) :]] += n
+
+    changed = 0
+
+    for stored in db.session.scalars(select(StoredObject)):
+        n = counts.pop((stored.bucket, stored.key), 0)
+
+        if stored.ref_count != n:
+            stored.ref_count = n
+            changed += 1
+
+    for (bucket, key), n in counts.items():
+        db.session.add(StoredObject(bucket=bucket, key=key, ref_count=n, created_at=now()))
+        changed += 1
+
+    db.session.commit()
+
+    return changed
@@ -0,0 +1,57 @@
+"""
+Streaming JSON responses for list endpoints that can return arbitrarily many rows.
+
+Rows are fetched from the database in batches of STREAM_BATCH (server side cursors on postgres) and each one is
+encoded as it arrives, so a worker only ever holds one batch and one chunk of output, and the first bytes go out
+before the last row is read. The body is byte for byte what returning the whole list as a dict would produce.
+
+The status and headers go out before the rows are read, so an error partway through cannot become a 500. It is
+logged and raised out of the body instead, which makes the server drop the connection, and the client sees a
+failed request rather than a 200 with truncated JSON.
+"""
+
+from typing import Any, Callable, Iterable, Iterator
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import Result, Select
+from .json_provider import encode
+from .models import db
+
+# rows fetched per round trip
+STREAM_BATCH = 500
+# bytes of output buffered before a chunk is written
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_rows[T: tuple[Any, ...]](stmt: Select[T]) -> Result[T]:
+    """Execute stmt, fetching its rows lazily in batches instead of all at once"""
+    return db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH))
+
+
+def json_list_response[T](key: str, items: Iterable[T], to_api: Callable[[T], object]) -> Response:
+    """
+    A response with the body {key: [to_api(item) for item in items]}, encoded incrementally.
+    Items are consumed while the response is sent, with the request context (and database session) kept open.
+    """
+
+    def generate() -> Iterator[bytes]:
+        chunk = bytearray(b"{" + encode(key) + b":[")
+        separator = b""
+
+        try:
+            for item in items:
+                chunk += separator
+                chunk += encode(to_api(item))
+                separator = b","
+
+                if len(chunk) >= CHUNK_SIZE:
+                    yield bytes(chunk)
+                    chunk.clear()
+        except Exception:
+            current_app.logger.exception("streaming %s failed partway, dropping the connection", key)
+            db.session.rollback()
+            raise
+
+        chunk += b"]}\n"
+        yield bytes(chunk)
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
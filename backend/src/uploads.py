@@ -0,0 +1,321 @@
+"""
+Two phase uploads, which send files straight to S3 instead of through a worker.
+
+1. POST /api/uploads signs an S3 POST policy for one new object, restricted to the file's content type and the
+   size limit of its kind, and returns it along with an upload token naming the object.
+2. The client posts the file to S3, then passes the token to the route creating or updating the record.
+   claim_upload checks the token and looks the object up with head_object before its url is stored.
+
+Clients that cannot post to S3 send the file as the body of PUT /api/uploads/<kind> instead, which streams it
+to S3 (see .ingest) and answers with the same kind of token.
+
+Tokens are signed with the app's secret key and expire after UPLOAD_TOKEN_MAX_AGE seconds, so nothing is stored
+until a record uses the file. Each token can be claimed once, claimed_uploads remembers used tokens until they
+expire, and `flask uploads cleanup` forgets expired ones. Set S3_ENDPOINT_URL to run against a local S3 compatible
+server.
+
+Uploads that declare their sha256 are stored by content (see .storage): when the file is already stored, the
+ticket has no upload and its token names the existing file, otherwise the policy only accepts that content.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import IO, cast
+from botocore.exceptions import ClientError
+from flask import current_app, request
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import ClientDisconnected
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from .api.aws_integration import (
+    ALLOWED_IMAGE_EXTENSIONS,
+    ALLOWED_SOUND_EXTENSIONS,
+    AUDIO_CONTENT_EXT_MAP,
+    IMAGE_BUCKET_NAME,
+    IMAGE_CONTENT_EXT_MAP,
+    S3_IMAGE_LOCATION,
+    S3_SOUND_LOCATION,
+    SOUND_BUCKET_NAME,
+    get_unique_filename,
+    s3_client,
+)
+from .backend_api import ApiError, ApiErrorResponse, NewUpload, StoredUpload, UploadKind, UploadTicket
+from .ingest import EmptyFile, TooLarge, ingest
+from .models import ClaimedUpload, db
+from .storage import content_key, deduplicate, find, hash_file, retain
+
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+@dataclass(slots=True, frozen=True)
+class UploadSpec:
+    bucket: str
+    location: str
+    # extension -> content type
+    content_types: dict[str, str]
+    max_bytes_config: str
+
+
+SPECS: dict[UploadKind, UploadSpec] = {
+    "song": UploadSpec(
+        SOUND_BUCKET_NAME,
+        S3_SOUND_LOCATION,
+        {ext: f"audio/{AUDIO_CONTENT_EXT_MAP[ext]}" for ext in ALLOWED_SOUND_EXTENSIONS},
+        "UPLOAD_MAX_SONG_BYTES",
+    ),
+    "image": UploadSpec(
+        IMAGE_BUCKET_NAME,
+        S3_IMAGE_LOCATION,
+        {ext: f"image/{IMAGE_CONTENT_EXT_MAP[ext]}" for ext in ALLOWED_IMAGE_EXTENSIONS},
+        "UPLOAD_MAX_IMAGE_BYTES",
+    ),
+}
+
+
+def upload_error(field: str, message: str, status: int = 400) -> ApiErrorResponse:
+    return ApiError(message="Invalid upload", errors={field: message}), status
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(cast(str, current_app.config["SECRET_KEY"]), salt="upload")
+
+
+def max_bytes(kind: UploadKind) -> int:
+    return cast(int, current_app.config[SPECS[kind].max_bytes_config])
+
+
+def issue_token(
+    user_id: int, kind: UploadKind, key: str, content_type: str, sha256: str | None = None, checksum: str | None = None
+) -> str:
+    """
+    A token naming an uploaded file. sha256 is the content's digest when the server knows it, checksum a digest
+    the client declared, which S3 checks (see claim_upload).
+    """
+    # the nonce tells apart tokens for the same file issued within a second, which are otherwise identical
+    claims: dict[str, str | int] = {
+        "user": user_id,
+        "kind": kind,
+        "key": key,
+        "type": content_type,
+        "nonce": secrets.token_urlsafe(8),
+    }
+
+    if sha256 is not None:
+        claims["sha256"] = sha256
+    if checksum is not None:
+        claims["checksum"] = checksum
+
+    return serializer().dumps(claims)
+
+
+def checksum_header(sha256: str) -> str:
+    """A hex sha256 as S3 checksums are written, base64"""
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+
+def check_filename(kind: UploadKind, filename: str) -> str | ApiErrorResponse:
+    """The content type for a file of this kind, or an error if the file type is not allowed"""
+    spec = SPECS[kind]
+    content_type = spec.content_types.get(os.path.splitext(filename)[1][1:].lower())
+
+    if content_type is None:
+        return upload_error("filename", f"File type must be one of {', '.join(sorted(spec.content_types))}")
+
+    return content_type
+
+
+def presign_upload(new: NewUpload, user_id: int) -> UploadTicket | ApiErrorResponse:
+    """Sign a POST policy for uploading one new file of the given kind"""
+    spec = SPECS.get(new["kind"])
+    if spec is None:
+        return upload_error("kind", "kind must be song or image")
+
+    content_type = check_filename(new["kind"], new["filename"])
+    if isinstance(content_type, tuple):
+        return content_type
+
+    limit = max_bytes(new["kind"])
+    if not 0 < new["size"] <= limit:
+        return upload_error("size", f"File must be between 1 byte and {limit} bytes", 413)
+
+    sha256 = new.get("sha256")
+    if sha256 is not None and not SHA256_HEX.match(sha256):
+        return upload_error("sha256", "sha256 must be a lowercase hex digest")
+
+    if sha256 is not None and (existing := find(spec.bucket, sha256)) is not None:
+        # already stored, the token can be used as is, with the type of the stored file, which claim_upload checks
+        return {
+            "upload_token": issue_token(
+                user_id, new["kind"], existing.key, existing.content_type or content_type, sha256=sha256
+            ),
+            "file_url": spec.location + existing.key,
+            "expires_in": cast(int, current_app.config["UPLOAD_URL_EXPIRES"]),
+        }
+
+    key = get_unique_filename(new["filename"]) if sha256 is None else content_key(sha256, new["filename"])
+    expires_in = cast(int, current_app.config["UPLOAD_URL_EXPIRES"])
+
+    fields = {"acl": "public-read", "Content-Type": content_type}
+    if sha256 is not None:
+        # S3 rejects a file with other content, so a file stored under a content key always has that content
+        fields["x-amz-checksum-sha256"] = checksum_header(sha256)
+
+    post = s3_client.generate_presigned_post(
+        Bucket=spec.bucket,
+        Key=key,
+        Fields=fields,
+        # S3 rejects anything but this one object, with this type and at most the size limit
+        Conditions=[*({k: v} for k, v in fields.items()), ["content-length-range", 1, limit]],
+        ExpiresIn=expires_in,
+    )
+
+    return {
+        "upload_token": issue_token(user_id, new["kind"], key, content_type, checksum=sha256),
+        "file_url": spec.location + key,
+        "upload": {"url": post["url"], "fields": post["fields"]},
+        "expires_in": expires_in,
+    }
+
+
+def receive_upload(kind: UploadKind, filename: str, user_id: int) -> StoredUpload | ApiErrorResponse:
+    """Stream the request body to S3 as a new file of this kind, see .ingest"""
+    content_type = check_filename(kind, filename)
+    if isinstance(content_type, tuple):
+        return content_type
+
+    limit = max_bytes(kind)
+    if (request.content_length or 0) > limit:
+        return upload_error("size", f"File must be between 1 byte and {limit} bytes", 413)
+
+    spec = SPECS[kind]
+    key = get_unique_filename(filename)
+
+    try:
+        ingested = ingest(
+            request.stream,
+            spec.bucket,
+            key,
+            content_type,
+            limit,
+            part_size=cast(int, current_app.config["UPLOAD_PART_SIZE"]),
+            concurrency=cast(int, current_app.config["UPLOAD_CONCURRENCY"]),
+        )
+    except TooLarge:
+        return upload_error("size", f"File must be between 1 byte and {limit} bytes", 413)
+    except EmptyFile:
+        return upload_error("size", "File is empty")
+    except ClientDisconnected:
+        return upload_error("body", "Upload was interrupted")
+
+    key = deduplicate(spec.bucket, key, ingested.sha256)
+    db.session.commit()
+
+    return {
+        "upload_token": issue_token(user_id, kind, key, content_type, sha256=ingested.sha256),
+        "file_url": spec.location + key,
+        "size": ingested.size,
+        "sha256": ingested.sha256,
+    }
+
+
+def store_file(kind: UploadKind, filename: str, content: IO[bytes]) -> str | ApiErrorResponse:
+    """
+    Store a file received in a form as a reference from the record being saved, uploading it unless a file with
+    the same content is already stored. Returns its url.
+    """
+    content_type = check_filename(kind, filename)
+    if isinstance(content_type, tuple):
+        return content_type
+
+    spec = SPECS[kind]
+    sha256, size = hash_file(content)
+
+    existing = find(spec.bucket, sha256)
+    key = content_key(sha256, filename) if existing is None else existing.key
+
+    if existing is None:
+        try:
+            s3_client.upload_fileobj(
+                content, spec.bucket, key, ExtraArgs={"ACL": "public-read", "ContentType": content_type}
+            )
+        except Exception as e:
+            return ApiError(message="Upload failed", errors={"file": str(e)}), 500
+
+    retain(spec.bucket, key, sha256, size, content_type)
+
+    return spec.location + key
+
+
+def claim_upload(token: str, kind: UploadKind, user_id: int, field: str) -> str | ApiErrorResponse:
+    """
+    Check that an upload token was issued to user_id for a file of this kind and that the file was uploaded,
+    returning the file's url, which is counted as a reference from the record being saved (see .storage).
+    The token is used up once the record is committed. field names the form field the token came from, for errors.
+    """
+    max_age = cast(int, current_app.config["UPLOAD_TOKEN_MAX_AGE"])
+
+    try:
+        claims = cast(dict[str, str | int], serializer().loads(token, max_age=max_age))
+    except BadSignature:
+        return upload_error(field, "Upload token is invalid or has expired")
+
+    if claims["user"] != user_id or claims["kind"] != kind:
+        return upload_error(field, f"Upload token was not issued to you for a {kind}")
+
+    spec = SPECS[kind]
+    key = cast(str, claims["key"])
+
+    try:
+        head = s3_client.head_object(Bucket=spec.bucket, Key=key, ChecksumMode="ENABLED")
+    except ClientError:
+        return upload_error(field, "File has not been uploaded yet")
+
+    # the policy enforces both, but a misconfigured stand in might not
+    if head["ContentType"] != claims["type"] or not 0 < head["ContentLength"] <= max_bytes(kind):
+        return upload_error(field, "Uploaded file does not match its upload")
+
+    sha256 = cast(str | None, claims.get("sha256"))
+    checksum = cast(str | None, claims.get("checksum"))
+
+    if checksum is not None:
+        # only returned by servers that check checksums
+        stored_checksum = cast(str | None, head.get("ChecksumSHA256"))
+
+        if stored_checksum is not None and stored_checksum != checksum_header(checksum):
+            return upload_error(field, "Uploaded file does not match its upload")
+
+        # only trusted once S3 confirms it
+        if stored_checksum is not None:
+            sha256 = checksum
+
+    # concurrent claims of one token conflict on its row, the first to commit wins
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                ClaimedUpload(
+                    token_hash=hashlib.sha256(token.encode()).hexdigest(), expires_at=now() + timedelta(seconds=max_age)
+                )
+            )
+    except IntegrityError:
+        return upload_error(field, "Upload token has already been used")
+
+    retain(spec.bucket, key, sha256, head["ContentLength"], head["ContentType"])
+
+    return spec.location + key
+
+
+def forget_expired_claims() -> int:
+    """Drop the claims of tokens that have expired, returns how many there were"""
+    result = db.session.execute(delete(ClaimedUpload).where(ClaimedUpload.expires_at <= now()))
+    db.session.commit()
+
+    return result.rowcount
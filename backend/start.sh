@@ -0,0 +1,21 @@
+#!/bin/bash
+# Container entrypoint: migrates and seeds the database, then runs gunicorn and the job worker side by side
+# If either process exits the other is stopped too, so the container exits and its restart policy brings both back
+set -e
+
+uv run flask db upgrade
+uv run flask seed all
+
+uv run flask worker &
+uv run gunicorn -b "0.0.0.0:$FLASK_RUN_PORT" src:app &
+
+# Pass `docker stop` on to both, the worker finishes its running jobs before exiting
+trap 'kill -TERM $(jobs -p) 2>/dev/null' TERM INT
+
+set +e
+wait -n
+status=$?
+
+kill -TERM $(jobs -p) 2>/dev/null
+wait
+exit $status
@@ -0,0 +1,48 @@
+// Writes .br and .gz siblings of every compressible file in dist,
+// run after vite build. The backend serves these to clients that accept them
+// instead of compressing on every request.
+import { readFile, readdir, writeFile } from "node:fs/promises";
+import { join } from "node:path";
+import { promisify } from "node:util";
+import { brotliCompress, constants, gzip } from "node:zlib";
+
+const DIST = new URL("./dist/", import.meta.url).pathname;
+const COMPRESSIBLE = /\.(html|js|mjs|css|json|svg|txt|xml|map|wasm)$/;
+// matches COMPRESS_MIN_SIZE on the backend
+const MIN_SIZE = 1024;
+
+const encoders = {
+	br: (data) =>
+		promisify(brotliCompress)(data, {
+			params: {
+				[constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+				[constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+			},
+		}),
+	gz: (data) => promisify(gzip)(data, { level: constants.Z_BEST_COMPRESSION }),
+};
+
+let written = 0;
+
+const entries = await readdir(DIST, { recursive: true, withFileTypes: true });
+
+for (const entry of entries) {
+	const file = join(entry.parentPath ?? entry.path, entry.name);
+
+	if (!entry.isFile() || !COMPRESSIBLE.test(file)) continue;
+
+	const data = await readFile(file);
+	if (data.length < MIN_SIZE) continue;
+
+	for (const [ext, encode] of Object.entries(encoders)) {
+		const compressed = await encode(data);
+
+		// the server falls back to the original when a sibling is missing
+		if (compressed.length < data.length) {
+			await writeFile(`${file}.${ext}`, compressed);
+			written++;
+		}
+	}
+}
+
+console.log(`precompressed ${written} files in ${DIST}`);
@@ -19,6 +19,9 @@ const ArtistPage: React.FC = () => {
 	const { userId } = useParams<{ userId: string }>();
 	const dispatch = useAppDispatch();
 	const [loaded, setLoaded] = useState(false);
+	// cursor of the next page of songs, undefined once every page is loaded
+	const [cursor, setCursor] = useState<string>();
+	const [loadingMore, setLoadingMore] = useState(false);
 	const [showToast, setShowToast] = useState(false);
 	const [toastMessage, setToastMessage] = useState("");
 
@@ -40,7 +43,11 @@ const ArtistPage: React.FC = () => {
 		setLoaded(true);
 		(async () => {
 			try {
-				await dispatch(fetchArtistSongs(Number(userId)));
+				setCursor(
+					await dispatch(
+						fetchArtistSongs({ artistId: Number(userId) }),
+					).unwrap(),
+				);
 			} catch (error) {
 				console.error("Error loading artist:", error);
 				showToastMessage("Failed to load artist data");
@@ -57,6 +64,24 @@ const ArtistPage: React.FC = () => {
 
 	const songIds = songs.map((s) => s.id);
 
+	const handleLoadMore = async () => {
+		if (!cursor || loadingMore) return;
+
+		setLoadingMore(true);
+		try {
+			setCursor(
+				await dispatch(
+					fetchArtistSongs({ artistId: Number(userId), cursor }),
+				).unwrap(),
+			);
+		} catch (error) {
+			console.error("Error loading songs:", error);
+			showToastMessage("Failed to load more songs");
+		} finally {
+			setLoadingMore(false);
+		}
+	};
+
 	const handlePlayAll = () => {
 		dispatch(setCurrentSong(null));
 		dispatch(setCurrentSong(songIds[0] ?? null));
@@ -130,6 +155,16 @@ const ArtistPage: React.FC = () => {
 								/>
 							))}
 						</div>
+						{cursor && (
+							<button
+								type="button"
+								className={`${styles.playAllButton} ${styles.loadMoreButton}`}
+								onClick={handleLoadMore}
+								disabled={loadingMore}
+							>
+								{loadingMore ? "Loading..." : "Load more"}
+							</button>
+						)}
 					</div>
 				</div>
 			</div>
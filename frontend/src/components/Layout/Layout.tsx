@@ -118,7 +118,11 @@ const Header: React.FC = () => {
 export const Sidebar: React.FC = () => {
 	const { user } = useAppSelector((state) => state.session);
 	const userPlaylists = useAppSelector(selectUserPlaylists);
+	// only the liked songs loaded so far, the count is of every liked song
 	const likedSongs = useAppSelector(selectLikedSongs);
+	const likeCount = useAppSelector(
+		(state) => Object.keys(state.session.likes).length,
+	);
 	const MAX_ITEMS = 6;
 
 	const handleLoginClick = () => {
@@ -173,7 +177,7 @@ export const Sidebar: React.FC = () => {
 
 			<div className="sidebar-section">
 				<h2 className="sidebar-heading">
-					Liked Songs ({user ? likedSongs.length : 0})
+					Liked Songs ({user ? likeCount : 0})
 				</h2>
 				{user ? (
 					likedSongs.length > 0 ? (
@@ -198,9 +202,9 @@ export const Sidebar: React.FC = () => {
 									</div>
 								</Link>
 							))}
-							{likedSongs.length > MAX_ITEMS && (
+							{likeCount > MAX_ITEMS && (
 								<Link to="/user/likes" className="view-all-link">
-									View All Liked Songs ({likedSongs.length})
+									View All Liked Songs ({likeCount})
 								</Link>
 							)}
 						</div>
@@ -366,7 +366,11 @@ const NowPlaying: React.FC<NowPlayingProps> = ({
 											}}
 										/>
 									</div>
-									<span className="time">{formatTime(duration)}</span>
+									<span className="time">
+										{formatTime(
+											duration || (currentSongData?.duration_ms ?? 0) / 1000,
+										)}
+									</span>
 								</div>
 							</div>
 
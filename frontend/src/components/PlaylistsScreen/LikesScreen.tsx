@@ -1,30 +1,47 @@
 import { useState } from "react";
 import { useAppDispatch, useAppSelector } from "../../store";
-import { getLikes } from "../../store/slices/songsSlice";
-import { createSelector } from "@reduxjs/toolkit";
-import type { RootState } from "../../store";
+import { fetchLikedSongs } from "../../store/slices/songsSlice";
+import type { SongId } from "../../store/slices/types";
 import { SongListItem } from "../SongListItem";
 
 const MY_LIKES_IMAGE =
 	"https://soundclone-image-files.s3.us-east-1.amazonaws.com/my_likes_long.png";
 
-const selectLikes = createSelector(
-	(state: RootState) => state.session.likes,
-	(likes) => Object.keys(likes).map(Number),
-);
-
 function LikesScreen() {
 	const dispatch = useAppDispatch();
 	const [loaded, setLoaded] = useState<boolean>(false);
+	// liked songs in the order their pages arrived, most recently liked first
+	const [pages, setPages] = useState<SongId[]>([]);
+	// cursor of the next page, undefined once every page is loaded
+	const [cursor, setCursor] = useState<string>();
+	const [loadingMore, setLoadingMore] = useState(false);
+
+	const likes = useAppSelector((state) => state.session.likes);
 
-	const likes = useAppSelector(selectLikes);
+	const loadPage = (after?: string) => {
+		setLoadingMore(true);
+
+		dispatch(fetchLikedSongs(after))
+			.unwrap()
+			.then(({ ids, next_cursor }) => {
+				setPages((prev) => [
+					...prev,
+					...ids.filter((id) => !prev.includes(id)),
+				]);
+				setCursor(next_cursor);
+			})
+			.finally(() => setLoadingMore(false));
+	};
 
 	if (!loaded) {
 		setLoaded(true);
 
-		dispatch(getLikes());
+		loadPage();
 	}
 
+	// songs unliked since their page was loaded drop out
+	const shown = pages.filter((id) => id in likes);
+
 	return (
 		<>
 			<div className="user-view-image-container">
@@ -34,9 +51,19 @@ function LikesScreen() {
 					alt="my-likes-image"
 				/>
 			</div>
-			{likes.map((s, i) => (
+			{shown.map((s, i) => (
 				<SongListItem key={s} index={i} songId={s} />
 			))}
+			{cursor && (
+				<button
+					type="button"
+					className="header-button button-primary"
+					onClick={() => loadPage(cursor)}
+					disabled={loadingMore}
+				>
+					{loadingMore ? "Loading..." : "Load more"}
+				</button>
+			)}
 		</>
 	);
 }
@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useAppDispatch, useAppSelector } from "../store";
 import { likeSong, unlikeSong } from "../store/slices/songsSlice";
 import type { SongId } from "../store/slices/types";
@@ -7,6 +7,29 @@ import { setCurrentSong, togglePlayPause } from "../store/playerSlice";
 import { AddToPlaylist } from "./AddToPlaylist";
 import { Link } from "react-router-dom";
 
+// how long the pointer rests on a song before its preview starts
+const PREVIEW_DELAY_MS = 400;
+
+// one preview plays at a time, shared by every list item
+let previewAudio: HTMLAudioElement | undefined;
+let previewing: string | null = null;
+
+function startPreview(url: string) {
+	previewAudio ??= new Audio();
+	previewAudio.src = url;
+	previewing = url;
+	previewAudio.play().catch(() => {
+		// browsers refuse to play before the user has interacted with the page
+	});
+}
+
+function stopPreview(url: string) {
+	if (previewing === url) {
+		previewAudio?.pause();
+		previewing = null;
+	}
+}
+
 type SongListItemProps = {
 	songId: SongId;
 	index: number;
@@ -32,7 +55,35 @@ export const SongListItem: React.FC<SongListItemProps> = ({
 	const currentSong = useAppSelector((state) => state.player.currentSong);
 	const isCurrentSong = currentSong === songId;
 
+	const previewUrl = song?.preview_url;
+	const previewTimer = useRef<number | undefined>(undefined);
+
+	const handlePreviewStart = () => {
+		// not while the player is playing, the two would play over each other
+		if (!previewUrl || isPlaying) return;
+
+		previewTimer.current = window.setTimeout(
+			() => startPreview(previewUrl),
+			PREVIEW_DELAY_MS,
+		);
+	};
+
+	const handlePreviewEnd = () => {
+		window.clearTimeout(previewTimer.current);
+		if (previewUrl) stopPreview(previewUrl);
+	};
+
+	useEffect(
+		() => () => {
+			window.clearTimeout(previewTimer.current);
+			if (previewUrl) stopPreview(previewUrl);
+		},
+		[previewUrl],
+	);
+
 	const handlePlayPause = () => {
+		handlePreviewEnd();
+
 		if (isCurrentSong) {
 			dispatch(togglePlayPause());
 		} else {
@@ -76,7 +127,11 @@ export const SongListItem: React.FC<SongListItemProps> = ({
 	return (
 		<div className={styles.songRow}>
 			<div className={styles.songNumber}>{index + 1}</div>
-			<div className={styles.songTitleCell}>
+			<div
+				className={styles.songTitleCell}
+				onMouseEnter={handlePreviewStart}
+				onMouseLeave={handlePreviewEnd}
+			>
 				<div className={styles.songThumbnail}>
 					{song.thumb_url && <img src={song.thumb_url} alt={song.name} />}
 				</div>
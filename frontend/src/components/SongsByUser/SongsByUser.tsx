@@ -59,6 +59,8 @@ const SongsByUser: React.FC = () => {
 	const dispatch = useAppDispatch();
 	const navigate = useNavigate();
 	const [loading, setLoading] = useState<LoadingState>("no");
+	// cursor of the next page of songs, undefined once every page is loaded
+	const [cursor, setCursor] = useState<string>();
 	const songs = useAppSelector((state) =>
 		sessionUser ? selectSongsByArtist(state, sessionUser.id) : null,
 	);
@@ -74,13 +76,26 @@ const SongsByUser: React.FC = () => {
 
 	if (loading === "no") {
 		setLoading("loading");
-		dispatch(fetchArtistSongs(sessionUser.id)).then(() =>
-			setLoading("response"),
-		);
+		dispatch(fetchArtistSongs({ artistId: sessionUser.id })).then((action) => {
+			setCursor(action.payload as string | undefined);
+			setLoading("response");
+		});
 	} else if (loading === "response") {
 		setLoading("finished");
 	}
 
+	const handleLoadMore = () => {
+		if (!cursor || loading === "loading") return;
+
+		setLoading("loading");
+		dispatch(fetchArtistSongs({ artistId: sessionUser.id, cursor })).then(
+			(action) => {
+				setCursor(action.payload as string | undefined);
+				setLoading("response");
+			},
+		);
+	};
+
 	return (
 		<section className="uploads-section flex-col">
 			<div className="user-view-image-container">
@@ -104,6 +119,16 @@ const SongsByUser: React.FC = () => {
 				) : (
 					songs.map((song) => <UploadedSong key={song.id} songId={song.id} />)
 				)}
+				{cursor && (
+					<button
+						type="button"
+						className="load-more-button header-button button-primary"
+						onClick={handleLoadMore}
+						disabled={loading === "loading"}
+					>
+						{loading === "loading" ? "Loading..." : "Load more"}
+					</button>
+				)}
 			</div>
 		</section>
 	);
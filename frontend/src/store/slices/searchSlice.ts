@@ -18,7 +18,7 @@ const initialState: SearchState = {
 export const searchContent = createAsyncThunk(
 	"search/searchContent",
 	async (query: string) => {
-		if (!query || query.length < 2) return { results: [] };
+		if (!query || query.length < 2) return { results: [], pages: {} };
 		return await api.search.query(query);
 	},
 );
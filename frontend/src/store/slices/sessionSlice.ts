@@ -18,17 +18,19 @@ function authUserToStore(u: ApiUser): User {
 
 export const thunkAuthenticate = () => async (dispatch: AppDispatch) => {
 	try {
-		const [user, likes] = await Promise.all([
+		// every liked id, but only the first page of liked songs
+		const [user, likes, page] = await Promise.all([
 			api.auth.restore(),
-			api.likes.getAll(),
+			api.likes.ids(),
+			api.likes.getPage(),
 		]);
 
 		dispatch(slice.actions.setUser(user));
 		dispatch(usersSlice.actions.addUser(authUserToStore(user)));
-		dispatch(slice.actions.addBulkLikes(likes.songs.map((s) => s.id)));
-		dispatch(songsSlice.actions.addSongs(likes.songs.map(apiSongToStore)));
+		dispatch(slice.actions.addBulkLikes(likes.song_ids));
+		dispatch(songsSlice.actions.addSongs(page.songs.map(apiSongToStore)));
 		dispatch(
-			usersSlice.actions.partialAddUsers(likes.songs.map((s) => s.artist)),
+			usersSlice.actions.partialAddUsers(page.songs.map((s) => s.artist)),
 		);
 	} catch (e) {
 		dispatch(slice.actions.removeUser());
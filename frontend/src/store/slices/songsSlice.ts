@@ -6,7 +6,7 @@ import {
 import type { PayloadAction } from "@reduxjs/toolkit";
 import type { AppDispatch, RootState } from "..";
 import { api } from "../api";
-import type { ApiError, GetSong } from "../api";
+import type { ApiError, GetSong, Rendition } from "../api";
 import { apiCommentToStore, commentsSlice } from "./commentsSlice";
 import { slice as sessionSlice } from "./sessionSlice";
 import type { Song, SongId, SongSlice, UserId } from "./types";
@@ -16,28 +16,57 @@ const initialState: SongSlice = {
 	songs: {},
 };
 
+// streams the smallest rendition this browser can play, or the original until the song has been transcoded
+function streamUrl(id: number, renditions: Rendition[]): string {
+	const audio = new Audio();
+	const playable = renditions.find(
+		(r) => audio.canPlayType(r.content_type) !== "",
+	);
+
+	return playable
+		? `/api/songs/${id}/stream?rendition=${encodeURIComponent(playable.name)}`
+		: `/api/songs/${id}/stream`;
+}
+
 export function apiSongToStore(s: GetSong): Song {
-	const { num_likes, song_ref, artist_id, artist, ...rest } = s;
+	const { num_likes, song_ref, artist_id, artist, renditions, ...rest } = s;
 
 	return {
 		...rest,
 		id: s.id as SongId,
 		artist_id: artist_id as UserId,
 		likes: num_likes,
-		song_url: song_ref,
+		song_url: streamUrl(s.id, renditions),
 	};
 }
 
+// fetches one page of liked songs, returns their ids (most recently liked first) and the cursor of the next page
+export const fetchLikedSongs = createAsyncThunk(
+	"songs/fetchLikedSongs",
+	async (
+		cursor: string | undefined,
+		{ dispatch },
+	): Promise<{ ids: SongId[]; next_cursor?: string }> => {
+		const { songs, next_cursor } = await api.likes.getPage(cursor);
+
+		dispatch(songsSlice.actions.addSongs(songs.map(apiSongToStore)));
+		dispatch(sessionSlice.actions.addBulkLikes(songs.map((s) => s.id)));
+		dispatch(usersSlice.actions.partialAddUsers(songs.map((s) => s.artist)));
+
+		return { ids: songs.map((s) => s.id as SongId), next_cursor };
+	},
+);
+
+// marks every liked song as liked, and fetches the first page of them
 export const getLikes = createAsyncThunk(
 	"songs/getLikes",
 	async (_: undefined, { dispatch }) => {
-		const likes = await api.likes.getAll();
+		const [{ song_ids }] = await Promise.all([
+			api.likes.ids(),
+			dispatch(fetchLikedSongs(undefined)),
+		]);
 
-		dispatch(songsSlice.actions.addSongs(likes.songs.map(apiSongToStore)));
-		dispatch(sessionSlice.actions.addBulkLikes(likes.songs.map((s) => s.id)));
-		dispatch(
-			usersSlice.actions.partialAddUsers(likes.songs.map((s) => s.artist)),
-		);
+		dispatch(sessionSlice.actions.addBulkLikes(song_ids));
 	},
 );
 
@@ -144,10 +173,24 @@ export const deleteSongThunk = createAsyncThunk(
 	},
 );
 
+// fetches one page of an artist's songs (and the artist along with the first), returns the cursor of the next page
 export const fetchArtistSongs = createAsyncThunk(
 	"songs/fetchArtistSongs",
-	async (artistId: UserId, { dispatch }) => {
-		const [{ songs }, artist] = await Promise.all([
+	async (
+		{ artistId, cursor }: { artistId: UserId; cursor?: string },
+		{ dispatch },
+	): Promise<string | undefined> => {
+		if (cursor) {
+			const { songs, next_cursor } = await api.songs.getByArtist(
+				artistId,
+				cursor,
+			);
+			dispatch(songsSlice.actions.addSongs(songs.map(apiSongToStore)));
+
+			return next_cursor;
+		}
+
+		const [{ songs, next_cursor }, artist] = await Promise.all([
 			api.songs.getByArtist(artistId),
 			api.artists.getOne(artistId),
 		]);
@@ -165,6 +208,8 @@ export const fetchArtistSongs = createAsyncThunk(
 		);
 
 		dispatch(songsSlice.actions.addSongs(songs.map(apiSongToStore)));
+
+		return next_cursor;
 	},
 );
 
@@ -52,6 +52,10 @@ export interface Song extends WeakTimestamps {
 	genre?: string;
 	thumb_url?: Url;
 	song_url: Url;
+	// known before the audio loads, null until the server has read it
+	duration_ms: number | null;
+	// a short clip of the loudest part, null until the server has cut it
+	preview_url: Url | null;
 }
 
 export interface Playlist extends WeakTimestamps {